@@ -0,0 +1,113 @@
+"""
+bench_ann.py - 近似最近傍（IVF）の再現率とレイテンシ
+
+合成埋め込み（クラスタ構造あり、既定 100,000 チャンク × 384 次元）で
+flat 全探索の上位K件を正解として、nprobe ごとの recall@K とレイテンシを測る。
+どちらも vector_search._search_vector（クエリ埋め込みを除いた検索本体）で計測する。
+
+使い方:
+  uv run scripts/bench_ann.py
+  uv run scripts/bench_ann.py --chunks 300000 --nprobe 1 4 16 64
+  uv run scripts/bench_ann.py --filter JERG-1       # doc_filter 付き検索
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+import src.chunk_store as cs
+import src.vector_search as vs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='IVF 近似最近傍 再現率/レイテンシ ベンチマーク')
+    parser.add_argument('--chunks', type=int, default=100000, help='合成チャンク数')
+    parser.add_argument('--dim', type=int, default=384, help='埋め込み次元')
+    parser.add_argument('--clusters', type=int, default=200, help='合成データのクラスタ数')
+    parser.add_argument('--queries', type=int, default=100, help='クエリ数')
+    parser.add_argument('--top-k', type=int, default=10, help='取得件数（recall@K の K）')
+    parser.add_argument('--n-lists', type=int, default=None, help='IVF のリスト数（既定 4*sqrt(N)）')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64],
+                        help='計測する nprobe')
+    parser.add_argument('--filter', type=str, default=None, help='doc_filter（部分一致）')
+    parser.add_argument('--float16', action='store_true', help='float16 で保存した埋め込みで計測')
+    return parser.parse_args()
+
+
+def make_data(directory: Path, n: int, dim: int, n_clusters: int, n_queries: int, dtype: str) -> np.ndarray:
+    """クラスタ構造を持つ合成埋め込みと chunks.json を作り、クエリ行列を返す"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    raw = centers[labels] + rng.standard_normal((n, dim)).astype(np.float32) * 1.5
+
+    # 100 チャンク/文書、文書ごとに連続（indexer の出力と同じ並び）
+    chunk_ids = [f"JERG-{i // 100 % 3}-{i // 100:04d}_{i % 100}" for i in range(n)]
+    chunks = [
+        {"doc_id": cid.rsplit("_", 1)[0], "filename": "synthetic.pdf", "chunk_id": cid, "text": f"chunk {i}"}
+        for i, cid in enumerate(chunk_ids)
+    ]
+    with open(directory / "chunks.json", "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+
+    cs.STORE_DIR = directory / "chunk_store"
+    cs.CHUNKS_CANDIDATES = [directory / "chunks.json"]
+    vs.INDEX_DIR = directory
+    vs.EMBEDDINGS_DIR = directory / "embeddings"
+    vs._save_embeddings(raw, chunk_ids, dtype=dtype)
+
+    picks = rng.integers(0, n, size=n_queries)
+    return raw[picks] + rng.standard_normal((n_queries, dim)).astype(np.float32) * 1.5
+
+
+def run(queries: np.ndarray, **kwargs) -> tuple[list[list[str]], list[float]]:
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = vs._search_vector(q, score_threshold=-1.0, **kwargs)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.append([h["chunk_id"] for h in hits])
+    return results, latencies
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"合成データを作成中: {args.chunks} チャンク × {args.dim} 次元...")
+        queries = make_data(Path(tmp), args.chunks, args.dim, args.clusters, args.queries,
+                            "float16" if args.float16 else "float32")
+        vs._load_embeddings()
+
+        t0 = time.perf_counter()
+        vs.build_ann_index(n_lists=args.n_lists)
+        print(f"IVF 構築: {time.perf_counter() - t0:.1f} s\n")
+
+        common = {"top_k": args.top_k, "doc_filter": args.filter}
+        exact, flat_lat = run(queries, index="flat", **common)
+
+        print(f"{'index':>10} | {'recall@' + str(args.top_k):>9} | {'p50':>9} | {'p95':>9} | {'speedup':>7}")
+        print('-' * 56)
+        flat_p50 = float(np.percentile(flat_lat, 50))
+        print(f"{'flat':>10} | {1.0:>9.3f} | {flat_p50:>6.2f} ms | "
+              f"{float(np.percentile(flat_lat, 95)):>6.2f} ms | {1.0:>6.1f}x")
+
+        for nprobe in args.nprobe:
+            approx, lat = run(queries, index="ivf", nprobe=nprobe, **common)
+            hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+            recall = hits / max(sum(len(e) for e in exact), 1)
+            p50 = float(np.percentile(lat, 50))
+            print(f"{'ivf/' + str(nprobe):>10} | {recall:>9.3f} | {p50:>6.2f} ms | "
+                  f"{float(np.percentile(lat, 95)):>6.2f} ms | {flat_p50 / p50:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
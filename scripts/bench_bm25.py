@@ -0,0 +1,122 @@
+"""
+bench_bm25.py - BM25 エンジンのベンチマーク（rank_bm25 vs 転置インデックス）
+
+合成コーパス（Zipf 分布の語彙）でコーパスサイズを変えながら、
+1クエリあたりの検索レイテンシを比較し、スコアの一致も検証する。
+
+使い方:
+  uv run scripts/bench_bm25.py                       # 既定サイズ (1k, 5k, 20k)
+  uv run scripts/bench_bm25.py --sizes 1000 50000    # サイズ指定
+  uv run scripts/bench_bm25.py --queries 50 --top-k 10
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.bm25_index import BM25Index
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='BM25 検索レイテンシ ベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000],
+                        help='コーパスサイズ（チャンク数）')
+    parser.add_argument('--doc-len', type=int, default=200, help='1チャンクあたりのトークン数')
+    parser.add_argument('--vocab', type=int, default=30000, help='語彙サイズ')
+    parser.add_argument('--queries', type=int, default=30, help='クエリ数')
+    parser.add_argument('--query-len', type=int, default=5, help='1クエリあたりのトークン数')
+    parser.add_argument('--top-k', type=int, default=10, help='取得件数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    return parser.parse_args()
+
+
+def make_corpus(rng, n_docs: int, doc_len: int, vocab: int) -> list[list[str]]:
+    """Zipf 分布の合成コーパスを生成"""
+    ranks = np.arange(1, vocab + 1)
+    probs = 1.0 / ranks
+    probs /= probs.sum()
+    words = rng.choice(vocab, size=(n_docs, doc_len), p=probs)
+    return [[f"w{w}" for w in row] for row in words]
+
+
+def make_queries(rng, n: int, query_len: int, vocab: int) -> list[list[str]]:
+    """中頻度〜低頻度語を中心としたクエリを生成"""
+    words = rng.integers(10, min(vocab, 5000), size=(n, query_len))
+    return [[f"w{w}" for w in row] for row in words]
+
+
+def rank_bm25_top_k(bm25, tokens: list[str], k: int) -> tuple[list[int], list[float]]:
+    """旧実装（searcher.py の rank_bm25 + 全件ソート）を再現"""
+    scores = bm25.get_scores(tokens)
+    scored = list(enumerate(scores))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    top = [(i, s) for i, s in scored[:k] if s > 0]
+    return [i for i, _ in top], [float(s) for _, s in top]
+
+
+def bench(fn, queries) -> list[float]:
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    try:
+        from rank_bm25 import BM25Okapi
+    except ImportError:
+        BM25Okapi = None
+        print('rank_bm25 未インストール: 新エンジンのみ計測します')
+
+    print(f"{'chunks':>8} | {'rank_bm25 p50':>13} | {'index p50':>9} | {'index p95':>9} | "
+          f"{'speedup':>7} | {'max |Δscore|':>12} | top-k一致")
+    print('-' * 86)
+
+    for n_docs in args.sizes:
+        corpus = make_corpus(rng, n_docs, args.doc_len, args.vocab)
+        queries = make_queries(rng, args.queries, args.query_len, args.vocab)
+
+        index = BM25Index.from_tokens(corpus)
+        new_lat = bench(lambda q: index.top_k(q, args.top_k), queries)
+
+        old_p50 = float('nan')
+        max_diff = 0.0
+        same_ids = '-'
+        if BM25Okapi is not None:
+            okapi = BM25Okapi(corpus)
+            old_lat = bench(lambda q: rank_bm25_top_k(okapi, q, args.top_k), queries)
+            old_p50 = float(np.percentile(old_lat, 50))
+
+            matched = 0
+            for q in queries:
+                ref_ids, ref_scores = rank_bm25_top_k(okapi, q, args.top_k)
+                ids, scores = index.top_k(q, args.top_k)
+                if list(ids) == ref_ids:
+                    matched += 1
+                full = okapi.get_scores(q)
+                max_diff = max(max_diff, float(np.max(np.abs(full - index.get_scores(q)))))
+                if len(scores):
+                    max_diff = max(max_diff, float(np.max(np.abs(np.asarray(ref_scores) - scores))))
+            same_ids = f"{matched}/{len(queries)}"
+
+        new_p50 = float(np.percentile(new_lat, 50))
+        new_p95 = float(np.percentile(new_lat, 95))
+        speedup = old_p50 / new_p50 if new_p50 > 0 else float('nan')
+        print(f"{n_docs:>8} | {old_p50:>10.2f} ms | {new_p50:>6.2f} ms | {new_p95:>6.2f} ms | "
+              f"{speedup:>6.1f}x | {max_diff:>12.2e} | {same_ids}")
+
+
+if __name__ == '__main__':
+    main()
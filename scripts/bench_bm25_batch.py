@@ -0,0 +1,88 @@
+"""
+bench_bm25_batch.py - クエリ変種の一括 BM25 検索ベンチマーク
+
+hybrid_search は元のクエリ・同義語展開・LLM拡張の変種ごとに BM25 を引く。
+変種数を変えながら、変種ごとに top_k() を呼ぶ場合（旧 hybrid_search）と
+search_many() で一括検索する場合のレイテンシを比較し、結果の一致も検証する。
+
+変種は元のクエリの1語を別の語に置き換えたもの（同義語展開と同じく語の大半が重なる）。
+
+使い方:
+  uv run scripts/bench_bm25_batch.py
+  uv run scripts/bench_bm25_batch.py --chunks 50000 --variants 1 4 16 32
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.bm25_index import BM25Index
+from bench_bm25 import make_corpus, make_queries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='BM25 一括検索（クエリ変種）ベンチマーク')
+    parser.add_argument('--chunks', type=int, default=20000, help='コーパスサイズ（チャンク数）')
+    parser.add_argument('--doc-len', type=int, default=200, help='1チャンクあたりのトークン数')
+    parser.add_argument('--vocab', type=int, default=30000, help='語彙サイズ')
+    parser.add_argument('--queries', type=int, default=30, help='元クエリ数')
+    parser.add_argument('--query-len', type=int, default=5, help='1クエリあたりのトークン数')
+    parser.add_argument('--variants', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='1クエリあたりの変種数（元のクエリを含む）')
+    parser.add_argument('--top-k', type=int, default=10, help='取得件数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    return parser.parse_args()
+
+
+def make_variants(rng, query: list[str], n: int, vocab: int) -> list[list[str]]:
+    """元のクエリ + 1語置き換えの変種 n-1 個"""
+    variants = [query]
+    for _ in range(n - 1):
+        v = list(query)
+        v[int(rng.integers(len(v)))] = f"w{int(rng.integers(10, min(vocab, 5000)))}"
+        variants.append(v)
+    return variants
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"コーパスを作成中: {args.chunks} チャンク...")
+    index = BM25Index.from_tokens(make_corpus(rng, args.chunks, args.doc_len, args.vocab))
+    queries = make_queries(rng, args.queries, args.query_len, args.vocab)
+
+    print(f"\n{'variants':>8} | {'sequential p50':>14} | {'search_many p50':>15} | {'speedup':>7} | 一致")
+    print('-' * 64)
+    base_p50 = None
+    for n in args.variants:
+        seq_lat, batch_lat, matched = [], [], 0
+        for q in queries:
+            variants = make_variants(rng, q, n, args.vocab)
+
+            t0 = time.perf_counter()
+            seq = [index.top_k(v, args.top_k) for v in variants]
+            seq_lat.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            batch = index.search_many(variants, args.top_k)
+            batch_lat.append((time.perf_counter() - t0) * 1000)
+
+            matched += all(list(a[0]) == list(b[0]) for a, b in zip(seq, batch))
+
+        seq_p50 = float(np.percentile(seq_lat, 50))
+        batch_p50 = float(np.percentile(batch_lat, 50))
+        base_p50 = base_p50 or batch_p50
+        print(f"{n:>8} | {seq_p50:>11.2f} ms | {batch_p50:>9.2f} ms ({batch_p50 / base_p50:>4.1f}x) | "
+              f"{seq_p50 / batch_p50:>6.1f}x | {matched}/{len(queries)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+bench_bm25_load.py - BM25 インデックスのコールドスタート比較
+
+検索プロセス起動時のインデックスロードを、別プロセスで計測する。
+  legacy: chunks.json + tokens.json を json.load して BM25Okapi を再構築（旧 searcher）
+  mmap:   data/index/bm25/ と data/index/chunk_store/ を mmap で開く（新 searcher）
+
+どちらも「ロード → 1クエリ検索 → 上位チャンク本文の取得」までの時間と
+プロセスの最大 RSS を報告する。
+
+使い方:
+  uv run scripts/bench_bm25_load.py                  # 合成コーパス 20,000 チャンク
+  uv run scripts/bench_bm25_load.py --chunks 100000
+  uv run scripts/bench_bm25_load.py --index-dir data/index   # 実インデックスで計測
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.bm25_index import BM25Index
+from src.chunk_store import source_signature, write_store
+
+# 子プロセスで実行するコード（{index_dir} と {query} を埋め込む）
+_CHILD_PRELUDE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+"""
+
+_CHILD_LEGACY = """
+from pathlib import Path
+from rank_bm25 import BM25Okapi
+d = Path({index_dir!r})
+chunks = json.load(open(d / "chunks.json", encoding="utf-8"))
+tokens = json.load(open(d / "tokens.json", encoding="utf-8"))
+bm25 = BM25Okapi(tokens)
+t_load = time.perf_counter()
+scores = bm25.get_scores({query!r})
+top = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:5]
+texts = [chunks[i]["text"] for i in top]
+"""
+
+_CHILD_MMAP = """
+from pathlib import Path
+from src.bm25_index import BM25Index
+from src.chunk_store import ChunkStore
+d = Path({index_dir!r})
+store = ChunkStore(d / "chunk_store")
+bm25 = BM25Index.load(d / "bm25")
+t_load = time.perf_counter()
+ids, _ = bm25.top_k({query!r}, 5)
+texts = [store.text(int(i)) for i in ids]
+"""
+
+# ru_maxrss は Linux では exec 前の親プロセスの値を引き継ぐため、VmHWM を優先する
+_CHILD_REPORT = """
+t_end = time.perf_counter()
+try:
+    hwm = next(l for l in open("/proc/self/status") if l.startswith("VmHWM"))
+    rss_mb = int(hwm.split()[1]) / 1024
+except (OSError, StopIteration):
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{
+    "load_ms": (t_load - t0) * 1000,
+    "first_query_ms": (t_end - t_load) * 1000,
+    "max_rss_mb": rss_mb,
+}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='BM25 インデックス コールドスタート ベンチマーク')
+    parser.add_argument('--chunks', type=int, default=20000, help='合成コーパスのチャンク数')
+    parser.add_argument('--doc-len', type=int, default=200, help='1チャンクあたりのトークン数')
+    parser.add_argument('--vocab', type=int, default=50000, help='語彙サイズ')
+    parser.add_argument('--runs', type=int, default=3, help='各モードの試行回数（最良値を採用）')
+    parser.add_argument('--index-dir', type=str, default='',
+                        help='既存のインデックスディレクトリ（指定時は合成しない）')
+    return parser.parse_args()
+
+
+def make_index(directory: Path, n_chunks: int, doc_len: int, vocab: int) -> list[str]:
+    """合成コーパスで chunks.json / tokens.json / バイナリインデックスを作る"""
+    rng = np.random.default_rng(0)
+    probs = 1.0 / np.arange(1, vocab + 1)
+    probs /= probs.sum()
+    words = rng.choice(vocab, size=(n_chunks, doc_len), p=probs)
+    tokenized = [[f"語{w}" for w in row] for row in words]
+    chunks = [
+        {
+            "doc_id": f"JERG-{i % 3}-{i // 50:03d}",
+            "filename": f"JAXA-JERG-{i % 3}-{i // 50:03d}.pdf",
+            "chunk_id": f"JERG-{i % 3}-{i // 50:03d}_{i % 50}",
+            "text": "".join(tokens),
+        }
+        for i, tokens in enumerate(tokenized)
+    ]
+
+    chunks_path = directory / "chunks.json"
+    with open(chunks_path, "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False, indent=1)
+    with open(directory / "tokens.json", "w", encoding="utf-8") as f:
+        json.dump(tokenized, f, ensure_ascii=False)
+
+    write_store(chunks, directory / "chunk_store", source=chunks_path)
+    BM25Index.from_tokens(tokenized).save(
+        directory / "bm25", extra_meta={"source": source_signature(chunks_path)}
+    )
+    return tokenized[0][:5]
+
+
+def run_child(body: str, index_dir: Path, query: list[str]) -> dict:
+    code = (_CHILD_PRELUDE + body + _CHILD_REPORT).format(
+        root=str(ROOT), index_dir=str(index_dir), query=query,
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def best_of(runs: int, body: str, index_dir: Path, query: list[str]) -> dict:
+    results = [run_child(body, index_dir, query) for _ in range(runs)]
+    return min(results, key=lambda r: r["load_ms"])
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.index_dir:
+            index_dir = Path(args.index_dir)
+            with open(index_dir / "tokens.json", encoding="utf-8") as f:
+                query = next(t for t in json.load(f) if t)[:5]
+        else:
+            index_dir = Path(tmp)
+            print(f"合成インデックスを作成中: {args.chunks} チャンク...")
+            query = make_index(index_dir, args.chunks, args.doc_len, args.vocab)
+
+        print(f"{'mode':>7} | {'load':>10} | {'1st query':>10} | {'max RSS':>10}")
+        print('-' * 48)
+        for name, body in (("legacy", _CHILD_LEGACY), ("mmap", _CHILD_MMAP)):
+            try:
+                r = best_of(args.runs, body, index_dir, query)
+            except subprocess.CalledProcessError as e:
+                print(f"{name:>7} | 失敗: {e.stderr.strip().splitlines()[-1]}")
+                continue
+            print(f"{name:>7} | {r['load_ms']:>7.1f} ms | {r['first_query_ms']:>7.1f} ms | "
+                  f"{r['max_rss_mb']:>7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
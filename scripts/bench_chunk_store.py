@@ -0,0 +1,138 @@
+"""
+bench_chunk_store.py - チャンクデータの読み込み方式ごとのプロセス RSS 比較
+
+エージェントプロセスでは searcher / vector_search / chunk_summarizer / cross_reference が
+それぞれチャンクを読む。読み込み方式ごとに、4モジュール分のロードに相当する処理を
+別プロセスで行い、ロード時間と RSS を報告する。
+  legacy: chunks.json を4回 json.load（+ vector_search の chunk_id → チャンク辞書）（旧実装）
+  shared: 共有チャンクストアを1回開き、4モジュールが同じものを参照（新実装）
+
+どちらもロード後に上位20件の本文を取り出す。
+
+使い方:
+  uv run scripts/bench_chunk_store.py
+  uv run scripts/bench_chunk_store.py --chunks 200000 --text-len 800
+  uv run scripts/bench_chunk_store.py --index-dir data/index   # 実インデックスで計測
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.chunk_store import write_store
+
+_CHILD_PRELUDE = """
+import json, sys, time
+from pathlib import Path
+sys.path.insert(0, {root!r})
+d = Path({index_dir!r})
+t0 = time.perf_counter()
+"""
+
+_CHILD_LEGACY = """
+loaded = []
+for _ in range(4):
+    with open(d / "chunks.json", encoding="utf-8") as f:
+        loaded.append(json.load(f))
+chunk_by_id = {{c["chunk_id"]: c for c in loaded[1]}}
+doc_ids = [c["doc_id"] for c in loaded[0]]
+t_load = time.perf_counter()
+texts = [loaded[0][i]["text"] for i in range(0, len(loaded[0]), max(1, len(loaded[0]) // 20))]
+"""
+
+_CHILD_SHARED = """
+import src.chunk_store as cs
+cs.STORE_DIR = d / "chunk_store"
+cs.CHUNKS_CANDIDATES = [d / "chunks.json"]
+stores = [cs.get_store() for _ in range(4)]
+store = stores[0]
+store.index_of(store.chunk_id(0))   # vector_search の chunk_id 対応付け
+doc_ids = store.doc_ids             # DocRanges 用
+t_load = time.perf_counter()
+texts = [store.text(i) for i in range(0, len(store), max(1, len(store) // 20))]
+"""
+
+_CHILD_REPORT = """
+t_end = time.perf_counter()
+status = {{l.split(":")[0]: int(l.split()[1]) / 1024 for l in open("/proc/self/status")
+          if l.startswith(("VmRSS", "VmHWM"))}}
+print(json.dumps({{
+    "load_ms": (t_load - t0) * 1000,
+    "fetch_ms": (t_end - t_load) * 1000,
+    "rss_mb": status.get("VmRSS", 0.0),
+    "max_rss_mb": status.get("VmHWM", 0.0),
+}}))
+"""
+
+_PHRASES = [
+    "宇宙機の熱設計では放射と伝導の両方を考慮する必要がある。",
+    "バッテリの充放電サイクル試験は規定の手順に従って実施する。",
+    "構造解析の安全係数は終極荷重に対して1.25以上とする。",
+    "ソフトウェアの独立検証及び妥当性確認を計画段階から行う。",
+    "熱真空試験では最高・最低温度で各4サイクル以上の保持を行うこと。",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='チャンクストア RSS ベンチマーク')
+    parser.add_argument('--chunks', type=int, default=100000, help='合成チャンク数')
+    parser.add_argument('--text-len', type=int, default=500, help='1チャンクあたりの文字数（目安）')
+    parser.add_argument('--index-dir', type=str, default='',
+                        help='chunks.json のあるディレクトリ（指定時は実データを使う）')
+    return parser.parse_args()
+
+
+def make_chunks(n: int, text_len: int) -> list[dict]:
+    rng = np.random.default_rng(0)
+    n_sentences = max(1, text_len // 30)
+    chunks = []
+    for i in range(n):
+        doc_id = f"JERG-{i // 1000 % 3}-{i // 1000:03d}"
+        text = "".join(_PHRASES[j] for j in rng.integers(0, len(_PHRASES), size=n_sentences))
+        chunks.append({"doc_id": doc_id, "filename": f"JAXA-{doc_id}.pdf",
+                       "chunk_id": f"{doc_id}_{i % 1000}", "text": text})
+    return chunks
+
+
+def run_child(body: str, index_dir: Path) -> dict:
+    code = (_CHILD_PRELUDE + body + _CHILD_REPORT).format(root=str(ROOT), index_dir=str(index_dir))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = Path(tmp)
+        if args.index_dir:
+            with open(Path(args.index_dir) / "chunks.json", encoding="utf-8") as f:
+                chunks = json.load(f)
+        else:
+            print(f"合成コーパスを作成中: {args.chunks} チャンク...")
+            chunks = make_chunks(args.chunks, args.text_len)
+        with open(index_dir / "chunks.json", "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        write_store(chunks, index_dir / "chunk_store", source=index_dir / "chunks.json")
+        size_mb = (index_dir / "chunks.json").stat().st_size / 1024 / 1024
+        print(f"{len(chunks)} チャンク, chunks.json {size_mb:.1f} MB\n")
+        del chunks
+
+        print(f"{'mode':>8} | {'load':>9} | {'fetch':>8} | {'RSS':>9} | {'max RSS':>9}")
+        print('-' * 56)
+        for name, body in (("legacy", _CHILD_LEGACY), ("shared", _CHILD_SHARED)):
+            r = run_child(body, index_dir)
+            print(f"{name:>8} | {r['load_ms']:>6.0f} ms | {r['fetch_ms']:>5.2f} ms | "
+                  f"{r['rss_mb']:>6.1f} MB | {r['max_rss_mb']:>6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_colbert_rerank.py - Colbert風リランキングの候補数ごとの所要時間
+
+合成チャンクでチャンクストア（bigram シグネチャ付き）を作り、候補 N 件のスコア計算を比較する。
+  legacy: 候補ごとに先頭500文字の bigram 集合を作る旧実装
+  sets:   旧実装から500文字の切り詰めを外したもの（新実装と同じスコア）
+  store:  reranker.colbert_style_scores（構築時のシグネチャを配列演算で照合）
+
+使い方:
+  uv run scripts/bench_colbert_rerank.py
+  uv run scripts/bench_colbert_rerank.py --candidates 100 500 2000 --text-len 1500
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+import src.chunk_store as chunk_store
+from src.reranker import colbert_style_scores
+
+_PHRASES = [
+    "宇宙機の熱設計では放射と伝導の両方を考慮する必要がある。",
+    "バッテリの充放電サイクル試験は規定の手順に従って実施する。",
+    "構造解析の安全係数は終極荷重に対して1.25以上とする。",
+    "ソフトウェアの独立検証及び妥当性確認を計画段階から行う。",
+    "熱真空試験では最高・最低温度で各4サイクル以上の保持を行うこと。",
+    "EMC 試験の放射妨害波は規定の限界値以下であること。　",
+]
+
+_QUERIES = ["熱真空試験の温度サイクル", "バッテリ 充放電", "構造設計の安全係数と終極荷重", "EMC 放射妨害波"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Colbert風リランキングのベンチマーク')
+    parser.add_argument('--chunks', type=int, default=20000, help='合成チャンク数')
+    parser.add_argument('--text-len', type=int, default=800, help='1チャンクあたりの文字数（目安）')
+    parser.add_argument('--candidates', type=int, nargs='+', default=[20, 100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=20, help='計測回数')
+    return parser.parse_args()
+
+
+def make_chunks(n: int, text_len: int) -> list[dict]:
+    rng = random.Random(0)
+    n_sentences = max(1, text_len // 30)
+    return [{"doc_id": f"JERG-{i // 100}", "filename": f"JERG-{i // 100}.pdf", "chunk_id": f"c{i}",
+             "text": "".join(rng.choice(_PHRASES) for _ in range(n_sentences))} for i in range(n)]
+
+
+def bigrams(text: str) -> set:
+    text = text.lower()
+    return {text[i:i+2] for i in range(len(text)-1) if text[i:i+2].strip()}
+
+
+def set_scores(query: str, results: list[dict], limit: int | None) -> list[float]:
+    """旧 colbert_style_score を候補ごとに呼ぶ（limit は本文の切り詰め文字数）"""
+    query_bigrams = bigrams(query)
+    return [len(query_bigrams & bigrams(r["text"][:limit])) / len(query_bigrams) for r in results]
+
+
+def timed(fn, repeat: int) -> float:
+    """1回あたりの中央値（ms）"""
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    args = parse_args()
+    chunks = make_chunks(args.chunks, args.text_len)
+    with tempfile.TemporaryDirectory() as tmp:
+        chunk_store.write_store(chunks, Path(tmp) / "chunk_store")
+        chunk_store._shared = chunk_store.ChunkStore(Path(tmp) / "chunk_store")
+        chunk_store._shared.index_of("c0")   # chunk_id → 行番号の辞書は初回だけ作る
+
+        rng = random.Random(1)
+        print(f"{args.chunks} チャンク × 約{args.text_len}文字\n")
+        print(f"{'候補数':>6} | {'legacy':>9} | {'sets':>9} | {'store':>9}")
+        print('-' * 44)
+        for n in args.candidates:
+            results = [dict(chunks[i]) for i in rng.sample(range(len(chunks)), min(n, len(chunks)))]
+            query = rng.choice(_QUERIES)
+            expected = set_scores(query, results, None)
+            assert np.allclose(colbert_style_scores(query, results), expected), "スコアが一致しません"
+            row = [timed(lambda: set_scores(query, results, 500), args.repeat),
+                   timed(lambda: set_scores(query, results, None), args.repeat),
+                   timed(lambda: colbert_style_scores(query, results), args.repeat)]
+            print(f"{n:>6} | " + " | ".join(f"{ms:>6.2f} ms" for ms in row))
+        chunk_store._shared = None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+bench_fusion.py - スコア統合（fusion）の dict ループ実装と配列実装の比較
+
+hybrid_search と同じ構成（bm25 + 同義語変種 + vector + summary + LLM拡張変種 + cross_ref）の
+候補リストを合成し、1回の統合にかかる時間を計測する。
+  legacy: チャンクごとに dict を更新する旧実装（hybrid_search._merge_results / RRF の dict ループ）
+  fusion: src/fusion.py（NumPy 配列で統合）
+
+使い方:
+  uv run scripts/bench_fusion.py
+  uv run scripts/bench_fusion.py --per-list 500 --repeat 50
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.fusion import encode_ids, fuse
+from src.hybrid_search import _merge_results
+
+# (weight, method, normalize) の並び（hybrid_search の統合順）
+_LISTS = (
+    [(1.0, "bm25", True)] + [(0.8, "synonym", True)] * 3 + [(0.9, "vector", False), (0.7, "summary", True)]
+    + [(0.6, "llm_expand", True)] * 3 + [(0.5, "cross_ref", True)] * 2
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='スコア統合ベンチマーク')
+    parser.add_argument('--per-list', type=int, default=200, help='1リストあたりの候補数')
+    parser.add_argument('--corpus', type=int, default=5000, help='候補を引くチャンク数')
+    parser.add_argument('--repeat', type=int, default=30, help='計測回数')
+    parser.add_argument('--top-k', type=int, default=10)
+    return parser.parse_args()
+
+
+def make_lists(per_list: int, corpus: int, seed: int) -> list[tuple]:
+    rng = random.Random(seed)
+    merged = []
+    for weight, method, normalize in _LISTS:
+        rows = rng.sample(range(corpus), min(per_list, corpus))
+        results = [{"doc_id": f"JERG-{r // 100}", "chunk_id": f"c{r}", "filename": "f.pdf", "text": "",
+                    "score": rng.random() * (1.0 if not normalize else 20.0)} for r in rows]
+        results.sort(key=lambda r: -r["score"])
+        merged.append((weight, method, normalize, results))
+    return merged
+
+
+def legacy_weighted(merged: list[tuple], top_k: int) -> list[dict]:
+    """旧 hybrid_search._merge_results（dict ループ）"""
+    all_results: dict[str, dict] = {}
+    for weight, method, normalize, new_results in merged:
+        if not new_results:
+            continue
+        if normalize:
+            max_score = max(r["score"] for r in new_results)
+            if max_score <= 0:
+                continue
+            scores = [r["score"] / max_score for r in new_results]
+        else:
+            scores = [r["score"] for r in new_results]
+        for r, norm_score in zip(new_results, scores):
+            chunk_id = r["chunk_id"]
+            weighted_score = norm_score * weight
+            if chunk_id in all_results:
+                existing = all_results[chunk_id]
+                if method not in existing["matched_methods"]:
+                    existing["matched_methods"].append(method)
+                    existing["combined_score"] = existing["combined_score"] + weighted_score * 0.5
+                else:
+                    existing["combined_score"] = max(existing["combined_score"], weighted_score)
+            else:
+                all_results[chunk_id] = {
+                    "doc_id": r["doc_id"], "chunk_id": chunk_id, "filename": r["filename"],
+                    "text": r["text"], "combined_score": weighted_score, "matched_methods": [method],
+                }
+    return sorted(all_results.values(), key=lambda x: x["combined_score"], reverse=True)[:top_k]
+
+
+def legacy_rrf(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """旧 reranker.reciprocal_rank_fusion（dict ループ）"""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+def fusion_rrf(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    keys, ids = encode_ids(rankings)
+    fused_ids, fused_scores = fuse(ids, method="rrf", k=k)
+    return list(zip(keys[fused_ids].tolist(), fused_scores.tolist()))
+
+
+def timed(fn, inputs, repeat: int) -> float:
+    """1回あたりの中央値（ms）"""
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        times.append((time.perf_counter() - t) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    args = parse_args()
+    inputs = [make_lists(args.per_list, args.corpus, seed) for seed in range(5)]
+    rankings = [[[r["chunk_id"] for r in results] for *_, results in merged] for merged in inputs]
+
+    # 結果が一致することを確認してから計測
+    for merged, ranking in zip(inputs, rankings):
+        legacy = legacy_weighted(merged, args.top_k)
+        for r in legacy:
+            r["score"] = r.pop("combined_score")
+            r["methods"] = r.pop("matched_methods")
+        assert legacy == _merge_results(merged, args.top_k), "weighted の結果が一致しません"
+        assert legacy_rrf(ranking) == fusion_rrf(ranking), "rrf の結果が一致しません"
+
+    n_items = sum(len(results) for *_, results in inputs[0])
+    print(f"{len(_LISTS)} リスト × {args.per_list} 候補（計 {n_items} 件）, top_k={args.top_k}\n")
+    print(f"{'method':>9} | {'legacy':>9} | {'fusion':>9}")
+    print('-' * 34)
+    rows = [
+        ("weighted", lambda m: legacy_weighted(m, args.top_k), lambda m: _merge_results(m, args.top_k), inputs),
+        ("rrf", legacy_rrf, fusion_rrf, rankings),
+    ]
+    for name, legacy_fn, fusion_fn, data in rows:
+        print(f"{name:>9} | {timed(legacy_fn, data, args.repeat):>6.2f} ms | "
+              f"{timed(fusion_fn, data, args.repeat):>6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
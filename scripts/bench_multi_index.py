@@ -0,0 +1,153 @@
+"""
+bench_multi_index.py - MultiRepresentationIndex の構築・検索スループット
+
+合成文書（文書ごとに4表現）で、表現ごとの (doc_id, ベクトル) リストを Python ループで
+なめる旧実装と、表現タイプごとの正規化済み行列（src/multi_index.py）を比較する。
+埋め込みは固定のランダムベクトル表を引く偽モデルで、1回の呼び出しごとに --call-ms だけ
+待つ（モデル呼び出しの固定コストの代わり。0 にするとインデックス側のコストだけになる）。
+  legacy: 1テキストずつ埋め込み、検索は (doc_id, ベクトル) ごとにコサイン類似度 + dict で統合
+  matrix: 表現タイプごとに batch_size 件ずつ埋め込み、検索は行列積 + fusion
+
+使い方:
+  uv run scripts/bench_multi_index.py
+  uv run scripts/bench_multi_index.py --docs 10000 --dim 768 --queries 50
+  uv run scripts/bench_multi_index.py --call-ms 0
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.multi_index import MultiRepDoc, MultiRepresentationIndex, RepresentationType
+
+_TYPES = [t.value for t in RepresentationType]
+_WEIGHTS = {"original": 1.0, "summary": 0.8, "keywords": 0.7, "paraphrase": 0.9}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='MultiRepresentationIndex ベンチマーク')
+    parser.add_argument('--docs', type=int, default=50000, help='文書数（各4表現）')
+    parser.add_argument('--dim', type=int, default=384, help='ベクトル次元')
+    parser.add_argument('--queries', type=int, default=20, help='検索の計測回数')
+    parser.add_argument('--legacy-queries', type=int, default=3, help='旧実装の検索の計測回数')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--call-ms', type=float, default=0.02, help='埋め込み1回あたりの固定コスト（ms）')
+    return parser.parse_args()
+
+
+class FakeEmbedder:
+    """テキストの CRC で固定のランダムベクトル表を引く偽モデル"""
+
+    def __init__(self, dim: int, call_ms: float, pool: int = 65536) -> None:
+        self.table = np.random.default_rng(0).standard_normal((pool, dim)).astype(np.float32)
+        self.call_s = call_ms / 1000
+
+    def _call(self) -> None:
+        end = time.perf_counter() + self.call_s
+        while time.perf_counter() < end:
+            pass
+
+    def one(self, text: str) -> np.ndarray:
+        self._call()
+        return self.table[zlib.crc32(text.encode("utf-8")) % len(self.table)].copy()
+
+    def many(self, texts: list[str]) -> np.ndarray:
+        self._call()
+        rows = [zlib.crc32(t.encode("utf-8")) % len(self.table) for t in texts]
+        return self.table[rows]
+
+
+def make_docs(n: int) -> list[MultiRepDoc]:
+    return [MultiRepDoc(doc_id=f"JERG-{i}", original_text=f"本文{i}",
+                        representations={t: f"{t} {i}" for t in _TYPES}) for i in range(n)]
+
+
+def legacy_build(docs: list[MultiRepDoc], embed) -> dict[str, list[tuple[str, np.ndarray]]]:
+    stores = {t: [] for t in _TYPES}
+    for doc in docs:
+        for rep_type, text in doc.representations.items():
+            stores[rep_type].append((doc.doc_id, embed(text)))
+    return stores
+
+
+def legacy_search(stores: dict, query_vector: np.ndarray, top_k: int = 5) -> list[tuple[float, str]]:
+    doc_scores: dict[str, dict[str, float]] = {}
+    for rep_type, store in stores.items():
+        weight = _WEIGHTS[rep_type]
+        for doc_id, vec in store:
+            norm_a, norm_b = np.linalg.norm(query_vector), np.linalg.norm(vec)
+            score = 0.0 if norm_a == 0 or norm_b == 0 else float(np.dot(query_vector, vec) / (norm_a * norm_b))
+            scores = doc_scores.setdefault(doc_id, {})
+            if rep_type not in scores or scores[rep_type] < score * weight:
+                scores[rep_type] = score * weight
+    final = [(max(s.values()) + 0.05 * (len(s) - 1), doc_id) for doc_id, s in doc_scores.items()]
+    final.sort(key=lambda x: x[0], reverse=True)
+    return final[:top_k]
+
+
+def main():
+    args = parse_args()
+    embedder = FakeEmbedder(args.dim, args.call_ms)
+    docs = make_docs(args.docs)
+    n_reps = args.docs * len(_TYPES)
+    queries = [f"クエリ{i}" for i in range(max(args.queries, args.legacy_queries))]
+    print(f"{args.docs} 文書 × {len(_TYPES)} 表現 = {n_reps} ベクトル, dim={args.dim}, "
+          f"埋め込み1回 {args.call_ms} ms\n")
+
+    t = time.perf_counter()
+    stores = legacy_build(docs, embedder.one)
+    legacy_build_s = time.perf_counter() - t
+    legacy_times, expected = [], {}
+    for q in queries[:args.legacy_queries]:
+        t = time.perf_counter()
+        expected[q] = [doc_id for _, doc_id in legacy_search(stores, embedder.one(q))]
+        legacy_times.append(time.perf_counter() - t)
+    del stores
+
+    idx = MultiRepresentationIndex(embed_fn=embedder.one, embed_batch_fn=embedder.many,
+                                   batch_size=args.batch_size)
+    t = time.perf_counter()
+    idx.add_documents(make_docs(args.docs), verbose=False)
+    build_s = time.perf_counter() - t
+    t = time.perf_counter()
+    idx.search(queries[0])   # 追加分を行列にまとめる
+    first_s = time.perf_counter() - t
+    times = []
+    for q in queries[:args.queries]:
+        t = time.perf_counter()
+        idx.search(q)
+        times.append(time.perf_counter() - t)
+    for q, doc_ids in expected.items():
+        assert [r["doc_id"] for r in idx.search(q)] == doc_ids, "旧実装と上位文書が一致しません"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "multi_index.json")
+        t = time.perf_counter()
+        idx.save(path)
+        save_s = time.perf_counter() - t
+        loaded = MultiRepresentationIndex(embed_fn=embedder.one)
+        t = time.perf_counter()
+        loaded.load(path)
+        load_s = time.perf_counter() - t
+        assert loaded.search(queries[0]) == idx.search(queries[0]), "読み込み後の結果が一致しません"
+
+    print(f"\n{'':>14} | {'legacy':>11} | {'matrix':>11}")
+    print('-' * 44)
+    print(f"{'build':>14} | {legacy_build_s:>9.2f} s | {build_s:>9.2f} s")
+    print(f"{'build vec/s':>14} | {n_reps / legacy_build_s:>11,.0f} | {n_reps / build_s:>11,.0f}")
+    print(f"{'search (p50)':>14} | {np.median(legacy_times) * 1000:>8.1f} ms | {np.median(times) * 1000:>8.1f} ms")
+    print(f"\n初回検索（行列へのまとめを含む）: {first_s * 1000:.1f} ms")
+    print(f"save: {save_s:.2f} s, load: {load_s:.2f} s（.npy を mmap、埋め込み直しなし）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""
+bench_retrieval.py - 検索品質とレイテンシのベンチマーク（JERG インデックス）
+
+ラベル付きクエリ（scripts/retrieval_queries.yaml）を各検索モードで引き、
+recall@k / MRR / nDCG@k と p50/p95/p99 レイテンシを測って JSON に書き出す。
+2回分の JSON を比較して、品質の低下・レイテンシの悪化を回帰として報告する。
+
+  bm25:       src.searcher.search
+  vector:     src.vector_search.search
+  hybrid:     src.hybrid_search.hybrid_search（既定では LLM 拡張なし、結果キャッシュなし）
+  guided:     src.guided_retrieval.guided_search
+  contextual: src.contextual_retrieval.ContextualRetrieval（chunks.json から構築、または保存済みを読み込み）
+  section:    src.section_indexer.SectionIndex（保存済みを読み込み、無ければ chunks.json から構築）
+
+正解が文書番号だけのクエリは文書単位（同じ文書の2件目以降は無視）、
+chunk_id を指定したクエリはチャンク単位で評価する。
+最初の1クエリ分はインデックスのロードを含むので計測から外す（warmup_ms に記録）。
+例外を投げたクエリは指標 0 として平均に含め、compare ではエラー数の増加も回帰とする。
+
+使い方:
+  uv run scripts/bench_retrieval.py run --out bench/base.json
+  uv run scripts/bench_retrieval.py run --modes bm25 hybrid --k 5 --out bench/new.json
+  uv run scripts/bench_retrieval.py run --modes hybrid --llm          # LLM クエリ拡張あり
+  uv run scripts/bench_retrieval.py compare bench/base.json bench/new.json
+"""
+
+import argparse
+import json
+import math
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+INDEX_DIR = ROOT / "data" / "index"
+DEFAULT_QUERIES = Path(__file__).parent / "retrieval_queries.yaml"
+ALL_MODES = ["bm25", "vector", "hybrid", "guided", "contextual", "section"]
+DEFAULT_MODES = ["bm25", "vector", "hybrid", "contextual", "section"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='検索品質・レイテンシ ベンチマーク')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='ベンチマークを実行して JSON を書き出す')
+    run.add_argument('--modes', nargs='+', choices=ALL_MODES, default=DEFAULT_MODES, help='検索モード')
+    run.add_argument('--queries', type=str, default=str(DEFAULT_QUERIES), help='ラベル付きクエリ (YAML)')
+    run.add_argument('--k', type=int, default=10, help='評価する上位件数')
+    run.add_argument('--repeat', type=int, default=1, help='レイテンシ計測の繰り返し回数')
+    run.add_argument('--llm', action='store_true', help='hybrid / guided で LLM を使う')
+    run.add_argument('--contextual-path', type=str, default='',
+                     help='ContextualRetrieval.save() の JSON（未指定なら chunks.json から構築）')
+    run.add_argument('--contextual-embed', action='store_true',
+                     help='contextual で埋め込みも使う（全チャンクを埋め込むので遅い）')
+    run.add_argument('--section-index', type=str, default=str(INDEX_DIR / "section_index.json"),
+                     help='SectionIndex.save() の JSON（無ければ chunks.json から構築）')
+    run.add_argument('--out', type=str, default='', help='結果 JSON の保存先')
+
+    cmp = sub.add_parser('compare', help='2回分の結果を比較して回帰を報告する')
+    cmp.add_argument('base', type=str, help='基準の結果 JSON')
+    cmp.add_argument('new', type=str, help='比較する結果 JSON')
+    cmp.add_argument('--max-quality-drop', type=float, default=0.02,
+                     help='品質指標の許容低下幅（絶対値）')
+    cmp.add_argument('--max-latency-increase', type=float, default=0.2,
+                     help='p95 レイテンシの許容増加率')
+    cmp.add_argument('--min-latency-ms', type=float, default=1.0,
+                     help='これ未満の p95 増加（ms）はノイズとして回帰にしない')
+    return parser.parse_args()
+
+
+# ---------- 検索モード ----------
+# 各 factory は search(query, k) -> [(doc_id, chunk_id), ...] を返す
+
+
+def _bm25_mode(args):
+    from src.searcher import search
+    return lambda q, k: [(r["doc_id"], r["chunk_id"]) for r in search(q, top_k=k)]
+
+
+def _vector_mode(args):
+    from src import vector_search
+    if not vector_search.is_available():
+        raise FileNotFoundError("埋め込みが未構築です（python -m src.vector_search build）")
+    return lambda q, k: [(r["doc_id"], r["chunk_id"]) for r in vector_search.search(q, top_k=k)]
+
+
+def _llm_client(args):
+    if not args.llm:
+        return None, None
+    from src.llm_client import create_client
+    return create_client()
+
+
+def _hybrid_mode(args):
+    from src.hybrid_search import hybrid_search
+    client, model = _llm_client(args)
+
+    def search(q, k):
+        results, _ = hybrid_search(q, top_k=k, client=client, model=model,
+                                   use_llm_expansion=args.llm, use_cache=False)
+        return [(r["doc_id"], r["chunk_id"]) for r in results]
+    return search
+
+
+def _guided_mode(args):
+    from src.guided_retrieval import guided_search
+    client, model = _llm_client(args)
+
+    def search(q, k):
+        results = guided_search(q, top_k=k, client=client, model=model, use_cache=False)["results"]
+        return [(r["doc_id"], r["chunk_id"]) for r in results]
+    return search
+
+
+def _load_chunks() -> list[dict]:
+    path = INDEX_DIR / "chunks.json"
+    if not path.exists():
+        raise FileNotFoundError(f"{path} がありません（python -m src.indexer）")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _contextual_mode(args):
+    from src.contextual_retrieval import ContextualRetrieval
+
+    chunks = _load_chunks()
+    doc_of = {c["chunk_id"]: c["doc_id"] for c in chunks}
+    embed_fn = None
+    if args.contextual_embed:
+        from src.vector_search import embed_queries
+        embed_fn = lambda text: embed_queries([text])[0]
+
+    cr = ContextualRetrieval(embed_fn=embed_fn)
+    if args.contextual_path:
+        cr.load(args.contextual_path)
+        contextualized = list(cr._contextualized_chunks.values())
+    else:
+        by_doc: dict[str, list[dict]] = {}
+        for c in chunks:
+            by_doc.setdefault(c["doc_id"], []).append(c)
+        contextualized = []
+        for doc_id, doc_chunks in by_doc.items():
+            full_document = "\n".join(c["text"] for c in doc_chunks)
+            contextualized.extend(cr.add_context(doc_chunks, full_document, document_title=doc_id))
+    cr.build_index(contextualized)
+
+    def search(q, k):
+        return [(doc_of.get(r["chunk_id"], r["document_title"]), r["chunk_id"])
+                for r in cr.search(q, top_k=k)]
+    return search
+
+
+def _section_mode(args):
+    from src.section_indexer import SectionIndex
+
+    path = Path(args.section_index)
+    if path.exists():
+        idx = SectionIndex.load(path)
+    else:
+        idx = SectionIndex()
+        idx.build_from_chunks(_load_chunks(), verbose=False)
+
+    def search(q, k):
+        return [(r["section"].doc_id, (r["section"].chunk_ids or [r["section"].full_id])[0])
+                for r in idx.search(q, top_k=k)]
+    return search
+
+
+MODE_FACTORIES = {
+    "bm25": _bm25_mode,
+    "vector": _vector_mode,
+    "hybrid": _hybrid_mode,
+    "guided": _guided_mode,
+    "contextual": _contextual_mode,
+    "section": _section_mode,
+}
+
+
+# ---------- 指標 ----------
+
+
+def ranked_ids(hits: list[tuple[str, str]], by_chunk: bool) -> list[str]:
+    """評価単位の ID 列（文書単位なら同じ文書の2件目以降を除く）"""
+    if by_chunk:
+        return [chunk_id for _, chunk_id in hits]
+    return list(dict.fromkeys(doc_id for doc_id, _ in hits))
+
+
+def score_query(ids: list[str], relevant: set[str], k: int) -> dict:
+    """recall@k / reciprocal rank / nDCG@k（二値の関連度）"""
+    top = ids[:k]
+    found = [i for i, x in enumerate(top) if x in relevant]
+    dcg = sum(1.0 / math.log2(i + 2) for i in found)
+    idcg = sum(1.0 / math.log2(i + 2) for i in range(min(len(relevant), k)))
+    return {
+        "recall": len(found) / len(relevant) if relevant else 0.0,
+        "rr": 1.0 / (found[0] + 1) if found else 0.0,
+        "ndcg": dcg / idcg if idcg else 0.0,
+    }
+
+
+def latency_stats(latencies: list[float]) -> dict:
+    if not latencies:
+        return {}
+    lat = np.asarray(latencies)
+    return {
+        "mean": round(float(lat.mean()), 2),
+        "p50": round(float(np.percentile(lat, 50)), 2),
+        "p95": round(float(np.percentile(lat, 95)), 2),
+        "p99": round(float(np.percentile(lat, 99)), 2),
+        "max": round(float(lat.max()), 2),
+    }
+
+
+def evaluate(search, queries: list[dict], k: int, repeat: int) -> dict:
+    """1モード分の評価（指標の平均・レイテンシ・クエリごとの結果）"""
+    t0 = time.perf_counter()
+    search(queries[0]["query"], k)  # ロード（インデックスが無ければここで FileNotFoundError）
+    warmup_ms = (time.perf_counter() - t0) * 1000
+
+    per_query, latencies, errors = [], [], 0
+    for q in queries:
+        by_chunk = bool(q.get("expected_chunks"))
+        relevant = set(q.get("expected_chunks") or q.get("expected_docs") or [])
+        try:
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                hits = search(q["query"], k)
+                latencies.append((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            errors += 1
+            per_query.append({"id": q["id"], "error": f"{type(e).__name__}: {e}"})
+            continue
+        ids = ranked_ids(hits, by_chunk)
+        per_query.append({"id": q["id"], **score_query(ids, relevant, k), "top": ids[:k]})
+
+    # 例外を投げたクエリは全指標 0 として平均に含める
+    n = max(len(per_query), 1)
+    return {
+        f"recall@{k}": round(sum(p.get("recall", 0.0) for p in per_query) / n, 4),
+        "mrr": round(sum(p.get("rr", 0.0) for p in per_query) / n, 4),
+        f"ndcg@{k}": round(sum(p.get("ndcg", 0.0) for p in per_query) / n, 4),
+        "latency_ms": latency_stats(latencies),
+        "warmup_ms": round(warmup_ms, 1),
+        "n": len(per_query),
+        "errors": errors,
+        "per_query": per_query,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run(args) -> None:
+    with open(args.queries, encoding="utf-8") as f:
+        queries = yaml.safe_load(f)["queries"]
+    print(f"{len(queries)} クエリ, k={args.k}, modes={args.modes}\n")
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "queries": str(args.queries),
+            "n_queries": len(queries),
+            "k": args.k,
+            "llm": args.llm,
+        },
+        "modes": {},
+    }
+    k = args.k
+    print(f"{'mode':>10} | {f'recall@{k}':>9} | {'MRR':>6} | {f'nDCG@{k}':>7} | "
+          f"{'p50':>8} | {'p95':>8} | {'p99':>8} | err")
+    print('-' * 82)
+    for mode in args.modes:
+        try:
+            r = evaluate(MODE_FACTORIES[mode](args), queries, k, args.repeat)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"{mode:>10} | スキップ: {e}")
+            result["modes"][mode] = {"skipped": str(e)}
+            continue
+        except Exception as e:
+            print(f"{mode:>10} | エラー: {type(e).__name__}: {e}")
+            result["modes"][mode] = {"skipped": f"{type(e).__name__}: {e}"}
+            continue
+        result["modes"][mode] = r
+        lat = r["latency_ms"]
+        print(f"{mode:>10} | {r[f'recall@{k}']:>9.3f} | {r['mrr']:>6.3f} | {r[f'ndcg@{k}']:>7.3f} | "
+              f"{lat.get('p50', 0):>5.1f} ms | {lat.get('p95', 0):>5.1f} ms | {lat.get('p99', 0):>5.1f} ms | "
+              f"{r['errors']}")
+
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"\n結果を保存: {out}")
+
+
+def compare(args) -> int:
+    """2回分の結果を比較。回帰があれば 1 を返す"""
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if base["meta"]["k"] != new["meta"]["k"]:
+        print(f"Warning: k が違います（{base['meta']['k']} → {new['meta']['k']}）")
+    k = new["meta"]["k"]
+    print(f"base: {args.base} ({base['meta'].get('commit', '')})")
+    print(f"new:  {args.new} ({new['meta'].get('commit', '')})\n")
+
+    regressions = []
+    for mode, r in new["modes"].items():
+        b = base["modes"].get(mode)
+        if not b or "skipped" in b or "skipped" in r:
+            continue
+        print(f"[{mode}]")
+        for metric in (f"recall@{k}", "mrr", f"ndcg@{k}"):
+            if metric not in b:
+                continue
+            delta = r[metric] - b[metric]
+            flag = delta < -args.max_quality_drop
+            print(f"  {metric:>10}: {b[metric]:.3f} → {r[metric]:.3f} ({delta:+.3f}){'  ← 回帰' if flag else ''}")
+            if flag:
+                regressions.append(f"{mode} {metric} {delta:+.3f}")
+        for stat in ("p50", "p95", "p99"):
+            bv, nv = b["latency_ms"].get(stat), r["latency_ms"].get(stat)
+            if not bv or nv is None:
+                continue
+            ratio = nv / bv - 1
+            flag = (stat == "p95" and ratio > args.max_latency_increase
+                    and nv - bv >= args.min_latency_ms)
+            print(f"  {stat:>10}: {bv:.1f} → {nv:.1f} ms ({ratio:+.0%}){'  ← 回帰' if flag else ''}")
+            if flag:
+                regressions.append(f"{mode} {stat} {ratio:+.0%}")
+
+        new_errors = r.get("errors", 0) - b.get("errors", 0)
+        if new_errors > 0:
+            print(f"  {'errors':>10}: {b.get('errors', 0)} → {r.get('errors', 0)}  ← 回帰")
+            regressions.append(f"{mode} errors +{new_errors}")
+
+        # クエリ単位で正解を落としたもの
+        before = {p["id"]: p for p in b.get("per_query", [])}
+        lost = [p["id"] for p in r.get("per_query", [])
+                if before.get(p["id"], {}).get("rr", 0) > 0 and p.get("rr", 0) == 0]
+        if lost:
+            print(f"  正解が上位 {k} 件から消えたクエリ: {', '.join(lost)}")
+
+    print()
+    if regressions:
+        print(f"⚠️  回帰 {len(regressions)} 件: " + "; ".join(regressions))
+        return 1
+    print("✅ 回帰なし")
+    return 0
+
+
+def main():
+    args = parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_tokenizer.py - 日本語トークナイザのスループット（tokens/sec）
+
+  per-call Tagger: 呼び出しごとに Tagger() を作る（旧 indexer.tokenize_japanese）
+  tokenize:        スレッドごとの Tagger を使い回す（src.tokenizer.tokenize）
+  tokenize_many:   まとめてトークン化（src.tokenizer.tokenize_many）
+  tokenize_query:  同じクエリの繰り返し（LRU キャッシュ）
+
+使い方:
+  uv run scripts/bench_tokenizer.py
+  uv run scripts/bench_tokenizer.py --texts 5000 --index-dir data/index   # 実チャンクで計測
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fugashi import Tagger
+
+from src import tokenizer
+
+_PHRASES = [
+    "宇宙機の熱設計では放射と伝導の両方を考慮する必要がある。",
+    "バッテリの充放電サイクル試験は JERG-2-211 に従って実施する。",
+    "構造解析の安全係数は終極荷重に対して1.25以上とする。",
+    "ソフトウェアの独立検証及び妥当性確認（IV&V）を計画段階から行う。",
+    "熱真空試験では最高・最低温度で各4サイクル以上の保持を行うこと。",
+    "放射線耐性の評価には TID と SEE の両方を含めること。",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='日本語トークナイザ スループット ベンチマーク')
+    parser.add_argument('--texts', type=int, default=2000, help='テキスト数')
+    parser.add_argument('--sentences', type=int, default=8, help='1テキストあたりの文数（合成時）')
+    parser.add_argument('--queries', type=int, default=50, help='異なるクエリ数（LRU 計測用）')
+    parser.add_argument('--repeat', type=int, default=20, help='クエリの繰り返し回数')
+    parser.add_argument('--index-dir', type=str, default='',
+                        help='chunks.json のあるディレクトリ（指定時は実チャンクを使う）')
+    return parser.parse_args()
+
+
+def load_texts(args) -> list[str]:
+    if args.index_dir:
+        with open(Path(args.index_dir) / "chunks.json", encoding="utf-8") as f:
+            return [c["text"] for c in json.load(f)[:args.texts]]
+    rng = np.random.default_rng(0)
+    return [
+        "".join(_PHRASES[i] for i in rng.integers(0, len(_PHRASES), size=args.sentences))
+        for _ in range(args.texts)
+    ]
+
+
+def per_call_tagger(text: str) -> list[str]:
+    """旧実装: 呼び出しごとに Tagger を生成"""
+    tagger = Tagger()
+    return [w.surface for w in tagger(text) if len(w.surface) > 1 or not w.surface.isascii()]
+
+
+def report(name: str, n_tokens: int, seconds: float):
+    print(f"{name:>16} | {seconds * 1000:>9.1f} ms | {n_tokens / seconds:>12,.0f} tokens/s")
+
+
+def main():
+    args = parse_args()
+    texts = load_texts(args)
+    print(f"{len(texts)} テキスト\n")
+    print(f"{'mode':>16} | {'time':>12} | {'throughput':>19}")
+    print('-' * 54)
+
+    # 旧実装は遅いので一部だけ計測して外挿しない（そのままの値を出す）
+    sample = texts[:max(1, len(texts) // 10)]
+    t0 = time.perf_counter()
+    n = sum(len(per_call_tagger(t)) for t in sample)
+    report(f"per-call ({len(sample)})", n, time.perf_counter() - t0)
+
+    tokenizer.get_tagger()  # 生成時間は除く
+    t0 = time.perf_counter()
+    n = sum(len(tokenizer.tokenize(t)) for t in texts)
+    report("tokenize", n, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    n = sum(len(tokens) for tokens in tokenizer.tokenize_many(texts))
+    report("tokenize_many", n, time.perf_counter() - t0)
+
+    queries = [t[:40] for t in texts[:args.queries]] * args.repeat
+    t0 = time.perf_counter()
+    n = sum(len(tokenizer.tokenize_query(q)) for q in queries)
+    report("tokenize_query", n, time.perf_counter() - t0)
+    info = tokenizer.query_cache_info()
+    print(f"\nクエリキャッシュ: hits={info.hits} misses={info.misses} "
+          f"hit rate={info.hits / max(info.hits + info.misses, 1):.1%}")
+
+
+if __name__ == '__main__':
+    main()
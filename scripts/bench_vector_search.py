@@ -0,0 +1,158 @@
+"""
+bench_vector_search.py - ベクトル検索のレイテンシ / RSS 比較
+
+合成埋め込み（既定 100,000 チャンク × 384 次元）で、クエリ埋め込みを除いた
+検索本体を別プロセスで計測する。
+  legacy:       float32 を np.load で全読み込みし、クエリごとに全行を再正規化（旧実装）
+  mmap-float32: 正規化済み float32 を mmap し、内積1回（新実装）
+  mmap-float16: 正規化済み float16 を mmap し、ブロック単位で内積（新実装）
+
+使い方:
+  uv run scripts/bench_vector_search.py
+  uv run scripts/bench_vector_search.py --chunks 300000 --queries 50
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# プロジェクトルートをパスに追加
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+_CHILD_PRELUDE = """
+import json, sys, time
+from pathlib import Path
+import numpy as np
+sys.path.insert(0, {root!r})
+d = Path({data_dir!r})
+queries = np.load(d / "queries.npy")
+"""
+
+_CHILD_LEGACY = """
+t0 = time.perf_counter()
+emb = np.load(d / "raw" / "vectors.npy")
+chunk_ids = json.load(open(d / "raw" / "chunk_ids.json", encoding="utf-8"))
+t_load = time.perf_counter()
+lat = []
+for q in queries:
+    t = time.perf_counter()
+    qn = q / (np.linalg.norm(q) + 1e-10)
+    en = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-10)
+    sims = (en @ qn).astype(np.float32)
+    cand = np.argpartition(sims, -15)[-15:]
+    cand = cand[np.argsort(sims[cand])[::-1]]
+    top = [chunk_ids[i] for i in cand[:5] if sims[i] >= 0.3]
+    lat.append((time.perf_counter() - t) * 1000)
+"""
+
+_CHILD_MMAP = """
+import src.chunk_store as cs
+import src.vector_search as vs
+cs.STORE_DIR = d / "chunk_store"
+cs.CHUNKS_CANDIDATES = [d / "chunks.json"]
+vs.INDEX_DIR = d
+vs.EMBEDDINGS_DIR = d / {variant!r}
+t0 = time.perf_counter()
+vs._load_embeddings()
+t_load = time.perf_counter()
+lat = []
+for q in queries:
+    t = time.perf_counter()
+    vs._search_vector(q, top_k=5)
+    lat.append((time.perf_counter() - t) * 1000)
+"""
+
+# ru_maxrss は Linux では exec 前の親プロセスの値を引き継ぐため、VmHWM を優先する
+_CHILD_REPORT = """
+try:
+    hwm = next(l for l in open("/proc/self/status") if l.startswith("VmHWM"))
+    rss_mb = int(hwm.split()[1]) / 1024
+except (OSError, StopIteration):
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{
+    "load_ms": (t_load - t0) * 1000,
+    "p50_ms": float(np.percentile(lat, 50)),
+    "p95_ms": float(np.percentile(lat, 95)),
+    "max_rss_mb": rss_mb,
+}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='ベクトル検索 レイテンシ/RSS ベンチマーク')
+    parser.add_argument('--chunks', type=int, default=100000, help='合成チャンク数')
+    parser.add_argument('--dim', type=int, default=384, help='埋め込み次元')
+    parser.add_argument('--queries', type=int, default=30, help='クエリ数')
+    return parser.parse_args()
+
+
+def make_data(directory: Path, n: int, dim: int, n_queries: int):
+    """合成埋め込み・chunks.json を作る（legacy 用の生ベクトルと新形式の両方）"""
+    import src.vector_search as vs
+    from src.chunk_store import write_store
+
+    rng = np.random.default_rng(0)
+    raw = rng.standard_normal((n, dim)).astype(np.float32) * rng.uniform(0.5, 2.0, size=(n, 1)).astype(np.float32)
+    chunk_ids = [f"JERG-{i % 3}-{i // 100:04d}_{i % 100}" for i in range(n)]
+    chunks = [
+        {"doc_id": cid.rsplit("_", 1)[0], "filename": "synthetic.pdf", "chunk_id": cid, "text": f"chunk {i}"}
+        for i, cid in enumerate(chunk_ids)
+    ]
+    with open(directory / "chunks.json", "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    write_store(chunks, directory / "chunk_store", source=directory / "chunks.json")
+
+    (directory / "raw").mkdir()
+    np.save(directory / "raw" / "vectors.npy", raw)
+    with open(directory / "raw" / "chunk_ids.json", "w", encoding="utf-8") as f:
+        json.dump(chunk_ids, f)
+
+    # 新形式は vector_search._save_embeddings で書く（patch_embeddings と同じ保存経路）
+    vs.INDEX_DIR = directory
+    for dtype in ("float32", "float16"):
+        vs.EMBEDDINGS_DIR = directory / dtype
+        vs._save_embeddings(raw, chunk_ids, dtype=dtype)
+
+    # クエリ: 既存ベクトルに雑音を加えたもの（閾値を超えるヒットが出るように）
+    picks = rng.integers(0, n, size=n_queries)
+    queries = raw[picks] + rng.standard_normal((n_queries, dim)).astype(np.float32) * 0.5
+    np.save(directory / "queries.npy", queries)
+
+
+def run_child(body: str, data_dir: Path, variant: str = "") -> dict:
+    code = (_CHILD_PRELUDE + body + _CHILD_REPORT).format(
+        root=str(ROOT), data_dir=str(data_dir), variant=variant,
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        print(f"合成データを作成中: {args.chunks} チャンク × {args.dim} 次元...")
+        make_data(data_dir, args.chunks, args.dim, args.queries)
+
+        print(f"\n{'mode':>13} | {'load':>9} | {'p50':>9} | {'p95':>9} | {'max RSS':>9}")
+        print('-' * 62)
+        modes = [
+            ("legacy", _CHILD_LEGACY, ""),
+            ("mmap-float32", _CHILD_MMAP, "float32"),
+            ("mmap-float16", _CHILD_MMAP, "float16"),
+        ]
+        for name, body, variant in modes:
+            r = run_child(body, data_dir, variant)
+            print(f"{name:>13} | {r['load_ms']:>6.1f} ms | {r['p50_ms']:>6.2f} ms | "
+                  f"{r['p95_ms']:>6.2f} ms | {r['max_rss_mb']:>6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
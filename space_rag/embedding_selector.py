@@ -165,6 +165,15 @@ VECTOR_DBS = {
         "recommended": True,
         "notes": "JERG 11,462チャンクなら充分速い。宇宙分野RAGなら最初はこれで十分。",
     },
+    "numpy_ivf": {
+        "description": "NumPy IVF（k-means + 転置リスト）による近似最近傍（src/ann_index.py）",
+        "pros": ["依存なし", "flat と同じ vectors.npy を mmap で共有", "nprobe で再現率と速度を調整"],
+        "cons": ["近似（nprobe が小さいと取りこぼし）", "埋め込み更新後は build-ann で再構築が必要"],
+        "suitable_for": "10万〜数百万チャンク",
+        "recommended": False,
+        "notes": "python -m src.vector_search build-ann で構築し VECTOR_INDEX=ivf で有効化。"
+                 "再現率は scripts/bench_ann.py で確認。",
+    },
     "chromadb": {
         "description": "ChromaDB - ローカル完結型ベクトルDB",
         "pros": ["pip install chroma で即使える", "永続化・CRUD対応", "フィルタリング機能"],
@@ -250,7 +259,8 @@ def compare_vector_dbs():
 
     print("【結論】")
     print("  宇宙分野RAG（〜数十万チャンク）ならNumPy flat searchが最適解。")
-    print("  100万チャンクを超える場合は FAISS の HNSW インデックスへ移行。")
+    print("  100万チャンク規模では同梱の IVF（VECTOR_INDEX=ivf）で追加依存なしに対応できる。")
+    print("  それ以上、または GPU が必要なら FAISS の HNSW/IVF-PQ へ移行。")
 
 
 def benchmark_current_model(n_queries: int = 10):
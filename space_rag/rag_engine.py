@@ -382,7 +382,8 @@ class SpaceRAG:
             if self._bm25_index is None:
                 self._build_bm25_index()
 
-            tokenized_query = query.split()
+            from src.tokenizer import tokenize_query
+            tokenized_query = tokenize_query(query)
             scores = self._bm25_index.get_scores(tokenized_query)
 
             # 上位k件を取得
@@ -428,7 +429,8 @@ class SpaceRAG:
     def _build_bm25_index(self):
         """BM25インデックスを構築する"""
         from rank_bm25 import BM25Okapi
-        corpus = [c.get("text", "").split() for c in self._chunks]
+        from src.tokenizer import tokenize_many
+        corpus = tokenize_many(c.get("text", "") for c in self._chunks)
         self._bm25_index = BM25Okapi(corpus)
 
     def _merge_chunk_results(
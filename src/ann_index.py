@@ -0,0 +1,207 @@
+"""近似最近傍インデックス（IVF）- NumPy のみで動く転置ファイル型ベクトル索引
+
+正規化済み埋め込み行列（vector_search の vectors.npy）に対して:
+1. 球面 k-means で n_lists 個のセントロイド（粗量子化器）を学習
+2. 各行を最も近いセントロイドのリストに割り当て（CSR 形式で行番号を保持）
+3. 検索時はクエリに近い nprobe 個のリストの行だけを内積で再スコア
+
+ベクトル本体は複製せず、元の行列（mmap）から候補行だけを読む。
+100万チャンク規模で flat 全探索の代わりに使う想定（faiss 不要）。
+
+ディレクトリ構成（data/embeddings/ivf/）:
+- meta.json:          n_lists / 行数 / 次元
+- centroids.npy:      (n_lists, dim) float32、正規化済み
+- list_offsets.npy:   リストごとの範囲（長さ n_lists+1）
+- list_rows.npy:      リスト順に並べた行番号
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from src.chunk_store import make_tmp_dir, replace_dir
+
+FORMAT_VERSION = 1
+
+# 割り当て計算のブロック行数（(block, n_lists) の一時行列サイズを抑える）
+_ASSIGN_BLOCK = 16384
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-10)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """各行を内積最大のセントロイドに割り当てる（ブロック処理）"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_kmeans(
+    vectors: np.ndarray,
+    n_lists: int,
+    n_iter: int = 20,
+    sample_size: int | None = None,
+    seed: int = 0,
+) -> np.ndarray:
+    """球面 k-means でセントロイドを学習（サンプルで学習、正規化済みを返す）"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample_size = min(n, sample_size or max(n_lists * 64, 10000))
+    sample_idx = np.sort(rng.choice(n, size=sample_size, replace=False))
+    sample = _normalize(np.asarray(vectors[sample_idx], dtype=np.float32))
+
+    centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+        empty = counts == 0
+        if np.any(empty):
+            # 空クラスタは最も遠いサンプルで埋め直す
+            far = np.argsort(np.max(sample @ centroids.T, axis=1))[:int(empty.sum())]
+            sums[empty] = sample[far]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """k-means 粗量子化器 + 転置リストによる近似最近傍索引"""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        vectors: np.ndarray | None = None,
+    ) -> None:
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.vectors = vectors
+        self.n_lists = len(centroids)
+        self.n_rows = len(list_rows)
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        n_lists: int | None = None,
+        n_iter: int = 20,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """正規化済み行列から索引を構築（n_lists 既定: 4 * sqrt(N)）"""
+        n = len(vectors)
+        n_lists = n_lists or max(1, min(n, int(4 * math.sqrt(n))))
+        centroids = train_kmeans(vectors, n_lists, n_iter=n_iter, seed=seed)
+        labels = _assign(vectors, centroids)
+
+        order = np.argsort(labels, kind="stable").astype(np.int32)
+        counts = np.bincount(labels, minlength=n_lists)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(centroids, offsets, order, vectors)
+
+    def save(self, directory: Path) -> None:
+        """索引をディレクトリに保存（ベクトル本体は保存しない）"""
+        directory = Path(directory)
+        tmp = make_tmp_dir(directory)
+        np.save(tmp / "centroids.npy", self.centroids)
+        np.save(tmp / "list_offsets.npy", self.list_offsets)
+        np.save(tmp / "list_rows.npy", self.list_rows)
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "type": "ivf",
+                "n_lists": self.n_lists,
+                "n_rows": self.n_rows,
+                "dim": int(self.centroids.shape[1]),
+            }, f, indent=2)
+        replace_dir(tmp, directory)
+
+    @classmethod
+    def load(cls, directory: Path, vectors: np.ndarray, mmap: bool = True) -> "IVFIndex":
+        """保存済み索引を開き、検索対象の行列と結び付ける"""
+        directory = Path(directory)
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION or meta.get("type") != "ivf":
+            raise ValueError(f"IVFインデックスの形式が未対応です: {directory}")
+        if meta["n_rows"] != len(vectors):
+            raise ValueError(
+                f"IVFインデックスの行数 ({meta['n_rows']}) が埋め込み ({len(vectors)}) と一致しません。"
+                "'python -m src.vector_search build-ann' で再構築してください。"
+            )
+        mode = "r" if mmap else None
+        return cls(
+            np.load(directory / "centroids.npy"),
+            np.load(directory / "list_offsets.npy", mmap_mode=mode),
+            np.load(directory / "list_rows.npy", mmap_mode=mode),
+            vectors,
+        )
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """近似上位K件の (行番号, 内積スコア) をスコア降順で返す
+
+        Args:
+            query: 正規化済みクエリベクトル
+            k: 返す件数
+            nprobe: 走査するリスト数（大きいほど再現率↑・速度↓）
+            rows: 検索対象の行番号（昇順、フィルタ検索）。対象行が nprobe 個の
+                  リストの想定行数以下ならその行を直接スコアする（厳密）。
+                  それ以外で k 件に満たない場合は次に近いリストへ広げる
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if rows is not None and len(rows) <= self.n_rows * nprobe / self.n_lists:
+            return _top(rows, np.asarray(self.vectors[rows], dtype=np.float32) @ query, k)
+
+        order = np.argsort(-(self.centroids @ query))
+        probes = order[:nprobe]
+        cand = self._gather(probes, rows)
+
+        # フィルタで候補が足りない場合は近い順にリストを追加
+        probed = len(probes)
+        while len(cand) < k and probed < self.n_lists:
+            extra = order[probed:probed + nprobe]
+            probed += len(extra)
+            cand = np.concatenate([cand, self._gather(extra, rows)])
+
+        if not len(cand):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cand = np.sort(cand)  # mmap からの読み出しを行順にする
+        scores = np.asarray(self.vectors[cand], dtype=np.float32) @ query
+        return _top(cand, scores, k)
+
+    def _gather(self, lists: np.ndarray, rows: np.ndarray | None) -> np.ndarray:
+        """指定リストの行番号を集める（rows で絞り込み）"""
+        parts = [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        cand = np.concatenate(parts).astype(np.int64) if parts else np.zeros(0, dtype=np.int64)
+        if rows is not None:
+            if not len(rows):
+                return cand[:0]
+            pos = np.minimum(np.searchsorted(rows, cand), len(rows) - 1)
+            cand = cand[rows[pos] == cand]
+        return cand
+
+
+def _top(rows: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """スコア降順の上位K件"""
+    if len(rows) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[part], scores[part]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
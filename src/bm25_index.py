@@ -0,0 +1,555 @@
+"""転置インデックス型 BM25 エンジン - postings 配列 + MaxScore による上位K件枝刈り
+
+rank_bm25.BM25Okapi と同じスコア式（ATIRE 版 IDF + epsilon 下限）を、
+全チャンク走査ではなくクエリ語の postings だけを触って計算する。
+
+データ構造（CSR 形式）:
+- vocab:          term → term_id（term_id は語彙のソート順）
+- term_offsets:   term_id ごとの postings 範囲（長さ V+1）
+- postings_docs:  チャンク番号（term 内で昇順）
+- postings_tfs:   そのチャンク内の出現回数
+- doc_lens:       チャンクごとのトークン数
+- idf / term_max: term ごとの IDF と、1 posting あたりの最大寄与（idf 抜き）
+
+上位K件の取得は term-at-a-time の MaxScore:
+寄与上限の大きい語から処理し、残りの語の上限合計が現在の K 位スコアを
+下回った時点で新規候補の追加をやめ、既存候補のスコア更新だけを行う。
+クエリ展開の変種をまとめて引く search_many() は、異なる語ごとに postings を
+1回だけ読み、全クエリのスコアを1つの行列に加算する。
+
+save()/load() でディレクトリに .npy + 語彙 blob として保存し、
+検索プロセスは mmap で開く（トークン列を Python オブジェクトに展開しない）。
+語彙は UTF-8 のソート順で連結してあるので、二分探索で term_id を引く。
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from src.chunk_store import make_tmp_dir, replace_dir
+from src.doc_filter import in_ranges, range_indices
+
+FORMAT_VERSION = 1
+
+# 同点とみなすスコアの相対差（加算順の違いによる丸め誤差を吸収する）
+_TIE_RTOL = 1e-9
+
+# 保存する配列（ファイル名 = 属性名.npy）
+_ARRAYS = ("term_offsets", "postings_docs", "postings_tfs", "doc_lens", "idf", "term_max", "doc_norm")
+
+
+class _MappedVocab:
+    """mmap した語彙 blob を dict.get 互換で引く（ソート済み前提の二分探索）"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def get(self, term: str, default=None):
+        key = term.encode("utf-8")
+        i = bisect.bisect_left(self, key)
+        if i < len(self) and self[i] == key:
+            return i
+        return default
+
+
+class BM25Index:
+    """postings リストベースの BM25Okapi 互換インデックス"""
+
+    def __init__(
+        self,
+        vocab: dict[str, int],
+        term_offsets: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_tfs: np.ndarray,
+        doc_lens: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> None:
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = len(doc_lens)
+        self.meta: dict = {}
+        self._precompute()
+
+    @classmethod
+    def from_tokens(
+        cls,
+        tokenized: list[list[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> "BM25Index":
+        """トークン列のリストからインデックスを構築"""
+        term_ids: dict[str, int] = {}
+        rows_term: list[int] = []
+        rows_doc: list[int] = []
+        rows_tf: list[int] = []
+        doc_lens = np.zeros(len(tokenized), dtype=np.int32)
+
+        for doc_idx, tokens in enumerate(tokenized):
+            doc_lens[doc_idx] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                tid = term_ids.get(term)
+                if tid is None:
+                    tid = term_ids[term] = len(term_ids)
+                rows_term.append(tid)
+                rows_doc.append(doc_idx)
+                rows_tf.append(tf)
+
+        # term_id を語彙のソート順に振り直す（保存形式で二分探索できるように）
+        terms = sorted(term_ids)
+        remap = np.empty(len(terms), dtype=np.int64)
+        for new_id, term in enumerate(terms):
+            remap[term_ids[term]] = new_id
+        vocab = {term: i for i, term in enumerate(terms)}
+
+        term_arr = remap[np.asarray(rows_term, dtype=np.int64)] if rows_term else np.zeros(0, dtype=np.int64)
+        # 文書順に追加しているので stable sort で term 内のチャンク番号は昇順に保たれる
+        order = np.argsort(term_arr, kind="stable")
+        postings_docs = np.asarray(rows_doc, dtype=np.int32)[order]
+        postings_tfs = np.asarray(rows_tf, dtype=np.int32)[order]
+
+        counts = np.bincount(term_arr, minlength=len(terms))
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=term_offsets[1:])
+
+        return cls(vocab, term_offsets, postings_docs, postings_tfs, doc_lens, k1=k1, b=b, epsilon=epsilon)
+
+    def replace_docs(self, docs: dict[int, list[str]], n_docs: int | None = None) -> "BM25Index":
+        """一部のチャンクのトークン列を差し替えた新しいインデックスを返す
+
+        from_tokens に全トークン列を渡し直したのと同じインデックスになる。
+        差し替えないチャンクは既存の postings をそのまま使うので、全件を
+        トークン化し直す必要がない。
+
+        Args:
+            docs: チャンク番号 → 新しいトークン列（[] で空にする）
+            n_docs: 新しいチャンク数（末尾に追加する場合。省略時は現在の件数）
+        """
+        n = self.corpus_size if n_docs is None else n_docs
+        if n < self.corpus_size or any(not 0 <= i < n for i in docs):
+            raise ValueError("replace_docs: チャンク番号が範囲外です")
+
+        # 既存 postings（差し替え対象のチャンク分を除く）を (語, チャンク, tf) の列に戻す
+        old_terms = self.terms()
+        df = np.diff(np.asarray(self.term_offsets))
+        post_terms = np.repeat(np.arange(len(old_terms), dtype=np.int64), df)
+        post_docs = np.asarray(self.postings_docs, dtype=np.int64)
+        post_tfs = np.asarray(self.postings_tfs, dtype=np.int32)
+        replaced = np.fromiter(docs, dtype=np.int64, count=len(docs))
+        keep = ~np.isin(post_docs, replaced)
+        post_terms, post_docs, post_tfs = post_terms[keep], post_docs[keep], post_tfs[keep]
+
+        # 新しいトークン列の (語, チャンク, tf)
+        new_rows: list[tuple[str, int, int]] = []
+        for doc_idx, tokens in docs.items():
+            new_rows.extend((term, doc_idx, tf) for term, tf in Counter(tokens).items())
+
+        # 語彙をマージし、postings が残る語だけをソート順に振り直す
+        terms = sorted(set(old_terms).union(t for t, _, _ in new_rows))
+        term_index = {term: i for i, term in enumerate(terms)}
+        old_to_new = np.asarray([term_index[t] for t in old_terms], dtype=np.int64)
+        all_terms = np.concatenate([
+            old_to_new[post_terms],
+            np.asarray([term_index[t] for t, _, _ in new_rows], dtype=np.int64),
+        ])
+        all_docs = np.concatenate([post_docs, np.asarray([d for _, d, _ in new_rows], dtype=np.int64)])
+        all_tfs = np.concatenate([post_tfs, np.asarray([tf for _, _, tf in new_rows], dtype=np.int32)])
+
+        counts = np.bincount(all_terms, minlength=len(terms))
+        live = np.flatnonzero(counts)
+        remap = np.full(len(terms), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+        all_terms = remap[all_terms]
+        order = np.lexsort((all_docs, all_terms))
+
+        term_offsets = np.zeros(len(live) + 1, dtype=np.int64)
+        np.cumsum(counts[live], out=term_offsets[1:])
+
+        doc_lens = np.zeros(n, dtype=np.int32)
+        doc_lens[:self.corpus_size] = self.doc_lens
+        for doc_idx, tokens in docs.items():
+            doc_lens[doc_idx] = len(tokens)
+
+        vocab = {terms[i]: new_id for new_id, i in enumerate(live.tolist())}
+        return type(self)(
+            vocab, term_offsets, all_docs[order].astype(np.int32), all_tfs[order], doc_lens,
+            k1=self.k1, b=self.b, epsilon=self.epsilon,
+        )
+
+    def terms(self) -> list[str]:
+        """語彙を term_id 順（= ソート順）で返す"""
+        if isinstance(self.vocab, dict):
+            return sorted(self.vocab, key=self.vocab.get)
+        return [self.vocab[i].decode("utf-8") for i in range(len(self.vocab))]
+
+    # ------------------------------------------------------------------
+    # 永続化
+    # ------------------------------------------------------------------
+
+    def save(self, directory: Path, extra_meta: dict | None = None) -> None:
+        """インデックスをディレクトリに保存（一時ディレクトリ経由で置き換え）"""
+        directory = Path(directory)
+        tmp = make_tmp_dir(directory)
+
+        for name in _ARRAYS:
+            np.save(tmp / f"{name}.npy", np.asarray(getattr(self, name)))
+
+        # 語彙: term_id 順（= ソート順）に UTF-8 で連結
+        terms = self.terms()
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        with open(tmp / "vocab.bin", "wb") as f:
+            for i, term in enumerate(terms):
+                data = term.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(tmp / "vocab_offsets.npy", offsets)
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "epsilon": self.epsilon,
+            "avgdl": self.avgdl,
+            "average_idf": self.average_idf,
+            "n_docs": self.corpus_size,
+            "n_terms": len(terms),
+            **(extra_meta or {}),
+        }
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        replace_dir(tmp, directory)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "BM25Index":
+        """保存済みインデックスを開く（mmap=True なら配列はページ単位で遅延読み込み）"""
+        directory = Path(directory)
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"BM25インデックスの形式が未対応です: {directory}")
+
+        mode = "r" if mmap else None
+        obj = cls.__new__(cls)
+        for name in _ARRAYS:
+            setattr(obj, name, np.load(directory / f"{name}.npy", mmap_mode=mode))
+
+        vocab_offsets = np.load(directory / "vocab_offsets.npy", mmap_mode=mode)
+        vocab_path = directory / "vocab.bin"
+        if vocab_path.stat().st_size:
+            blob = np.memmap(vocab_path, dtype=np.uint8, mode="r") if mmap else np.fromfile(vocab_path, dtype=np.uint8)
+        else:
+            blob = np.zeros(0, dtype=np.uint8)
+        obj.vocab = _MappedVocab(blob, vocab_offsets)
+
+        obj.k1 = meta["k1"]
+        obj.b = meta["b"]
+        obj.epsilon = meta["epsilon"]
+        obj.avgdl = meta["avgdl"]
+        obj.average_idf = meta["average_idf"]
+        obj.corpus_size = meta["n_docs"]
+        obj.meta = meta
+        return obj
+
+    def _precompute(self) -> None:
+        """IDF・文書長正規化・term ごとの寄与上限を事前計算"""
+        n = self.corpus_size
+        df = np.diff(self.term_offsets).astype(np.float64)
+        avgdl = float(self.doc_lens.sum()) / n if n else 0.0
+        self.avgdl = avgdl
+
+        # rank_bm25 と同じ: log(N - df + 0.5) - log(df + 0.5)、負の IDF は eps * 平均IDF に置換
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5) if len(df) else np.zeros(0)
+        self.average_idf = float(idf.sum() / len(idf)) if len(idf) else 0.0
+        idf[idf < 0] = self.epsilon * self.average_idf
+        self.idf = idf
+
+        # 文書ごとの分母項 k1 * (1 - b + b * dl / avgdl)
+        if avgdl > 0:
+            self.doc_norm = self.k1 * (1 - self.b + self.b * self.doc_lens.astype(np.float64) / avgdl)
+        else:
+            self.doc_norm = np.full(n, self.k1, dtype=np.float64)
+
+        # term ごとの tf 項の最大値（MaxScore の上限計算用）
+        if len(self.postings_docs):
+            tf = self.postings_tfs.astype(np.float64)
+            w = tf * (self.k1 + 1) / (tf + self.doc_norm[self.postings_docs])
+            self.term_max = np.maximum.reduceat(w, self.term_offsets[:-1])
+        else:
+            self.term_max = np.zeros(len(df))
+
+    # ------------------------------------------------------------------
+    # 語彙・postings アクセス
+    # ------------------------------------------------------------------
+
+    def term_id(self, term: str) -> int | None:
+        """term の ID を返す（未登録なら None）"""
+        return self.vocab.get(term)
+
+    def _query_terms(self, tokens: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """クエリトークン → (term_id 配列, クエリ内出現回数)。未知語は除外"""
+        counts = Counter(tokens)
+        ids, qtfs = [], []
+        for term, qtf in counts.items():
+            tid = self.term_id(term)
+            if tid is not None:
+                ids.append(tid)
+                qtfs.append(qtf)
+        return np.asarray(ids, dtype=np.int64), np.asarray(qtfs, dtype=np.float64)
+
+    def _postings(
+        self,
+        tid: int,
+        qtf: float,
+        mask: np.ndarray | None = None,
+        ranges: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """term の (チャンク番号, スコア寄与) を返す
+
+        ranges（(R, 2) の [start, end) 昇順）を渡すと postings を二分探索で
+        範囲ごとに切り出し、範囲外の posting は読まない。
+        """
+        start, end = self.term_offsets[tid], self.term_offsets[tid + 1]
+        if ranges is not None:
+            all_docs = self.postings_docs[start:end]
+            lo = np.searchsorted(all_docs, ranges[:, 0])
+            hi = np.searchsorted(all_docs, ranges[:, 1])
+            sel = range_indices(np.stack([lo, hi], axis=1)) + start
+            docs = np.asarray(self.postings_docs[sel])
+            tf = np.asarray(self.postings_tfs[sel], dtype=np.float64)
+        else:
+            docs = np.asarray(self.postings_docs[start:end])
+            tf = np.asarray(self.postings_tfs[start:end], dtype=np.float64)
+        if mask is not None:
+            keep = mask[docs]
+            docs, tf = docs[keep], tf[keep]
+        contrib = (qtf * self.idf[tid]) * (tf * (self.k1 + 1) / (tf + self.doc_norm[docs]))
+        return docs, contrib
+
+    # ------------------------------------------------------------------
+    # スコア計算
+    # ------------------------------------------------------------------
+
+    def get_scores(self, tokens: list[str]) -> np.ndarray:
+        """全チャンクのスコアを返す（BM25Okapi.get_scores 互換）"""
+        scores = np.zeros(self.corpus_size)
+        ids, qtfs = self._query_terms(tokens)
+        for tid, qtf in zip(ids, qtfs):
+            docs, contrib = self._postings(int(tid), qtf)
+            scores[docs] += contrib
+        return scores
+
+    def top_k(
+        self,
+        tokens: list[str],
+        k: int,
+        mask: np.ndarray | None = None,
+        ranges: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """上位K件の (チャンク番号, スコア) をスコア降順で返す
+
+        クエリ語を1つも含まないチャンクは返さない。
+
+        Args:
+            tokens: クエリトークン
+            k: 返す件数
+            mask: 検索対象チャンクの bool 配列（None なら全件）
+            ranges: 検索対象チャンクの [start, end) 範囲 (R, 2)。
+                    postings を範囲で切り出すので、コストは対象範囲の大きさに比例する
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        ids, qtfs = self._query_terms(tokens)
+        if k <= 0 or len(ids) == 0:
+            return empty
+
+        # 負の IDF が残る（平均IDFが負の極小コーパス）場合は上限が成り立たないので全件計算
+        if np.any(self.idf[ids] < 0):
+            scores = self.get_scores(tokens)
+            touched = np.zeros(self.corpus_size, dtype=bool)
+            for tid in ids:
+                touched[self.postings_docs[self.term_offsets[tid]:self.term_offsets[tid + 1]]] = True
+            if mask is not None:
+                touched &= mask
+            if ranges is not None:
+                touched &= in_ranges(np.arange(self.corpus_size), ranges)
+            cand = np.flatnonzero(touched)
+            return _select_top(cand, scores[cand], k)
+
+        upper = self.idf[ids] * self.term_max[ids] * qtfs
+        order = np.argsort(-upper, kind="stable")
+        ids, qtfs, upper = ids[order], qtfs[order], upper[order]
+        # remaining[i] = i 番目以降の語の寄与上限合計
+        remaining = np.concatenate([np.cumsum(upper[::-1])[::-1], [0.0]])
+
+        cand_docs = np.zeros(0, dtype=np.int64)
+        cand_scores = np.zeros(0)
+        accepting = True
+
+        for i, (tid, qtf) in enumerate(zip(ids, qtfs)):
+            docs, contrib = self._postings(int(tid), qtf, mask, ranges)
+
+            if accepting:
+                merged = np.concatenate([cand_docs, docs])
+                uniq, inv = np.unique(merged, return_inverse=True)
+                cand_scores = np.bincount(inv, weights=np.concatenate([cand_scores, contrib]),
+                                          minlength=len(uniq))
+                cand_docs = uniq
+            else:
+                # 新規候補は追加せず、既存候補のスコアだけ更新
+                if len(docs):
+                    pos = np.minimum(np.searchsorted(docs, cand_docs), len(docs) - 1)
+                    hit = docs[pos] == cand_docs
+                    cand_scores[hit] += contrib[pos[hit]]
+
+            rest = remaining[i + 1]
+            if len(cand_docs) >= k and rest > 0:
+                theta = np.partition(cand_scores, len(cand_scores) - k)[len(cand_scores) - k]
+                # K位と同点（_TIE_RTOL 以内）になりうるものは残す
+                theta -= _TIE_RTOL * abs(theta)
+                if rest < theta:
+                    # 未出現チャンクは最大でも rest 点 → 上位Kに入れない
+                    accepting = False
+                    alive = cand_scores + rest >= theta
+                    cand_docs, cand_scores = cand_docs[alive], cand_scores[alive]
+
+        return _select_top(cand_docs, cand_scores, k)
+
+    def search_many(
+        self,
+        queries: list[list[str]],
+        k: int | list[int],
+        masks: list[np.ndarray | None] | None = None,
+        ranges: list[np.ndarray | None] | None = None,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """複数クエリの上位K件をまとめて返す（各要素は top_k() と同じ形式）
+
+        クエリ展開の変種は語の多くが重なるので、全クエリの異なる語ごとに
+        postings を1回だけ読んで寄与を計算し、(クエリ数 × 候補チャンク数) の
+        スコア行列を行列積1回で作る。単一クエリは MaxScore の top_k() に任せる。
+
+        Args:
+            queries: クエリトークンのリスト
+            k: 返す件数（クエリごとに変える場合はリスト）
+            masks: クエリごとの検索対象チャンクの bool 配列（None なら全件）
+            ranges: クエリごとの検索対象チャンクの範囲（top_k() の ranges と同じ）。
+                    全クエリに範囲がある場合は postings をその和集合だけ読む
+        """
+        n = len(queries)
+        ks = [k] * n if isinstance(k, int) else list(k)
+        masks = masks or [None] * n
+        ranges = ranges or [None] * n
+        if n == 1:
+            return [self.top_k(queries[0], ks[0], mask=masks[0], ranges=ranges[0])]
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        # 全クエリの異なる語 → 列番号、クエリ × 語 のクエリ内出現回数
+        columns: dict[int, int] = {}
+        entries = []
+        for q, tokens in enumerate(queries):
+            ids, qtfs = self._query_terms(tokens)
+            for tid, qtf in zip(ids.tolist(), qtfs.tolist()):
+                entries.append((q, columns.setdefault(tid, len(columns)), qtf))
+        if not columns:
+            return [empty] * n
+        weights = np.zeros((n, len(columns)))
+        for q, col, qtf in entries:
+            weights[q, col] = qtf
+
+        # 語ごとの寄与（語 × 候補チャンク）は1回だけ計算し、行列積で全クエリに配る
+        union = None
+        if all(r is not None for r in ranges):
+            union = _union_ranges([r for r in ranges if len(r)])
+        postings = [self._postings(tid, 1.0, ranges=union) for tid in columns]
+        seen = np.zeros(self.corpus_size, dtype=bool)
+        for docs, _ in postings:
+            seen[docs] = True
+        cand = np.flatnonzero(seen)
+        position = np.empty(self.corpus_size, dtype=np.int64)
+        position[cand] = np.arange(len(cand))
+        contribs = np.zeros((len(columns), len(cand)))
+        present = np.zeros((len(columns), len(cand)), dtype=np.float32)
+        for col, (docs, contrib) in enumerate(postings):
+            pos = position[docs]
+            contribs[col, pos] = contrib
+            present[col, pos] = 1.0
+        scores = weights @ contribs
+        touched = (weights > 0).astype(np.float32) @ present > 0
+        for q, (mask, rng) in enumerate(zip(masks, ranges)):
+            if mask is not None:
+                touched[q] &= mask[cand]
+            if rng is not None:
+                touched[q] &= in_ranges(cand, rng)
+        scores[~touched] = -np.inf
+
+        # 行ごとの K 位スコアを一括で求め、それ以上の候補だけを並べる
+        k_max = min(max(ks), len(cand))
+        if k_max <= 0:
+            return [empty] * n
+        top = -np.partition(-scores, k_max - 1, axis=1)[:, :k_max]
+        top.sort(axis=1)
+        kth = top[np.arange(n), np.clip(k_max - np.asarray(ks), 0, k_max - 1)]
+
+        results = []
+        kth = kth - _TIE_RTOL * np.abs(kth)  # K位と同点（_TIE_RTOL 以内）のものも残す
+        for q in range(n):
+            sel = np.flatnonzero((scores[q] >= kth[q]) & touched[q])
+            if ks[q] <= 0 or not len(sel):
+                results.append(empty)
+                continue
+            results.append(_select_top(cand[sel], scores[q, sel], ks[q]))
+        return results
+
+
+def _union_ranges(ranges: list[np.ndarray]) -> np.ndarray:
+    """複数の範囲リストの和集合（昇順、重なり・隣接は結合）"""
+    if not ranges:
+        return np.zeros((0, 2), dtype=np.int64)
+    spans = np.concatenate(ranges)
+    spans = spans[np.argsort(spans[:, 0], kind="stable")]
+    merged = [list(spans[0])]
+    for s, e in spans[1:]:
+        if s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return np.asarray(merged, dtype=np.int64)
+
+
+def _select_top(docs: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """スコア降順（同点はチャンク番号昇順）で上位K件を返す
+
+    相対差が _TIE_RTOL 以内のスコアは同点として扱う（top_k と search_many で
+    寄与の加算順が違い、末尾のビットだけ異なることがあるため）。
+    """
+    if len(docs) > k:
+        # K位と同点のものは全て残してから並べる（同点の順序を安定させる）
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= kth - _TIE_RTOL * abs(kth)
+        docs, scores = docs[keep], scores[keep]
+    order = np.lexsort((docs, -scores))
+    docs, scores = docs[order], scores[order]
+    # 隣とのスコア差が許容内なら同じグループにし、グループ内はチャンク番号順
+    gap = (scores[:-1] - scores[1:]) > _TIE_RTOL * np.abs(scores[1:])
+    group = np.concatenate([[0], np.cumsum(gap)])
+    order = np.lexsort((docs, group))[:k]
+    return docs[order], scores[order]
@@ -0,0 +1,328 @@
+"""チャンクストア - chunks.json のバイナリ版（本文は mmap、必要なチャンクだけ読む）
+
+chunks.json は全チャンクの本文を含むため、検索プロセスごとに json.load すると
+起動が遅くメモリも食う。ここでは本文を1つの UTF-8 blob にまとめ、
+チャンク番号 → バイトオフセットで必要な分だけデコードする。
+
+searcher / vector_search / chunk_summarizer / cross_reference は get_store() で
+プロセスに1つのストアを共有する（モジュールごとに chunks.json のコピーを持たない）。
+
+ディレクトリ構成（data/index/chunk_store/）:
+- meta.json:             件数と元の chunks.json のサイズ・mtime（鮮度チェック用）
+- columns.json:          doc_id / filename の値の一覧（重複なし）
+- doc_codes.npy:         各チャンクの doc_id の番号（columns.json の doc_id の添字）
+- filename_codes.npy:    各チャンクの filename の番号
+- chunk_ids.bin:         chunk_id の UTF-8 連結
+- chunk_id_offsets.npy:  chunk_id のバイトオフセット（長さ N+1）
+- texts.bin:             本文の UTF-8 連結
+- text_offsets.npy:      本文のバイトオフセット（長さ N+1）
+- bigrams.npy:           本文の文字 bigram シグネチャの連結（チャンクごとに昇順・重複なし）
+- bigram_offsets.npy:    bigrams.npy のチャンクごとの開始位置（長さ N+1）
+
+bigram シグネチャは小文字化した本文の隣り合う2文字を (前の文字 << 21 | 後の文字) の
+int64 に詰めたもの（衝突しない）。両方が空白の bigram は含めない。
+reranker の Colbert 風スコアが候補ごとに本文を読まずに配列演算で重なりを数えるのに使う。
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+INDEX_DIR = DATA_DIR / "index"
+STORE_DIR = INDEX_DIR / "chunk_store"
+
+# chunks.json の候補パス（index優先、なければ data/ 直下）
+CHUNKS_CANDIDATES = [
+    INDEX_DIR / "chunks.json",
+    DATA_DIR / "chunks.json",
+]
+
+FORMAT_VERSION = 3
+
+# str.isspace() が True になる文字は全て U+3000 以下
+_SPACE_TABLE = np.array([chr(c).isspace() for c in range(0x3001)], dtype=bool)
+
+# プロセス共通のストア（get_store で初回に開く）
+_shared: ChunkStore | None = None
+_shared_lock = threading.Lock()
+
+
+def source_signature(path: Path) -> dict:
+    """元ファイルのサイズと mtime（鮮度チェック用）"""
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _write_blob(path: Path, strings, n: int) -> np.ndarray:
+    """文字列を UTF-8 で連結して書き出し、バイトオフセット（長さ n+1）を返す"""
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    with open(path, "wb") as f:
+        for i, text in enumerate(strings):
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    return offsets
+
+
+def _encode(values) -> tuple[np.ndarray, list[str]]:
+    """文字列の列 → (番号の配列, 値の一覧)"""
+    index: dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int32)
+    return codes, list(index)
+
+
+def bigram_signature(text: str) -> np.ndarray:
+    """文字 bigram シグネチャ（int64 の昇順・重複なし。両方が空白の bigram は除く）"""
+    codes = np.frombuffer(text.lower().encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if len(codes) < 2:
+        return np.zeros(0, dtype=np.int64)
+    space = np.zeros(len(codes), dtype=bool)
+    small = codes < len(_SPACE_TABLE)
+    space[small] = _SPACE_TABLE[codes[small]]
+    keep = ~(space[:-1] & space[1:])
+    return np.unique(((codes[:-1] << 21) | codes[1:])[keep])
+
+
+def _write_bigrams(directory: Path, texts, n: int) -> None:
+    """本文ごとの bigram シグネチャを連結して書き出す"""
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    parts = []
+    for i, text in enumerate(texts):
+        sig = bigram_signature(text)
+        parts.append(sig)
+        offsets[i + 1] = offsets[i] + len(sig)
+    values = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+    np.save(directory / "bigrams.npy", values)
+    np.save(directory / "bigram_offsets.npy", offsets)
+
+
+def write_store(chunks: list[dict], directory: Path | None = None, source: Path | None = None) -> None:
+    """チャンクリストをストア形式で書き出す（一時ディレクトリ経由で置き換え）
+
+    複数プロセスが同時に作り直した場合は先に置き換えたものが残る。
+    """
+    directory = directory or STORE_DIR
+    tmp = make_tmp_dir(directory)
+
+    n = len(chunks)
+    np.save(tmp / "text_offsets.npy", _write_blob(tmp / "texts.bin", (c["text"] for c in chunks), n))
+    np.save(tmp / "chunk_id_offsets.npy",
+            _write_blob(tmp / "chunk_ids.bin", (c["chunk_id"] for c in chunks), n))
+    _write_bigrams(tmp, (c["text"] for c in chunks), n)
+
+    doc_codes, doc_values = _encode(c["doc_id"] for c in chunks)
+    filename_codes, filename_values = _encode(c.get("filename", "") for c in chunks)
+    np.save(tmp / "doc_codes.npy", doc_codes)
+    np.save(tmp / "filename_codes.npy", filename_codes)
+    with open(tmp / "columns.json", "w", encoding="utf-8") as f:
+        json.dump({"doc_id": doc_values, "filename": filename_values}, f, ensure_ascii=False)
+
+    meta = {"version": FORMAT_VERSION, "n_chunks": n}
+    if source is not None and source.exists():
+        meta["source"] = source_signature(source)
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    replace_dir(tmp, directory)
+
+
+def make_tmp_dir(directory: Path) -> Path:
+    """directory を差し替えるための一時ディレクトリ（呼ぶたびに別名なので同時に作っても衝突しない）"""
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=directory.name + ".tmp.", dir=directory.parent))
+    tmp.chmod(0o755)
+    return tmp
+
+
+def replace_dir(tmp: Path, directory: Path) -> bool:
+    """tmp を directory に差し替える（既存を開いているプロセスは旧ファイルを読み続けられる）
+
+    別プロセスが先に差し替えた場合は tmp を捨てて False を返す（directory は相手のもの）。
+    """
+    old = tmp.with_name(tmp.name + ".old")
+    if old.exists():
+        shutil.rmtree(old)
+    try:
+        directory.rename(old)
+    except FileNotFoundError:
+        pass  # 無い、または別プロセスが先に退避した
+    try:
+        tmp.rename(directory)
+        replaced = True
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        replaced = False
+    shutil.rmtree(old, ignore_errors=True)
+    return replaced
+
+
+def _open_blob(path: Path) -> np.ndarray:
+    if path.stat().st_size:
+        return np.memmap(path, dtype=np.uint8, mode="r")
+    return np.zeros(0, dtype=np.uint8)
+
+
+class ChunkStore:
+    """mmap した本文 blob と列へのシーケンス風アクセス
+
+    doc_id / filename は値の一覧と番号の配列で持ち、chunk_id と本文は必要な分だけ
+    デコードする。chunk_id → 行番号の辞書（index_of）と行ごとの doc_id の一覧
+    （doc_ids）は初回アクセス時に作る。
+    """
+
+    def __init__(self, directory: Path | None = None) -> None:
+        directory = directory or STORE_DIR
+        self.directory = directory
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"チャンクストアの形式が古いです: {directory}")
+        with open(directory / "columns.json", encoding="utf-8") as f:
+            columns = json.load(f)
+        self.doc_id_values: list[str] = columns["doc_id"]
+        self.filename_values: list[str] = columns["filename"]
+        self.doc_codes = np.load(directory / "doc_codes.npy", mmap_mode="r")
+        self.filename_codes = np.load(directory / "filename_codes.npy", mmap_mode="r")
+        self._id_offsets = np.load(directory / "chunk_id_offsets.npy", mmap_mode="r")
+        self._id_blob = _open_blob(directory / "chunk_ids.bin")
+        self._offsets = np.load(directory / "text_offsets.npy", mmap_mode="r")
+        self._blob = _open_blob(directory / "texts.bin")
+        self.bigrams = np.load(directory / "bigrams.npy", mmap_mode="r")
+        self.bigram_offsets = np.load(directory / "bigram_offsets.npy", mmap_mode="r")
+        self._doc_ids: list[str] | None = None
+        self._row_of: dict[str, int] | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_codes)
+
+    def __getitem__(self, idx: int) -> dict:
+        return {
+            "doc_id": self.doc_id(idx),
+            "filename": self.filename(idx),
+            "chunk_id": self.chunk_id(idx),
+            "text": self.text(idx),
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def doc_id(self, idx: int) -> str:
+        return self.doc_id_values[self.doc_codes[idx]]
+
+    def filename(self, idx: int) -> str:
+        return self.filename_values[self.filename_codes[idx]]
+
+    def chunk_id(self, idx: int) -> str:
+        start, end = int(self._id_offsets[idx]), int(self._id_offsets[idx + 1])
+        return self._id_blob[start:end].tobytes().decode("utf-8")
+
+    def text(self, idx: int) -> str:
+        """チャンク本文（このチャンクの分だけデコード）"""
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def bigram_overlap(self, rows: np.ndarray, signature: np.ndarray) -> np.ndarray:
+        """rows の各チャンクの bigram のうち signature（昇順）に含まれるものの数"""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.bigram_offsets[rows]
+        lengths = self.bigram_offsets[rows + 1] - starts
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        # 各チャンクの区間をまとめて1回で取り出す
+        positions = np.arange(bounds[-1]) + np.repeat(starts - bounds[:-1], lengths)
+        values = self.bigrams[positions]
+        if not len(signature) or not len(values):
+            return np.zeros(len(rows), dtype=np.int64)
+        found = np.minimum(np.searchsorted(signature, values), len(signature) - 1)
+        hits = np.concatenate([[0], np.cumsum(signature[found] == values)])
+        return hits[bounds[1:]] - hits[bounds[:-1]]
+
+    @property
+    def doc_ids(self) -> list[str]:
+        """行ごとの doc_id（値は doc_id_values の文字列を共有）"""
+        if self._doc_ids is None:
+            values = self.doc_id_values
+            self._doc_ids = [values[c] for c in self.doc_codes.tolist()]
+        return self._doc_ids
+
+    def chunk_ids(self) -> list[str]:
+        """全 chunk_id（呼ぶたびにデコードする）"""
+        blob = self._id_blob.tobytes().decode("utf-8")
+        if blob.isascii():
+            offsets = self._id_offsets.tolist()
+            return [blob[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+        return [self.chunk_id(i) for i in range(len(self))]
+
+    def index_of(self, chunk_id: str) -> int | None:
+        """chunk_id の行番号（無ければ None）"""
+        if self._row_of is None:
+            with self._lock:
+                if self._row_of is None:
+                    self._row_of = {cid: i for i, cid in enumerate(self.chunk_ids())}
+        return self._row_of.get(chunk_id)
+
+    def is_fresh(self, source: Path) -> bool:
+        """ストアが元の chunks.json と同期しているか"""
+        return source.exists() and self.meta.get("source") == source_signature(source)
+
+
+def open_store(source: Path | None = None, directory: Path | None = None) -> ChunkStore | None:
+    """ストアを開く。存在しない・形式が古い・古い（source と不一致）場合は None"""
+    directory = directory or STORE_DIR
+    if not (directory / "meta.json").exists():
+        return None
+    try:
+        store = ChunkStore(directory)
+    except ValueError:
+        return None
+    if source is not None and not store.is_fresh(source):
+        return None
+    return store
+
+
+def find_chunks_path() -> Path | None:
+    """chunks.json のパス（index優先、なければ data/ 直下。どちらも無ければ None）"""
+    return next((p for p in CHUNKS_CANDIDATES if p.exists()), None)
+
+
+def get_store() -> ChunkStore:
+    """プロセス共通のチャンクストア（初回に開く）
+
+    ストアが無い・chunks.json より古い場合は chunks.json から作り直す。
+    chunks.json が無くストアだけある場合はそのまま開く。
+    """
+    global _shared
+    if _shared is not None:
+        return _shared
+    with _shared_lock:
+        if _shared is not None:
+            return _shared
+        source = find_chunks_path()
+        store = open_store(source=source)
+        if store is None and source is not None:
+            with open(source, encoding="utf-8") as f:
+                chunks = json.load(f)
+            write_store(chunks, source=source)
+            del chunks
+            store = ChunkStore()
+        if store is None:
+            raise FileNotFoundError(
+                "chunks.json が見つかりません。候補: " + ", ".join(str(p) for p in CHUNKS_CANDIDATES)
+            )
+        _shared = store
+        return _shared
+
+
+def reset_store() -> None:
+    """共有ストアを破棄する（インデックス更新後。次の get_store で開き直す）"""
+    global _shared
+    with _shared_lock:
+        _shared = None
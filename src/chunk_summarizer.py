@@ -1,14 +1,39 @@
-"""チャンク要約インデックス - LLMで各チャンクを要約し、要約もBM25検索対象にする"""
+"""チャンク要約インデックス - LLMで各チャンクを要約し、要約もBM25検索対象にする
+
+要約の生成（build_summaries）:
+- AsyncOpenAI で SUMMARY_CONCURRENCY 本のリクエストを並行に投げる
+- 1リクエストに SUMMARY_BATCH_SIZE 件のチャンクをまとめ、JSON で要約を返させる。
+  JSON が壊れている・抜けているチャンクは1件ずつ投げ直す
+- 失敗したリクエストは指数バックオフで SUMMARY_MAX_RETRIES 回まで再試行する
+- 生成した要約はリクエストごとに summaries.log.jsonl に追記する。中断しても次回は
+  summaries.json + ログから再開し、完了時に summaries.json にまとめてログを消す
+
+要約の BM25 インデックスは本文インデックスと同じ形式（src/bm25_index.BM25Index）で
+data/index/summary_bm25/ に保存し、検索プロセスは mmap で開く。チャンクは共有チャンク
+ストアを使う。build_summaries で追加した要約はその分だけトークン化して差し替える。
+"""
 
+import asyncio
+import hashlib
 import json
+import random
 import time
 from pathlib import Path
-from rank_bm25 import BM25Okapi
-from fugashi import Tagger
 
-from src.llm_client import create_client, chat
+import openai
+from openai import AsyncOpenAI
+
+from src import search_cache
+from src.bm25_index import BM25Index
+from src.chunk_store import find_chunks_path, get_store, source_signature
+from src.config import SUMMARY_BATCH_SIZE, SUMMARY_CONCURRENCY, SUMMARY_MAX_RETRIES, get_llm_config
+from src.doc_filter import DocRanges
+from src.tokenizer import tokenize_many, tokenize_query
 
 INDEX_DIR = Path(__file__).parent.parent / "data" / "index"
+SUMMARIES_PATH = INDEX_DIR / "summaries.json"
+CHECKPOINT_PATH = INDEX_DIR / "summaries.log.jsonl"
+SUMMARY_BM25_DIR = INDEX_DIR / "summary_bm25"
 
 SUMMARY_PROMPT = """\
 以下の技術文書の一部を、検索しやすいように50文字以内で要約してください。
@@ -19,150 +44,389 @@ SUMMARY_PROMPT = """\
 {text}
 """
 
-_bm25_summary = None
-_summaries = None
-_chunks = None
-_tagger = None
-
-
-def build_summaries(batch_size: int = 10, max_chunks: int = None):
-    """全チャンクの要約を生成して保存"""
-    chunks_path = INDEX_DIR / "chunks.json"
-    if not chunks_path.exists():
-        print("Error: chunks.json が見つかりません。")
-        return
-
-    with open(chunks_path, encoding="utf-8") as f:
-        chunks = json.load(f)
-
-    if max_chunks:
-        chunks = chunks[:max_chunks]
-
-    # 既存の要約があれば読み込み（途中再開対応）
-    summaries_path = INDEX_DIR / "summaries.json"
-    existing = {}
-    if summaries_path.exists():
-        with open(summaries_path, encoding="utf-8") as f:
-            existing = json.load(f)
-
-    client, model = create_client()
-    total = len(chunks)
-    new_count = 0
+SUMMARY_BATCH_PROMPT = """\
+以下の技術文書の一部（{n} 件）を、それぞれ検索しやすいように50文字以内で要約してください。
+日常的な言葉を使って、内容のキーワードを含めてください。
+次の形式の JSON のみ出力してください（id は各テキストの番号）:
+{{"summaries": [{{"id": 1, "summary": "..."}}, {{"id": 2, "summary": "..."}}]}}
 
-    print(f"📝 {total} チャンクの要約を生成中（既存: {len(existing)} 件）...")
+{texts}
+"""
 
-    for i, chunk in enumerate(chunks):
-        chunk_id = chunk["chunk_id"]
+TEXT_LIMIT = 500          # 要約対象は先頭500文字
+RETRY_BASE_DELAY = 1.0    # 再試行の待ち時間（秒、2倍ずつ増やす）
+RETRY_MAX_DELAY = 30.0
+PROGRESS_INTERVAL = 10.0  # 進捗表示の間隔（秒）
 
-        # 既に要約済みならスキップ
-        if chunk_id in existing:
+_bm25_summary = None
+_summaries = None
+_chunks = None
+_doc_ranges: DocRanges | None = None
+
+
+def _load_summaries() -> dict[str, str]:
+    """summaries.json にチェックポイントログを重ねた要約（後の行が優先）"""
+    summaries = {}
+    if SUMMARIES_PATH.exists():
+        with open(SUMMARIES_PATH, encoding="utf-8") as f:
+            summaries = json.load(f)
+    if CHECKPOINT_PATH.exists():
+        with open(CHECKPOINT_PATH, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 中断時に書きかけだった行
+                summaries[record["chunk_id"]] = record["summary"]
+    return summaries
+
+
+def _save_summaries(summaries: dict[str, str]):
+    """summaries.json を書き直し、取り込み済みのチェックポイントログを消す"""
+    tmp = SUMMARIES_PATH.with_name(SUMMARIES_PATH.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summaries, f, ensure_ascii=False, indent=1)
+    tmp.replace(SUMMARIES_PATH)
+    CHECKPOINT_PATH.unlink(missing_ok=True)
+
+
+def _parse_batch(content: str, n: int) -> dict[int, str]:
+    """バッチ応答の JSON から {番号: 要約}（壊れていれば取れた分だけ）"""
+    start, end = content.find("{"), content.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    items = data.get("summaries", []) if isinstance(data, dict) else []
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
             continue
-
-        text = chunk["text"][:500]  # 要約対象は先頭500文字
-        prompt = SUMMARY_PROMPT.format(text=text)
-
         try:
-            response = chat(
-                client, model,
-                [{"role": "user", "content": prompt}],
-                tools=None,
-            )
-            summary = (response.content or "").strip()
-            existing[chunk_id] = summary
-            new_count += 1
-
-            if new_count % 50 == 0:
-                print(f"  [{i+1}/{total}] {new_count} 件生成済み...")
-                # 定期保存
-                with open(summaries_path, "w", encoding="utf-8") as f:
-                    json.dump(existing, f, ensure_ascii=False, indent=1)
-
-            # レート制限対策
-            time.sleep(0.1)
-
-        except Exception as e:
-            print(f"  Warning: {chunk_id} の要約生成失敗: {e}")
-            time.sleep(1)
+            idx = int(item.get("id"))
+        except (TypeError, ValueError):
             continue
+        summary = str(item.get("summary") or "").strip()
+        if 1 <= idx <= n and summary:
+            parsed[idx] = summary
+    return parsed
+
+
+class _SummaryRun:
+    """1回の build_summaries の非同期パイプライン（リクエスト・再試行・ログ追記・進捗）"""
+
+    def __init__(self, store, pending: list[tuple[str, int]], concurrency: int, batch_size: int,
+                 max_retries: int):
+        cfg = get_llm_config()
+        self.client = AsyncOpenAI(base_url=cfg["base_url"], api_key=cfg["api_key"])
+        self.model = cfg["model"]
+        self.store = store
+        self.pending = pending
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max(0, max_retries)
+        self.json_mode = True  # response_format が使えないサーバでは False にする
+        self.done = 0
+        self.failed = 0
+        self.requests = 0
+        self.retries = 0
+        self.output_tokens = 0
+        self.t0 = time.perf_counter()
+        self._last_report = self.t0
+
+    async def _complete(self, prompt: str, structured: bool) -> str:
+        """1リクエスト（一時的なエラーは指数バックオフで再試行）"""
+        attempt = 0
+        while True:
+            kwargs = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+            if structured and self.json_mode:
+                kwargs["response_format"] = {"type": "json_object"}
+            try:
+                self.requests += 1
+                response = await self.client.chat.completions.create(**kwargs)
+            except openai.BadRequestError:
+                if "response_format" not in kwargs:
+                    raise
+                self.json_mode = False  # JSON モード非対応。プロンプトの指示だけで続ける
+                continue
+            except (openai.AuthenticationError, openai.PermissionDeniedError, openai.NotFoundError):
+                raise
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+            usage = getattr(response, "usage", None)
+            self.output_tokens += getattr(usage, "completion_tokens", 0) or 0
+            return response.choices[0].message.content or ""
+
+    async def _summarize(self, batch: list[tuple[str, int]]) -> dict[str, str]:
+        """チャンクのまとまりを要約する。バッチで取れなかった分は1件ずつ投げ直す"""
+        batch = [(chunk_id, self.store.text(row)[:TEXT_LIMIT]) for chunk_id, row in batch]
+        results = {}
+        if len(batch) > 1:
+            texts = "\n\n".join(f"[{i}]\n{text}" for i, (_, text) in enumerate(batch, 1))
+            try:
+                content = await self._complete(
+                    SUMMARY_BATCH_PROMPT.format(n=len(batch), texts=texts), structured=True)
+                parsed = _parse_batch(content, len(batch))
+                results = {batch[i - 1][0]: s for i, s in parsed.items()}
+            except Exception as e:
+                print(f"  Warning: バッチ要約失敗（{len(batch)} 件を1件ずつ再試行）: {e}")
+
+        for chunk_id, text in batch:
+            if chunk_id in results:
+                continue
+            try:
+                content = await self._complete(SUMMARY_PROMPT.format(text=text), structured=False)
+            except Exception as e:
+                print(f"  Warning: {chunk_id} の要約生成失敗: {e}")
+                continue
+            if content.strip():
+                results[chunk_id] = content.strip()
+        return results
+
+    def _report(self, total: int, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        elapsed = now - self.t0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = total - self.done - self.failed
+        eta = f"{remaining / rate / 60:.1f} 分" if rate > 0 else "-"
+        print(f"  [{self.done + self.failed}/{total}] {self.done} 件生成, {self.failed} 件失敗, "
+              f"{rate:.1f} 件/秒, 残り約 {eta}")
+
+    async def run(self, log) -> dict[str, str]:
+        """未要約のチャンクを全て要約し、生成分を返す（生成のたびにログへ追記）"""
+        batches = iter(
+            self.pending[i:i + self.batch_size] for i in range(0, len(self.pending), self.batch_size)
+        )
+        generated = {}
+        total = len(self.pending)
+
+        async def worker():
+            for batch in batches:
+                results = await self._summarize(batch)
+                if results:
+                    log.write("".join(
+                        json.dumps({"chunk_id": cid, "summary": s}, ensure_ascii=False) + "\n"
+                        for cid, s in results.items()
+                    ))
+                    log.flush()
+                    generated.update(results)
+                self.done += len(results)
+                self.failed += len(batch) - len(results)
+                self._report(total)
 
-    # 最終保存
-    with open(summaries_path, "w", encoding="utf-8") as f:
-        json.dump(existing, f, ensure_ascii=False, indent=1)
-
-    # BM25インデックスを構築
-    _build_summary_bm25(chunks, existing)
-
-    print(f"✅ 要約生成完了: {len(existing)} 件（新規: {new_count}）")
-
-
-def _build_summary_bm25(chunks: list, summaries: dict):
-    """要約テキストのBM25インデックスを構築"""
-    tagger = Tagger()
-
-    tokenized = []
-    for chunk in chunks:
-        summary = summaries.get(chunk["chunk_id"], "")
-        tokens = [w.surface for w in tagger(summary) if len(w.surface) > 1 or not w.surface.isascii()]
-        tokenized.append(tokens)
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            await self.client.close()
+        self._report(total, force=True)
+        return generated
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.t0
+        return {
+            "generated": self.done,
+            "failed": self.failed,
+            "requests": self.requests,
+            "retries": self.retries,
+            "elapsed_sec": round(elapsed, 2),
+            "chunks_per_sec": round(self.done / elapsed, 2) if elapsed > 0 else 0.0,
+            "output_tokens_per_sec": round(self.output_tokens / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def build_summaries(batch_size: int | None = None, max_chunks: int = None,
+                    concurrency: int | None = None, max_retries: int | None = None) -> dict | None:
+    """全チャンクの要約を生成して保存（中断しても次回は続きから）
+
+    Returns:
+        生成件数・失敗件数・リクエスト数・再試行数・スループット
+    """
+    try:
+        store = get_store()
+    except FileNotFoundError:
+        print("Error: chunks.json が見つかりません。")
+        return None
+
+    n = min(len(store), max_chunks) if max_chunks else len(store)
+
+    # 既存の要約 + 前回中断時のチェックポイントログ（途中再開対応）
+    existing = _load_summaries()
+    previous_digest = _summaries_digest(existing)
+    chunk_ids = store.chunk_ids()
+    pending = [(chunk_ids[i], i) for i in range(n) if chunk_ids[i] not in existing]
+
+    run = _SummaryRun(
+        store, pending,
+        concurrency=concurrency or SUMMARY_CONCURRENCY,
+        batch_size=batch_size or SUMMARY_BATCH_SIZE,
+        max_retries=SUMMARY_MAX_RETRIES if max_retries is None else max_retries,
+    )
+    print(f"📝 {n} チャンクの要約を生成中（既存: {len(existing)} 件, 未要約: {len(pending)} 件, "
+          f"並列 {run.concurrency}, {run.batch_size} 件/リクエスト）...")
+
+    added = {}
+    if pending:
+        CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(CHECKPOINT_PATH, "a", encoding="utf-8") as log:
+            added = asyncio.run(run.run(log))
+        existing.update(added)
+
+    # 最終保存（ログを summaries.json に取り込む）
+    _save_summaries(existing)
+
+    # BM25インデックスを更新（追加分だけトークン化して差し替え）
+    _update_summary_bm25(store, existing, added, previous_digest)
+
+    stats = run.stats()
+    print(f"✅ 要約生成完了: {len(existing)} 件（新規: {stats['generated']}, 失敗: {stats['failed']}）")
+    print(f"   {stats['elapsed_sec']:.1f} 秒, {stats['chunks_per_sec']:.1f} 件/秒, "
+          f"{stats['output_tokens_per_sec']:.0f} 出力トークン/秒, "
+          f"リクエスト {stats['requests']} 回（再試行 {stats['retries']} 回）")
+    return stats
+
+
+def patch_summaries(chunks: list[dict], stale_ids: set[str]):
+    """内容が変わった・消えたチャンクの要約を破棄し、要約インデックスを作り直す
+
+    破棄した分は次回の build_summaries で再生成される（既存要約はスキップされる）。
+    """
+    if not SUMMARIES_PATH.exists() and not CHECKPOINT_PATH.exists():
+        return
 
-    tokens_path = INDEX_DIR / "summary_tokens.json"
-    with open(tokens_path, "w", encoding="utf-8") as f:
-        json.dump(tokenized, f, ensure_ascii=False)
+    existing = _load_summaries()
+
+    current_ids = {c["chunk_id"] for c in chunks}
+    kept = {cid: s for cid, s in existing.items() if cid in current_ids and cid not in stale_ids}
+    dropped = len(existing) - len(kept)
+
+    _save_summaries(kept)
+    _build_summary_bm25(chunks, kept)
+
+    missing = len(current_ids) - len(kept)
+    print(f"  要約: {dropped} 件を破棄（未要約 {missing} 件は build_summaries で生成してください）")
+
+
+def _summaries_digest(summaries: dict) -> str:
+    """要約の内容のハッシュ（インデックスが summaries.json と同期しているかの確認用）"""
+    data = json.dumps(summaries, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def _open_summary_bm25(n_chunks: int, digest: str | None = None) -> BM25Index | None:
+    """保存済みの要約 BM25 インデックスを開く
+
+    無い・形式が古い・チャンクと不一致・digest（要約のハッシュ）と不一致なら None。
+    """
+    if not (SUMMARY_BM25_DIR / "meta.json").exists():
+        return None
+    try:
+        bm25 = BM25Index.load(SUMMARY_BM25_DIR)
+    except ValueError:
+        return None
+    chunks_path = find_chunks_path()
+    if chunks_path is not None and bm25.meta.get("source") != source_signature(chunks_path):
+        return None
+    if bm25.corpus_size != n_chunks:
+        return None
+    if digest is not None and bm25.meta.get("summaries") != digest:
+        return None
+    return bm25
+
+
+def _save_summary_bm25(bm25: BM25Index, summaries: dict):
+    """要約インデックスを保存（ロード済みのインデックスは破棄）"""
+    global _bm25_summary
+    chunks_path = find_chunks_path()
+    bm25.save(SUMMARY_BM25_DIR, extra_meta={
+        "source": source_signature(chunks_path) if chunks_path else None,
+        "summaries": _summaries_digest(summaries),
+    })
+    # 旧形式のトークン列（BM25Okapi 再構築用）は不要
+    (INDEX_DIR / "summary_tokens.json").unlink(missing_ok=True)
+    _bm25_summary = None
+    search_cache.bump_generation()
+
+
+def _build_summary_bm25(chunks, summaries: dict):
+    """要約テキストのBM25インデックスを全件から構築"""
+    tokenized = tokenize_many(summaries.get(chunk["chunk_id"], "") for chunk in chunks)
+    _save_summary_bm25(BM25Index.from_tokens(tokenized), summaries)
+
+
+def _update_summary_bm25(store, summaries: dict, added: dict[str, str], previous_digest: str):
+    """追加した要約の分だけ要約インデックスを差し替える
+
+    保存済みインデックスが追加前の要約（previous_digest）と同期していなければ全件から作り直す。
+    """
+    bm25 = _open_summary_bm25(len(store), previous_digest)
+    if bm25 is None:
+        _build_summary_bm25(store, summaries)
+        return
+    if not added:
+        return
+    rows = [store.index_of(chunk_id) for chunk_id in added]
+    tokenized = tokenize_many(added.values())
+    docs = {row: tokens for row, tokens in zip(rows, tokenized) if row is not None}
+    _save_summary_bm25(bm25.replace_docs(docs), summaries)
 
 
 def _load_summary_index():
-    """要約BM25インデックスをロード"""
-    global _bm25_summary, _summaries, _chunks, _tagger
+    """要約BM25インデックスをロード（data/index/summary_bm25/ を mmap で開く）
+
+    未構築・旧形式（summary_tokens.json）・chunks.json や summaries.json の更新後の場合は
+    summaries.json からメモリ上に作り直す（保存は build_summaries / patch_summaries だけが行う）。
+    """
+    global _bm25_summary, _summaries, _chunks, _doc_ranges
 
     if _bm25_summary is not None:
         return
 
-    summaries_path = INDEX_DIR / "summaries.json"
-    tokens_path = INDEX_DIR / "summary_tokens.json"
-    chunks_path = INDEX_DIR / "chunks.json"
-
-    if not summaries_path.exists() or not tokens_path.exists():
+    if not SUMMARIES_PATH.exists():
         raise FileNotFoundError("要約インデックスが未構築です。")
 
-    with open(summaries_path, encoding="utf-8") as f:
-        _summaries = json.load(f)
-
-    with open(tokens_path, encoding="utf-8") as f:
-        tokenized = json.load(f)
+    with open(SUMMARIES_PATH, encoding="utf-8") as f:
+        summaries = json.load(f)
 
-    with open(chunks_path, encoding="utf-8") as f:
-        _chunks = json.load(f)
+    store = get_store()
+    bm25 = _open_summary_bm25(len(store), _summaries_digest(summaries))
+    if bm25 is None:
+        tokenized = tokenize_many(summaries.get(chunk_id, "") for chunk_id in store.chunk_ids())
+        bm25 = BM25Index.from_tokens(tokenized)
 
-    _bm25_summary = BM25Okapi(tokenized)
-    _tagger = Tagger()
+    _summaries, _chunks = summaries, store
+    _doc_ranges = DocRanges(store.doc_ids)
+    _bm25_summary = bm25
 
 
 def search(query: str, top_k: int = 5, doc_filter: str | None = None) -> list[dict]:
     """要約インデックスでBM25検索"""
     _load_summary_index()
 
-    tokens = [w.surface for w in _tagger(query) if len(w.surface) > 1 or not w.surface.isascii()]
+    tokens = tokenize_query(query)
     if not tokens:
         return []
 
-    scores = _bm25_summary.get_scores(tokens)
-    scored = list(enumerate(scores))
-
-    if doc_filter:
-        scored = [(i, s) for i, s in scored if doc_filter in _chunks[i]["doc_id"]]
-
-    scored.sort(key=lambda x: x[1], reverse=True)
+    ranges = _doc_ranges.ranges(doc_filter) if doc_filter else None
+    indices, scores = _bm25_summary.top_k(tokens, top_k, ranges=ranges)
 
     results = []
-    for idx, score in scored[:top_k]:
+    for idx, score in zip(indices, scores):
         if score <= 0:
             break
-        chunk = _chunks[idx]
+        chunk = _chunks[int(idx)]
         results.append({
-            "doc_id": chunk["doc_id"],
-            "chunk_id": chunk["chunk_id"],
-            "filename": chunk["filename"],
-            "text": chunk["text"],
+            **chunk,
             "summary": _summaries.get(chunk["chunk_id"], ""),
             "score": round(float(score), 4),
             "method": "summary_bm25",
@@ -173,7 +437,7 @@ def search(query: str, top_k: int = 5, doc_filter: str | None = None) -> list[di
 
 def is_available() -> bool:
     """要約インデックスが利用可能か"""
-    return (INDEX_DIR / "summaries.json").exists() and (INDEX_DIR / "summary_tokens.json").exists()
+    return SUMMARIES_PATH.exists()
 
 
 if __name__ == "__main__":
@@ -45,3 +45,40 @@ MAX_OUTPUT_CHARS = int(os.getenv("MAX_OUTPUT_CHARS", "10000"))
 
 # 作業ディレクトリ
 WORKING_DIR = os.getenv("WORKING_DIR", os.getcwd())
+
+# ベクトル検索設定
+# VECTOR_INDEX: "flat"（全探索）/ "ivf"（近似最近傍、build-ann で構築が必要）
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "flat")
+VECTOR_NPROBE = int(os.getenv("VECTOR_NPROBE", "8"))
+# クエリ埋め込みキャッシュ（件数上限、保存先。保存先が空ならメモリのみ）
+VECTOR_QUERY_CACHE_SIZE = int(os.getenv("VECTOR_QUERY_CACHE_SIZE", "1024"))
+VECTOR_QUERY_CACHE_PATH = os.getenv("VECTOR_QUERY_CACHE_PATH", "")
+
+# 検索結果キャッシュ（hybrid_search / guided_search。件数上限、保存先。保存先が空ならメモリのみ）
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")
+
+# 検索の区間計測ログ（src/tracing.py。JSONL の保存先、空なら書き出さない）
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+
+# チャンク要約の生成（src/chunk_summarizer.py。同時リクエスト数、1リクエストあたりのチャンク数、再試行回数）
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", "5"))
+
+# 埋め込みの構築（src/vector_search.py。並列に動かす ONNX セッション数。1 ならセッション1つ）
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+
+# LLM リランキング（src/reranker.py。1リクエストあたりの候補数、同時リクエスト数、待ち時間の上限（秒））
+RERANK_WINDOW = int(os.getenv("RERANK_WINDOW", "10"))
+RERANK_CONCURRENCY = int(os.getenv("RERANK_CONCURRENCY", "8"))
+RERANK_BUDGET = float(os.getenv("RERANK_BUDGET", "15"))
+# リランキングスコアのキャッシュ（件数上限、保存先。保存先が空ならメモリのみ）
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_PATH = os.getenv("RERANK_CACHE_PATH", "")
+
+# ContextualRetrieval の文脈生成（src/contextual_retrieval.py。同時リクエスト数、1リクエストあたりのチャンク数、
+# 生成済み文脈のキャッシュの保存先（JSONL 追記。空ならメモリのみ））
+CONTEXT_CONCURRENCY = int(os.getenv("CONTEXT_CONCURRENCY", "8"))
+CONTEXT_CHUNKS_PER_REQUEST = int(os.getenv("CONTEXT_CHUNKS_PER_REQUEST", "1"))
+CONTEXT_CACHE_PATH = os.getenv("CONTEXT_CACHE_PATH", "")
@@ -16,9 +16,112 @@ from __future__ import annotations
 
 import json
 import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Any
 
+import numpy as np
+
+from src.config import CONTEXT_CACHE_PATH, CONTEXT_CHUNKS_PER_REQUEST, CONTEXT_CONCURRENCY
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize(vector) -> np.ndarray:
+    """L2 正規化した float32 ベクトル（ゼロベクトルはそのまま）"""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+# 簡易BM25のパラメータ
+_SIMPLE_BM25_K1 = 1.5
+_SIMPLE_BM25_B = 0.75
+_SIMPLE_TOKEN = re.compile(r'[\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff]{2,}')
+
+
+def _simple_tokenize(text: str) -> list[str]:
+    """簡易BM25のトークン化（2文字以上のひらがな・カタカナ・漢字の連続）"""
+    return _SIMPLE_TOKEN.findall(text)
+
+
+def _parse_contexts(content: str, n: int) -> dict[int, str]:
+    """まとめて生成した応答の JSON から {番号: 文脈}（壊れていれば取れた分だけ）"""
+    start, end = content.find("{"), content.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    items = data.get("contexts", []) if isinstance(data, dict) else []
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        context = str(item.get("context") or "").strip()
+        if 1 <= idx <= n and context:
+            parsed[idx] = context
+    return parsed
+
+
+class _ContextCache:
+    """生成済み文脈のキャッシュ（(モデル, 文書ハッシュ, チャンクハッシュ) → 文脈）
+
+    path を指定するとプロセスをまたいで使えるよう JSONL に追記する（空ならメモリのみ）。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path) if path else None
+        self._entries: dict[str, str] | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, doc_hash: str, chunk_hash: str) -> str:
+        return f"{model}:{doc_hash}:{chunk_hash}"
+
+    def _load(self) -> dict[str, str]:
+        if self._entries is None:
+            entries = {}
+            if self.path is not None and self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            entries[record["key"]] = record["context"]
+                        except (ValueError, KeyError, TypeError):
+                            continue  # 書き込み途中で止まった行
+            self._entries = entries
+        return self._entries
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, context: str) -> None:
+        with self._lock:
+            self._load()[key] = context
+            if self.path is None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "context": context}, ensure_ascii=False) + "\n")
+
+
+def _vector_paths(path: str) -> tuple[Path, Path]:
+    """save() の JSON の横に置くベクトル行列とその対応表のパス"""
+    path = Path(path)
+    return path.with_suffix(".vectors.npy"), path.with_suffix(".vectors.json")
+
 
 @dataclass
 class ContextualChunk:
@@ -86,32 +189,63 @@ class ContextualRetrieval:
 50〜100語で生成してください。検索精度向上のために使用します。
 コンテキスト説明のみを出力し、前置き等は不要です。"""
 
+    # 複数チャンクをまとめて送るとき用（文書部分は CONTEXT_PROMPT と同じプレフィックス）
+    CONTEXT_BATCH_PROMPT = """<document>
+{document}
+</document>
+
+上記の文書全体の中で、以下の各チャンクを位置づけてください。
+
+{chunks}
+
+各チャンクについて、文書全体の中で位置づける簡潔なコンテキスト説明を
+50〜100語で生成してください。検索精度向上のために使用します。
+次の JSON のみを出力し、前置き等は不要です（id はチャンクの id）:
+{{"contexts": [{{"id": 1, "context": "..."}}, ...]}}"""
+
     def __init__(
         self,
         llm_client: Any = None,
         embed_fn: Any = None,
-        use_prompt_caching: bool = True  # Anthropic Prompt Caching 有効化
+        use_prompt_caching: bool = True,  # Anthropic Prompt Caching 有効化
+        context_cache_path: str | None = None  # 生成済み文脈の保存先（None: CONTEXT_CACHE_PATH、"": メモリのみ）
     ) -> None:
         self.llm = llm_client
         self.embed_fn = embed_fn
         self.use_prompt_caching = use_prompt_caching
+        self._context_model = getattr(llm_client, "model", "") or type(llm_client).__name__
+        self._context_cache = _ContextCache(
+            CONTEXT_CACHE_PATH if context_cache_path is None else context_cache_path
+        )
+        self._context_lock = threading.Lock()
         self._contextualized_chunks: dict[str, ContextualChunk] = {}
-        self._vectors: list[tuple[str, Any]] = []          # [(chunk_id, vector)]
+        self._matrix: np.ndarray | None = None             # 正規化済みベクトル行列 (N, dim) float32
+        self._vector_ids = np.zeros(0, dtype=object)       # 行ごとの chunk_id
+        self._vector_hashes: list[str] = []                # 行ごとの contextualized_text のハッシュ
         self._bm25_index: Any = None                       # BM25インデックス
 
     def add_context(
         self,
         chunks: list[dict[str, Any]],
         full_document: str,
-        document_title: str = ""
+        document_title: str = "",
+        concurrency: int | None = None,
+        chunks_per_request: int | None = None
     ) -> list[ContextualChunk]:
         """
         各チャンクに文書全体の文脈プレフィックスを付与
 
+        文書を先頭に置いた同じプロンプトでチャンクごとのリクエストを並行に送る
+        （サーバ側の prefix caching で文書部分の処理を使い回せる）。
+        chunks_per_request > 1 なら1リクエストで複数チャンクの文脈をまとめて生成する。
+        (モデル, 文書, チャンク) ごとの生成結果はキャッシュに追記し、再構築時は LLM に送らない。
+
         Args:
             chunks: [{"chunk_id": ..., "text": ..., "metadata": {...}}, ...]
             full_document: 文書全体のテキスト（文脈生成用）
             document_title: 文書タイトル
+            concurrency: 同時リクエスト数（省略時は CONTEXT_CONCURRENCY）
+            chunks_per_request: 1リクエストあたりのチャンク数（省略時は CONTEXT_CHUNKS_PER_REQUEST）
 
         Returns:
             ContextualChunk のリスト
@@ -121,24 +255,38 @@ class ContextualRetrieval:
             full_document を cache_control: ephemeral で送信して
             チャンクごとのキャッシュヒットを活用することでコストを約90%削減できる
         """
-        results = []
+        concurrency = max(1, concurrency or CONTEXT_CONCURRENCY)
+        chunks_per_request = max(1, chunks_per_request or CONTEXT_CHUNKS_PER_REQUEST)
         total = len(chunks)
         print(f"[ContextualRetrieval] {total} チャンクに文脈を付与中...")
 
         # 文書をトランケート（LLMのコンテキスト制限対応）
         doc_preview = full_document[:8000] + ("\n...[以下省略]" if len(full_document) > 8000 else "")
 
+        items = []
         for i, chunk in enumerate(chunks):
-            chunk_id = chunk.get("chunk_id", f"chunk_{i}")
             text = chunk.get("text", "")
-            metadata = chunk.get("metadata", {})
+            if text.strip():
+                items.append((chunk.get("chunk_id", f"chunk_{i}"), text, chunk.get("metadata", {})))
 
-            if not text.strip():
-                continue
-
-            # 文脈プレフィックス生成
-            context_prefix = self._generate_context(doc_preview, text)
+        # 文脈プレフィックス生成（キャッシュ済みのチャンクは LLM に送らない）
+        contexts: list[str | None] = [None] * len(items)
+        if self.llm is None:
+            contexts = [self._rule_based_context(text) for _, text, _ in items]
+        else:
+            doc_hash = _text_hash(doc_preview)
+            keys = [self._context_cache.key(self._context_model, doc_hash, _text_hash(text))
+                    for _, text, _ in items]
+            for n, key in enumerate(keys):
+                contexts[n] = self._context_cache.get(key)
+            pending = [n for n, context in enumerate(contexts) if context is None]
+            if len(pending) < len(items):
+                print(f"[ContextualRetrieval] キャッシュ済み: {len(items) - len(pending)} チャンク")
+            self._generate_pending(doc_preview, items, keys, contexts, pending,
+                                   concurrency, chunks_per_request)
 
+        results = []
+        for (chunk_id, text, metadata), context_prefix in zip(items, contexts):
             # prefix + text を結合
             contextualized_text = f"{context_prefix}\n\n{text}"
 
@@ -153,33 +301,81 @@ class ContextualRetrieval:
             results.append(cc)
             self._contextualized_chunks[chunk_id] = cc
 
-            if (i + 1) % 50 == 0:
-                print(f"[ContextualRetrieval] {i + 1}/{total} 完了")
-
         print(f"[ContextualRetrieval] 文脈付与完了: {len(results)} チャンク")
         return results
 
-    def _generate_context(self, document: str, chunk: str) -> str:
-        """
-        LLMを使って文脈プレフィックスを生成
+    def _generate_pending(
+        self,
+        document: str,
+        items: list[tuple[str, str, dict]],
+        keys: list[str],
+        contexts: list[str | None],
+        pending: list[int],
+        concurrency: int,
+        chunks_per_request: int
+    ) -> None:
+        """未生成のチャンクの文脈を生成して contexts に入れる（成功したものはキャッシュに追記）
 
-        Prompt Cachingを活用する場合は、APIクライアント側で
-        document部分を cache_control: ephemeral として送信する
+        リクエストは文書を先頭に置いた同じプレフィックスで始まるので、最初の1件を
+        単独で送ってサーバ側（vLLM の prefix caching など）に文書を載せてから、
+        残りを concurrency 件ずつ並行に送る。
         """
-        if self.llm is None:
-            # LLMなし: ルールベースのフォールバック
-            return self._rule_based_context(chunk)
-
+        requests = [pending[i:i + chunks_per_request] for i in range(0, len(pending), chunks_per_request)]
+        done = 0
+
+        def run(rows: list[int]) -> None:
+            nonlocal done
+            texts = [items[n][1] for n in rows]
+            if len(rows) > 1:
+                generated = self._llm_contexts(document, texts)
+            else:
+                generated = [self._llm_context(document, texts[0])]
+            for n, context in zip(rows, generated):
+                if context is None:
+                    contexts[n] = self._rule_based_context(items[n][1])
+                else:
+                    contexts[n] = context
+                    self._context_cache.put(keys[n], context)
+            with self._context_lock:
+                before, done = done, done + len(rows)
+                if before // 50 != done // 50:
+                    print(f"[ContextualRetrieval] {done}/{len(pending)} 完了")
+
+        if not requests:
+            return
+        run(requests[0])
+        if concurrency == 1:
+            for rows in requests[1:]:
+                run(rows)
+            return
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="context") as executor:
+            for future in [executor.submit(run, rows) for rows in requests[1:]]:
+                future.result()
+
+    def _llm_context(self, document: str, chunk: str) -> str | None:
+        """1チャンクの文脈を LLM で生成（失敗したら None）"""
         prompt = self.CONTEXT_PROMPT.format(document=document, chunk=chunk)
         try:
-            return self.llm.complete(prompt).strip()
+            return self.llm.complete(prompt).strip() or None
         except Exception as e:
             print(f"[ContextualRetrieval] 文脈生成失敗: {e}")
-            return self._rule_based_context(chunk)
+            return None
+
+    def _llm_contexts(self, document: str, chunks: list[str]) -> list[str | None]:
+        """複数チャンクの文脈を1リクエストで生成（応答に無かったチャンクは1件ずつ生成し直す）"""
+        chunk_blocks = "\n\n".join(
+            f'<chunk id="{i + 1}">\n{chunk}\n</chunk>' for i, chunk in enumerate(chunks)
+        )
+        prompt = self.CONTEXT_BATCH_PROMPT.format(document=document, chunks=chunk_blocks)
+        try:
+            parsed = _parse_contexts(self.llm.complete(prompt), len(chunks))
+        except Exception as e:
+            print(f"[ContextualRetrieval] 文脈生成失敗（まとめて生成）: {e}")
+            parsed = {}
+        return [parsed.get(i + 1) or self._llm_context(document, chunk) for i, chunk in enumerate(chunks)]
 
     def _rule_based_context(self, chunk: str) -> str:
         """ルールベースのフォールバック文脈生成"""
-        import re
         # セクション番号を検出
         section_match = re.search(r'^(\d+(?:\.\d+)*)\s+(.+?)$', chunk[:200], re.MULTILINE)
         if section_match:
@@ -192,28 +388,50 @@ class ContextualRetrieval:
         """
         文脈付きチャンクからハイブリッドインデックスを構築
 
-        - ベクトルインデックス (dense)
+        - ベクトルインデックス (dense): 正規化済みの float32 行列。既に持っている
+          （load() した）ベクトルのうち chunk_id と本文が同じものは埋め込み直さない
         - BM25インデックス (sparse)
         """
         print("[ContextualRetrieval] インデックス構築中...")
 
         texts_for_bm25 = []
+        existing = {
+            (chunk_id, text_hash): row
+            for row, (chunk_id, text_hash) in enumerate(zip(self._vector_ids.tolist(), self._vector_hashes))
+        }
+        rows, vector_ids, hashes = [], [], []
         for cc in contextualized_chunks:
             # ベクトル化（contextual_text全体を使用）
-            if self.embed_fn:
+            text_hash = _text_hash(cc.contextualized_text)
+            row = existing.get((cc.chunk_id, text_hash))
+            if row is not None:
+                vector = self._matrix[row]
+            elif self.embed_fn:
                 try:
-                    vector = self.embed_fn(cc.contextualized_text)
-                    self._vectors.append((cc.chunk_id, vector))
+                    vector = _normalize(self.embed_fn(cc.contextualized_text))
                 except Exception:
-                    pass
+                    vector = None
+            else:
+                vector = None
+            if vector is not None:
+                rows.append(vector)
+                vector_ids.append(cc.chunk_id)
+                hashes.append(text_hash)
 
             texts_for_bm25.append(cc.contextualized_text)
 
+        self._set_vectors(np.vstack(rows) if rows else None, vector_ids, hashes)
+
         # BM25インデックス構築
         self._build_bm25(texts_for_bm25, [cc.chunk_id for cc in contextualized_chunks])
 
         print(f"[ContextualRetrieval] インデックス完了: "
-              f"{len(self._vectors)} ベクトル, BM25 {len(texts_for_bm25)} 文書")
+              f"{len(vector_ids)} ベクトル, BM25 {len(texts_for_bm25)} 文書")
+
+    def _set_vectors(self, matrix: np.ndarray | None, chunk_ids: list[str], hashes: list[str]) -> None:
+        self._matrix = matrix
+        self._vector_ids = np.array(chunk_ids, dtype=object)
+        self._vector_hashes = hashes
 
     def _build_bm25(self, texts: list[str], chunk_ids: list[str]) -> None:
         """BM25インデックス構築"""
@@ -237,32 +455,45 @@ class ContextualRetrieval:
         texts: list[str],
         chunk_ids: list[str]
     ) -> dict[str, Any]:
-        """bm25sがない場合の簡易BM25実装"""
+        """bm25sがない場合の簡易BM25実装（転置インデックス）
+
+        - postings: term → (文書番号の配列, 出現回数の配列)
+        - idf:      term → IDF（構築時に計算）
+        - doc_norm: 文書ごとの k1 * (1 - b + b * 文書長 / 平均文書長)
+        - nonempty: トークンが1つ以上ある文書番号（スコア0の文書の並び順に使う）
+        """
         import math
-        import re
         from collections import Counter
 
-        def tokenize(text: str) -> list[str]:
-            # 日本語: 2文字以上のひらがな・カタカナ・漢字
-            return re.findall(r'[\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff]{2,}', text)
+        k1, b = _SIMPLE_BM25_K1, _SIMPLE_BM25_B
 
-        # 文書頻度の計算
-        df: dict[str, int] = Counter()
-        tokenized_docs = []
-        for text in texts:
-            tokens = tokenize(text)
-            tokenized_docs.append(tokens)
-            for token in set(tokens):
-                df[token] += 1
+        # term ごとの postings を文書番号の昇順に集める
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        doc_lens = np.zeros(len(texts), dtype=np.int64)
+        for doc, text in enumerate(texts):
+            tokens = _simple_tokenize(text)
+            doc_lens[doc] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                docs, tfs = postings.setdefault(token, ([], []))
+                docs.append(doc)
+                tfs.append(tf)
 
         n_docs = len(texts)
-        avg_len = sum(len(t) for t in tokenized_docs) / max(n_docs, 1)
+        avg_len = int(doc_lens.sum()) / max(n_docs, 1)
 
         return {
             "type": "simple",
-            "tokenized_docs": tokenized_docs,
+            "postings": {
+                token: (np.array(docs, dtype=np.int64), np.array(tfs, dtype=np.float64))
+                for token, (docs, tfs) in postings.items()
+            },
+            "idf": {
+                token: math.log((n_docs - len(docs) + 0.5) / (len(docs) + 0.5) + 1)
+                for token, (docs, _) in postings.items()
+            },
+            "doc_norm": k1 * (1 - b + b * doc_lens / avg_len) if avg_len else np.zeros(n_docs),
+            "nonempty": np.flatnonzero(doc_lens),
             "chunk_ids": chunk_ids,
-            "df": dict(df),
             "n_docs": n_docs,
             "avg_len": avg_len
         }
@@ -329,27 +560,18 @@ class ContextualRetrieval:
         query: str,
         top_k: int
     ) -> list[tuple[str, float]]:
-        """ベクトル類似度検索"""
-        if not self.embed_fn or not self._vectors:
+        """ベクトル類似度検索（正規化済み行列との内積1回でコサイン類似度）"""
+        if not self.embed_fn or self._matrix is None or top_k <= 0:
             return []
 
         try:
-            import numpy as np
-            query_vec = self.embed_fn(query)
-            if isinstance(query_vec, list):
-                query_vec = np.array(query_vec, dtype=np.float32)
-
-            scores = []
-            for chunk_id, vec in self._vectors:
-                if isinstance(vec, list):
-                    vec = np.array(vec, dtype=np.float32)
-                score = float(np.dot(query_vec, vec) / (
-                    np.linalg.norm(query_vec) * np.linalg.norm(vec) + 1e-8
-                ))
-                scores.append((chunk_id, score))
-
-            scores.sort(key=lambda x: x[1], reverse=True)
-            return scores[:top_k]
+            scores = self._matrix @ _normalize(self.embed_fn(query))
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.lexsort((top, -scores[top]))]
+            return list(zip(self._vector_ids[top].tolist(), scores[top].tolist()))
         except Exception as e:
             print(f"[ContextualRetrieval] Dense検索エラー: {e}")
             return []
@@ -388,43 +610,37 @@ class ContextualRetrieval:
         query: str,
         top_k: int
     ) -> list[tuple[str, float]]:
-        """簡易BM25検索"""
-        import re
-        import math
+        """簡易BM25検索（クエリ語の postings だけを読む）
 
+        クエリ語はクエリ中の順に加算する（同じ語が2回あれば2回加算）。
+        スコアが同じ文書は文書番号順。上位が top_k 件に満たなければ、
+        トークンのある文書をスコア0で文書番号順に補う。
+        """
         bm25 = self._bm25_index
-        k1, b = 1.5, 0.75
+        k1 = _SIMPLE_BM25_K1
+        if top_k <= 0:
+            return []
 
-        def tokenize(text: str) -> list[str]:
-            return re.findall(r'[\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff]{2,}', text)
+        scores = np.zeros(bm25["n_docs"])
+        touched = []
+        for qt in _simple_tokenize(query):
+            entry = bm25["postings"].get(qt)
+            if entry is None:
+                continue
+            docs, tfs = entry
+            tf_norm = tfs * (k1 + 1) / (tfs + bm25["doc_norm"][docs])
+            scores[docs] += bm25["idf"][qt] * tf_norm
+            touched.append(docs)
 
-        query_tokens = tokenize(query)
-        scores = []
+        hit = np.unique(np.concatenate(touched)) if touched else np.zeros(0, dtype=np.int64)
+        order = hit[np.lexsort((hit, -scores[hit]))][:top_k]
+        if len(order) < top_k:
+            # ヒットしなかった文書（スコア0）を文書番号順に補う
+            head = bm25["nonempty"][:top_k + len(hit)]
+            order = np.concatenate([order, np.setdiff1d(head, hit, assume_unique=True)[:top_k - len(order)]])
 
-        for i, (tokens, chunk_id) in enumerate(
-            zip(bm25["tokenized_docs"], bm25["chunk_ids"])
-        ):
-            if not tokens:
-                continue
-            score = 0.0
-            doc_len = len(tokens)
-            tf_counter = {}
-            for t in tokens:
-                tf_counter[t] = tf_counter.get(t, 0) + 1
-
-            for qt in query_tokens:
-                tf = tf_counter.get(qt, 0)
-                df = bm25["df"].get(qt, 0)
-                if df == 0:
-                    continue
-                idf = math.log((bm25["n_docs"] - df + 0.5) / (df + 0.5) + 1)
-                tf_norm = tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / bm25["avg_len"]))
-                score += idf * tf_norm
-
-            scores.append((chunk_id, score))
-
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_k]
+        chunk_ids = bm25["chunk_ids"]
+        return [(chunk_ids[i], float(scores[i])) for i in order.tolist()]
 
     def _reciprocal_rank_fusion(
         self,
@@ -437,16 +653,14 @@ class ContextualRetrieval:
 
         RRF スコア = sum(1 / (k + rank))
         """
-        rrf_scores: dict[str, float] = {}
+        from src.fusion import encode_ids, fuse
 
-        for rank, (chunk_id, _) in enumerate(dense_results):
-            rrf_scores[chunk_id] = rrf_scores.get(chunk_id, 0) + 1 / (k + rank + 1)
-
-        for rank, (chunk_id, _) in enumerate(sparse_results):
-            rrf_scores[chunk_id] = rrf_scores.get(chunk_id, 0) + 1 / (k + rank + 1)
-
-        sorted_results = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_results
+        keys, ids = encode_ids([
+            [chunk_id for chunk_id, _ in dense_results],
+            [chunk_id for chunk_id, _ in sparse_results],
+        ])
+        fused_ids, fused_scores = fuse(ids, method="rrf", k=k)
+        return list(zip(keys[fused_ids].tolist(), fused_scores.tolist()))
 
     def _rerank(
         self,
@@ -475,7 +689,6 @@ class ContextualRetrieval:
         try:
             response = self.llm.complete(prompt).strip()
             # 番号を解析
-            import re
             indices = [int(n) - 1 for n in re.findall(r'\d+', response)]
             reranked = []
             seen = set()
@@ -494,16 +707,43 @@ class ContextualRetrieval:
             return candidates[:top_k]
 
     def save(self, path: str) -> None:
-        """文脈付きチャンクをJSONに保存"""
+        """文脈付きチャンクをJSONに保存（ベクトルは横に .vectors.npy / .vectors.json で保存）"""
         data = [cc.to_dict() for cc in self._contextualized_chunks.values()]
         with open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"[ContextualRetrieval] 保存完了: {path} ({len(data)} チャンク)")
+
+        matrix_path, ids_path = _vector_paths(path)
+        if self._matrix is None:
+            matrix_path.unlink(missing_ok=True)
+            ids_path.unlink(missing_ok=True)
+        else:
+            tmp = matrix_path.with_name(matrix_path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(self._matrix, dtype=np.float32))
+            tmp.replace(matrix_path)
+            with open(ids_path, "w", encoding="utf-8") as f:
+                json.dump({"chunk_ids": self._vector_ids.tolist(), "text_hashes": self._vector_hashes,
+                           "dim": int(self._matrix.shape[1])}, f, ensure_ascii=False)
+        n_vectors = 0 if self._matrix is None else len(self._matrix)
+        print(f"[ContextualRetrieval] 保存完了: {path} ({len(data)} チャンク, {n_vectors} ベクトル)")
 
     def load(self, path: str) -> None:
-        """保存した文脈付きチャンクを読み込み"""
+        """保存した文脈付きチャンクを読み込み（ベクトルがあれば mmap で開く）"""
         with open(path, encoding="utf-8") as f:
             data = json.load(f)
         chunks = [ContextualChunk.from_dict(d) for d in data]
         self._contextualized_chunks = {cc.chunk_id: cc for cc in chunks}
-        print(f"[ContextualRetrieval] 読み込み完了: {len(chunks)} チャンク")
+
+        self._set_vectors(None, [], [])
+        matrix_path, ids_path = _vector_paths(path)
+        if matrix_path.exists() and ids_path.exists():
+            with open(ids_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode="r")
+            if len(matrix) == len(meta["chunk_ids"]) == len(meta["text_hashes"]):
+                self._set_vectors(matrix, meta["chunk_ids"], meta["text_hashes"])
+            else:
+                print(f"[ContextualRetrieval] ベクトルの件数が合わないため読み込みません: {matrix_path}")
+        n_vectors = 0 if self._matrix is None else len(self._matrix)
+        print(f"[ContextualRetrieval] 読み込み完了: {len(chunks)} チャンク, {n_vectors} ベクトル")
+
@@ -1,6 +1,6 @@
 """相互参照グラフ構築 - JERG文書間の参照関係を抽出・管理
 
-data/index/chunks.json から「JERG-X-YYY」パターンの参照を抽出し、
+チャンクストア（data/index/chunks.json）から「JERG-X-YYY」パターンの参照を抽出し、
 文書間の有向グラフを構築する。
 """
 
@@ -9,40 +9,22 @@ import re
 from collections import defaultdict
 from pathlib import Path
 
+from src import search_cache
+from src.chunk_store import get_store
+
 DATA_DIR = Path(__file__).parent.parent / "data"
 INDEX_DIR = DATA_DIR / "index"
 GRAPH_PATH = DATA_DIR / "cross_references.json"
 
-# chunks.json の候補パス（index優先、なければ data/ 直下）
-_CHUNKS_CANDIDATES = [
-    INDEX_DIR / "chunks.json",
-    DATA_DIR / "chunks.json",
-]
-
 # JERG文書番号のパターン（JERG-0-039-TM001 等の拡張形式も含む）
 _JERG_PATTERN = re.compile(r'JERG-\d{1,2}-\d{3}(?:-[A-Z]+\d+[A-Z]?)?')
 
 _graph: dict | None = None
 
 
-def _find_chunks_path() -> Path:
-    """chunks.json のパスを解決する（index優先、なければ data/ 直下）"""
-    for p in _CHUNKS_CANDIDATES:
-        if p.exists():
-            return p
-    raise FileNotFoundError(
-        "chunks.json が見つかりません。候補: "
-        + ", ".join(str(p) for p in _CHUNKS_CANDIDATES)
-    )
-
-
 def _load_doc_ids() -> list[str]:
-    """chunks.json から全文書IDを取得（長い順でソート＝最長一致用）"""
-    chunks_path = _find_chunks_path()
-    with open(chunks_path, encoding="utf-8") as f:
-        chunks = json.load(f)
-    doc_ids = sorted(set(c["doc_id"] for c in chunks), key=len, reverse=True)
-    return doc_ids
+    """チャンクストアから全文書IDを取得（長い順でソート＝最長一致用）"""
+    return sorted(set(get_store().doc_id_values), key=len, reverse=True)
 
 
 def _resolve_ref(ref: str, all_doc_ids: list[str]) -> str | None:
@@ -67,9 +49,7 @@ def build_graph() -> dict:
             "total_edges": int,
         }
     """
-    chunks_path = _find_chunks_path()
-    with open(chunks_path, encoding="utf-8") as f:
-        chunks = json.load(f)
+    chunks = get_store()
 
     all_doc_ids = _load_doc_ids()
     all_doc_id_set = set(all_doc_ids)
@@ -153,6 +133,7 @@ def save_graph(graph: dict | None = None):
     GRAPH_PATH.parent.mkdir(parents=True, exist_ok=True)
     with open(GRAPH_PATH, "w", encoding="utf-8") as f:
         json.dump(graph, f, ensure_ascii=False, indent=2)
+    search_cache.bump_generation()
 
     print(f"Cross-reference graph saved: {GRAPH_PATH}")
     print(f"  Nodes: {graph['total_nodes']}, Edges: {graph['total_edges']}")
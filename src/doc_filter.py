@@ -0,0 +1,102 @@
+"""文書フィルタ - doc_filter 文字列 → 対象チャンクの行範囲
+
+doc_filter は文書番号の部分一致（例: "JERG-2-200"、系列全体なら "JERG-2-"）。
+チャンクごとに文字列比較すると検索のたびにコーパス全体を走査するので、
+文書番号 → 行範囲 (start, end) を1回だけ作り、一致判定は異なる文書番号
+（数百件）だけで行う。チャンクは文書ごとに連続して並ぶので範囲は少数にまとまる。
+
+"A|B" は A または B に一致（guided_retrieval が複数文書を指定するときの形式）。
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+
+# フィルタ文字列ごとの範囲キャッシュの上限
+_CACHE_SIZE = 256
+
+
+def patterns(doc_filter: str) -> list[str]:
+    """doc_filter を "|" 区切りの部分一致パターンに分解"""
+    return [p.strip() for p in doc_filter.split("|") if p.strip()]
+
+
+def matches(doc_filter: str, doc_id: str) -> bool:
+    """doc_id が doc_filter のいずれかのパターンを含むか"""
+    return any(p in doc_id for p in patterns(doc_filter))
+
+
+def range_indices(ranges: np.ndarray) -> np.ndarray:
+    """(R, 2) の [start, end) 範囲を連結した行番号配列"""
+    if not len(ranges):
+        return np.zeros(0, dtype=np.int64)
+    lengths = ranges[:, 1] - ranges[:, 0]
+    offsets = np.repeat(ranges[:, 0] - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return offsets + np.arange(int(lengths.sum()), dtype=np.int64)
+
+
+def in_ranges(values: np.ndarray, ranges: np.ndarray) -> np.ndarray:
+    """昇順の範囲 ranges のいずれかに含まれるかの bool 配列"""
+    if not len(ranges):
+        return np.zeros(len(values), dtype=bool)
+    i = np.searchsorted(ranges[:, 0], values, side="right") - 1
+    return (i >= 0) & (values < ranges[np.maximum(i, 0), 1])
+
+
+class DocRanges:
+    """文書番号 → チャンク行範囲のマップ（フィルタ結果はキャッシュ）"""
+
+    def __init__(self, doc_ids: Sequence[str]) -> None:
+        runs: dict[str, list[tuple[int, int]]] = {}
+        start = 0
+        for i in range(1, len(doc_ids) + 1):
+            if i == len(doc_ids) or doc_ids[i] != doc_ids[start]:
+                runs.setdefault(doc_ids[start], []).append((start, i))
+                start = i
+        self._runs = runs
+        self.n_rows = len(doc_ids)
+        self._cache: dict[str, np.ndarray] = {}
+
+    @property
+    def doc_ids(self) -> list[str]:
+        """異なる文書番号の一覧"""
+        return list(self._runs)
+
+    def ranges(self, doc_filter: str) -> np.ndarray:
+        """フィルタに一致するチャンクの [start, end) 範囲（(R, 2)、昇順、隣接は結合済み）"""
+        cached = self._cache.get(doc_filter)
+        if cached is not None:
+            return cached
+
+        pats = patterns(doc_filter)
+        spans = sorted(
+            span
+            for doc_id, doc_spans in self._runs.items()
+            if any(p in doc_id for p in pats)
+            for span in doc_spans
+        )
+        merged: list[list[int]] = []
+        for s, e in spans:
+            if merged and merged[-1][1] == s:
+                merged[-1][1] = e
+            else:
+                merged.append([s, e])
+        result = np.asarray(merged, dtype=np.int64).reshape(-1, 2)
+
+        if len(self._cache) >= _CACHE_SIZE:
+            self._cache.clear()
+        self._cache[doc_filter] = result
+        return result
+
+    def rows(self, doc_filter: str) -> np.ndarray:
+        """フィルタに一致するチャンクの行番号（昇順）"""
+        return range_indices(self.ranges(doc_filter))
+
+    def mask(self, doc_filter: str) -> np.ndarray:
+        """フィルタに一致するチャンクの bool 配列（長さ = チャンク数）"""
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for s, e in self.ranges(doc_filter):
+            mask[s:e] = True
+        return mask
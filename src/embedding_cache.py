@@ -0,0 +1,121 @@
+"""クエリ埋め込みキャッシュ - (モデル, 正規化クエリ) → ベクトルの LRU
+
+hybrid_search / guided_search / SpaceRAG / planner は1つの会話の中で同じ・
+表記ゆれだけのクエリを何度も投げるので、クエリ埋め込みを使い回す。
+
+- キー: モデル名 + 正規化テキスト（NFKC、前後空白除去、連続空白を1つに）
+- 上限件数を超えたら最も古く使われたものから捨てる
+- path を指定すると save() / load() でディスクに保存（keys.json + vectors.npy）
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from src.chunk_store import make_tmp_dir, replace_dir
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """キャッシュキー用のクエリ正規化"""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class EmbeddingCache:
+    """スレッドセーフな LRU 埋め込みキャッシュ（ヒット率付き）"""
+
+    def __init__(self, max_size: int = 1024, path: Path | None = None) -> None:
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        key = (model, normalize_query(text))
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        key = (model, normalize_query(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self._dirty = True
+
+    def stats(self) -> dict:
+        """ヒット数・ミス数・ヒット率・件数"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def save(self) -> None:
+        """path に保存（変更がなければ何もしない）"""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            items = list(self._entries.items())
+            self._dirty = False
+        tmp = make_tmp_dir(self.path)
+        # 次元の違うモデルが混在しうるのでモデルごとに行列を分ける
+        by_model: dict[str, list[tuple[str, np.ndarray]]] = {}
+        for (model, text), vec in items:
+            by_model.setdefault(model, []).append((text, vec))
+        index = []
+        for i, (model, rows) in enumerate(by_model.items()):
+            np.save(tmp / f"vectors_{i}.npy", np.stack([vec for _, vec in rows]))
+            index.append({"model": model, "file": f"vectors_{i}.npy", "texts": [t for t, _ in rows]})
+        with open(tmp / "keys.json", "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        replace_dir(tmp, self.path)
+
+    def load(self) -> None:
+        """path から読み込む（無い・壊れている場合は空のまま）"""
+        if self.path is None or not (self.path / "keys.json").exists():
+            return
+        try:
+            with open(self.path / "keys.json", encoding="utf-8") as f:
+                index = json.load(f)
+            for entry in index:
+                vectors = np.load(self.path / entry["file"])
+                for text, vec in zip(entry["texts"], vectors):
+                    self.put(entry["model"], text, vec)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: クエリ埋め込みキャッシュを読み込めません: {e}")
+        self._dirty = False
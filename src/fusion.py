@@ -0,0 +1,180 @@
+"""スコア統合（fusion） - 複数の候補リストを NumPy 配列のまま1つのランキングにまとめる
+
+各候補リストは (ids, scores) の配列の組。ids は整数（チャンク行番号など）で、
+文字列 ID の場合は encode_ids() で整数に置き換えてから渡す。
+
+統合方式（method）:
+- "weighted": 重み付き・正規化スコア。同じグループ（手法）の中では最大値、
+              別のグループで再びヒットしたら bonus * スコアを加算する（hybrid_search の規則）
+- "rrf":      Reciprocal Rank Fusion。sum(weight / (k + 順位))。スコアは使わない
+- "combsum":  sum(weight * score)
+- "combmnz":  combsum * ヒットしたリスト数
+- "max":      max(weight * score) + bonus * (ヒットしたリスト数 - 1)
+
+normalize=True のリストはリスト内の最大スコアで割って 0-1 に揃える（最大値が 0 以下の
+リストは使わない）。同点はIDの小さい順に並べる。encode_ids() は最初に出現した順に
+ID を振るので、文字列 ID の同点は最初に出現した順になる。
+
+"weighted" はリストの順に結果が変わる規則なので、リスト単位で順に処理する（各リスト内は
+配列演算）。それ以外の方式は全リストを連結して1回の配列演算で計算する。
+"""
+
+from __future__ import annotations
+
+import itertools
+from collections.abc import Hashable, Sequence
+
+import numpy as np
+
+METHODS = ("weighted", "rrf", "combsum", "combmnz", "max")
+
+
+def encode_ids(lists: Sequence[Sequence[Hashable]]) -> tuple[np.ndarray, list[np.ndarray]]:
+    """文字列などの ID 列を整数 ID 配列に変換する → (整数 ID → 元の ID の配列, リストごとの整数 ID 配列)
+
+    整数 ID は最初に出現した順に大きくなる（連番とは限らない。fuse にはそのまま渡せる）。
+    """
+    index: dict = {}
+    counter = itertools.count()
+    encoded = [
+        np.fromiter(map(index.setdefault, ids, counter), dtype=np.int64, count=len(ids))
+        for ids in lists
+    ]
+    keys = np.empty(next(counter), dtype=object)
+    keys[np.fromiter(index.values(), dtype=np.int64, count=len(index))] = list(index)
+    return keys, encoded
+
+
+def fuse(
+    ids: Sequence[np.ndarray],
+    scores: Sequence[np.ndarray] | None = None,
+    method: str = "combsum",
+    weights: Sequence[float] | None = None,
+    normalize: bool | Sequence[bool] = False,
+    groups: Sequence[Hashable] | None = None,
+    k: int = 60,
+    bonus: float = 0.0,
+    top_k: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """候補リストを統合し、(ID, 統合スコア) をスコア降順で返す
+
+    Args:
+        ids: リストごとの ID 配列（"rrf" では並び順が順位）
+        scores: リストごとのスコア配列（"rrf" では不要）
+        method: 統合方式（METHODS）
+        weights: リストごとの重み（省略時は全て 1）
+        normalize: リスト内の最大スコアで割るか（リストごとに指定も可）
+        groups: リストごとのグループ（"weighted" 用。省略時は各リストが別グループ）
+        k: RRF の定数
+        bonus: "weighted" では別グループでのヒットに掛ける係数、
+               "max" では2つ目以降のリストでのヒット1回あたりの加点
+        top_k: 上位何件を返すか（省略時は全件）
+    """
+    if method not in METHODS:
+        raise ValueError(f"未対応の統合方式です: {method}（{', '.join(METHODS)}）")
+    n_lists = len(ids)
+    weights = np.ones(n_lists) if weights is None else np.asarray(weights, dtype=np.float64)
+    flags = [normalize] * n_lists if isinstance(normalize, bool) else list(normalize)
+    ids = [np.asarray(x, dtype=np.int64) for x in ids]
+    if scores is None:
+        if method != "rrf":
+            raise ValueError(f"{method} にはスコアが必要です")
+        scores = [np.zeros(len(x)) for x in ids]
+    scores = [np.asarray(s, dtype=np.float64) for s in scores]
+
+    # 正規化（最大値が 0 以下のリストは使わない）
+    used = []
+    for i, (list_ids, list_scores) in enumerate(zip(ids, scores)):
+        if not len(list_ids):
+            continue
+        if method != "rrf" and flags[i]:
+            max_score = list_scores.max()
+            if max_score <= 0:
+                continue
+            list_scores = list_scores / max_score
+        used.append((i, list_ids, list_scores))
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+    if not used:
+        return empty
+
+    # ID → 位置。ID が密（encode_ids の出力や行番号）ならそのまま位置に使い、疎なら詰める
+    cat_ids = np.concatenate([list_ids for _, list_ids, _ in used])
+    lo, hi = int(cat_ids.min()), int(cat_ids.max())
+    if lo >= 0 and hi < 4 * len(cat_ids) + 1024:
+        universe, positions, size = None, cat_ids, hi + 1
+    else:
+        universe, positions = np.unique(cat_ids, return_inverse=True)
+        size = len(universe)
+    bounds = np.cumsum([0] + [len(list_ids) for _, list_ids, _ in used])
+    list_no = np.repeat(np.asarray([i for i, _, _ in used]), np.diff(bounds))
+
+    if method == "weighted":
+        fused = _weighted(used, positions, bounds, size, weights, groups, bonus)
+    elif method == "rrf":
+        rank = np.arange(len(positions)) - np.repeat(bounds[:-1], np.diff(bounds)) + 1
+        fused = np.bincount(positions, weights=weights[list_no] / (k + rank), minlength=size)
+    else:
+        contrib = np.concatenate([s for _, _, s in used]) * weights[list_no]
+        if method == "max":
+            fused = np.full(size, -np.inf)
+            np.maximum.at(fused, positions, contrib)
+        else:
+            fused = np.bincount(positions, weights=contrib, minlength=size)
+        if method == "combmnz" or (method == "max" and bonus):
+            # ヒットしたリスト数（同じリスト内の重複は1回と数える）
+            pairs = np.unique(positions * n_lists + list_no)
+            hits = np.bincount(pairs // n_lists, minlength=size)
+            fused = fused * hits if method == "combmnz" else fused + bonus * (hits - 1)
+
+    cand = np.flatnonzero(np.bincount(positions, minlength=size)) if universe is None else np.arange(size)
+    top, top_scores = _select_top(cand, fused[cand], top_k)
+    return (top if universe is None else universe[top]), top_scores
+
+
+def _select_top(cand: np.ndarray, scores: np.ndarray, k: int | None) -> tuple[np.ndarray, np.ndarray]:
+    """スコア降順（同点は位置の小さい順）に上位 k 件（k=None なら全件）"""
+    if k is not None and len(cand) > k:
+        if k <= 0:
+            return cand[:0], scores[:0]
+        # K位と同点のものは全て残してから並べる
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= kth
+        cand, scores = cand[keep], scores[keep]
+    order = np.lexsort((cand, -scores))[:k]
+    return cand[order], scores[order]
+
+
+def _weighted(used: list, positions: np.ndarray, bounds: np.ndarray, size: int, weights: np.ndarray,
+              groups: Sequence[Hashable] | None, bonus: float) -> np.ndarray:
+    """weighted 方式の統合（リストの順に1リストずつ、リスト内は配列演算）"""
+    group_no: dict = {}
+    labels = [group_no.setdefault(groups[i] if groups is not None else i, len(group_no)) for i, _, _ in used]
+    fused = np.full(size, np.nan)
+    seen = np.zeros((len(group_no), size), dtype=bool)
+    mark = np.full(size, -1, dtype=np.int64)
+
+    for n, ((i, _, list_scores), g) in enumerate(zip(used, labels)):
+        pos = positions[bounds[n]:bounds[n + 1]]
+        w = list_scores * weights[i]
+        mark[pos] = np.arange(len(pos))
+        if (mark[pos] != np.arange(len(pos))).any():
+            # リスト内の重複は最大スコアを使う
+            order = np.lexsort((-w, pos))
+            pos, w = pos[order], w[order]
+            first = np.concatenate([[True], pos[1:] != pos[:-1]])
+            pos, w = pos[first], w[first]
+        current = fused[pos]
+        fused[pos] = np.where(np.isnan(current), w,
+                              np.where(seen[g, pos], np.maximum(current, w), current + bonus * w))
+        seen[g, pos] = True
+    return fused
+
+
+def hit_lists(ids: Sequence[np.ndarray], targets: np.ndarray) -> list[list[int]]:
+    """targets の各 ID がヒットしたリスト番号（リスト順、重複なし）"""
+    targets = np.asarray(targets, dtype=np.int64)
+    hits: list[list[int]] = [[] for _ in range(len(targets))]
+    for list_no, list_ids in enumerate(ids):
+        for t in np.flatnonzero(np.isin(targets, list_ids)):
+            hits[t].append(list_no)
+    return hits
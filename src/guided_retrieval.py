@@ -12,40 +12,37 @@ Stage 2: 絞り込んだ文書内でハイブリッド検索を実行
 
 import yaml
 import re
+import time
 from pathlib import Path
 from typing import Optional
 
+from src.tracing import span, trace
+
 KNOWLEDGE_DIR = Path(__file__).parent.parent / "knowledge"
 
 
-def load_domain_map() -> dict:
-    """domain_map.yamlを読み込む"""
-    path = KNOWLEDGE_DIR / "domain_map.yaml"
+def _read_yaml(filename: str) -> dict:
+    """knowledge/ の YAML を読み込む（無ければ空）"""
+    path = KNOWLEDGE_DIR / filename
     if not path.exists():
         return {}
-    with open(path, encoding="utf-8") as f:
-        data = yaml.safe_load(f)
-    return data.get("domains", {})
+    with span("load_yaml", file=filename), open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_domain_map() -> dict:
+    """domain_map.yamlを読み込む"""
+    return _read_yaml("domain_map.yaml").get("domains", {})
 
 
 def load_glossary() -> dict:
     """glossary.yamlを読み込む"""
-    path = KNOWLEDGE_DIR / "glossary.yaml"
-    if not path.exists():
-        return {}
-    with open(path, encoding="utf-8") as f:
-        data = yaml.safe_load(f)
-    return data.get("terms", {})
+    return _read_yaml("glossary.yaml").get("terms", {})
 
 
 def load_decision_trees() -> dict:
     """decision_trees.yamlを読み込む"""
-    path = KNOWLEDGE_DIR / "decision_trees.yaml"
-    if not path.exists():
-        return {}
-    with open(path, encoding="utf-8") as f:
-        data = yaml.safe_load(f)
-    return data.get("trees", {})
+    return _read_yaml("decision_trees.yaml").get("trees", {})
 
 
 def _is_subsumed_by_any(kw: str, all_keywords: list[str], text: str) -> bool:
@@ -256,10 +253,13 @@ def load_procedure(procedure_name: str) -> Optional[dict]:
     return None
 
 
-def guided_search(query: str, top_k: int = 5, client=None, model=None) -> dict:
+def guided_search(query: str, top_k: int = 5, client=None, model=None, use_cache: bool = True) -> dict:
     """
     ガイド付き2段階検索のメインエントリポイント
 
+    use_cache=True なら同じ検索の結果を src/search_cache.py から返す
+    （インデックス・辞書の更新で無効化。leg_report["cache"] が "hit" になる）
+
     Returns:
         {
             "results": [...],          # 検索結果
@@ -267,14 +267,41 @@ def guided_search(query: str, top_k: int = 5, client=None, model=None) -> dict:
             "procedure": {...} or None, # マッチした手順
             "expert_notes": [...],     # 専門家ノート
             "methods_used": [...],     # 使用された検索手法
-            "doc_filter": "..." or None # 適用された文書フィルタ
+            "doc_filter": "..." or None, # 適用された文書フィルタ
+            "leg_report": {...},       # 手法ごとの状態と所要時間（hybrid_search の report）
+            "trace": {...},            # 区間ごとの所要時間・件数（src/tracing.py、最上位の呼び出し時のみ）
         }
     """
+    with trace("guided_search", query=query, top_k=top_k) as tr:
+        result = _guided_search(query, top_k, client, model, use_cache)
+    if tr.closed:
+        result["trace"] = tr.to_dict()
+    return result
+
+
+def _guided_search(query: str, top_k: int, client, model, use_cache: bool) -> dict:
+    from src import search_cache
     from src.hybrid_search import hybrid_search
 
+    if use_cache:
+        t_start = time.perf_counter()
+        generation = search_cache.current_generation()
+        key = search_cache.make_key("guided", query, top_k=top_k, model=model if client else None)
+        with span("cache_lookup") as sp:
+            cached = search_cache.get_cache().get(key)
+            sp.set(hit=cached is not None)
+        if cached is not None:
+            cached["leg_report"] = {
+                "legs": {}, "total_ms": round((time.perf_counter() - t_start) * 1000, 1), "cache": "hit",
+            }
+            return cached
+
     # Stage 1: Domain detection
-    domains = detect_domain(query)
-    procedure = find_matching_procedure(query)
+    with span("detect_domain") as sp:
+        domains = detect_domain(query)
+        sp.set(count=len(domains))
+    with span("find_procedure"):
+        procedure = find_matching_procedure(query)
 
     expert_notes = []
     doc_filter = None
@@ -296,12 +323,15 @@ def guided_search(query: str, top_k: int = 5, client=None, model=None) -> dict:
             doc_filter = "|".join(set(target_docs))
 
     # Stage 2: Focused hybrid search
+    leg_report = {}
     results, methods = hybrid_search(
         query=query,
         top_k=top_k,
         doc_filter=doc_filter,
         client=client,
         model=model,
+        report=leg_report,
+        use_cache=use_cache,
     )
 
     # If no results with filter, fall back to unfiltered search
@@ -312,14 +342,24 @@ def guided_search(query: str, top_k: int = 5, client=None, model=None) -> dict:
             doc_filter=None,
             client=client,
             model=model,
+            report=leg_report,
+            use_cache=use_cache,
         )
         doc_filter = None  # Mark that filter was removed
 
-    return {
+    result = {
         "results": results,
         "domains": domains[:3],  # Top 3 domains
         "procedure": procedure,
         "expert_notes": [n for n in expert_notes if n],
         "methods_used": methods,
         "doc_filter": doc_filter,
+        "leg_report": leg_report,
     }
+    if use_cache:
+        # 打ち切り・失敗した手法がある結果は縮退しているので保存しない
+        if any(leg["status"] in ("timeout", "error") for leg in leg_report.get("legs", {}).values()):
+            search_cache.get_cache().skip()
+        else:
+            search_cache.get_cache().put(key, result, generation)
+    return result
@@ -7,16 +7,44 @@
 5. LLMクエリ拡張 + BM25
 6. 相互参照グラフによる関連文書補強（doc_filter指定時）
 
-スコアの統合方針:
+スコアの統合方針（src/fusion.py の "weighted"）:
 - 各手法のスコアは正規化（最大値で除算）してから weight を掛ける
 - これにより BM25（スコア ~10-30）とベクトル（スコア 0-1）のスケール差を吸収
-- 複数手法でヒットした場合は 10% ボーナス
+- 複数手法でヒットした場合はボーナス（後の手法のスコアの半分を加算）
 
 全ての結果をスコア統合して、重複除去して返す。
+3〜5 は同時に実行し、手法ごとの予算（DEFAULT_LEG_BUDGETS）を超えたものは捨てる。
+BM25 を使う手法（1, 2, 5 と 6）はクエリ変種をまとめて searcher.search_many で引き、
+トークン化と postings の走査を変種間で共有する。
+同じ検索の結果は src/search_cache.py にキャッシュする（インデックス更新で無効化）。
 """
 
-from src.searcher import search as bm25_search
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from src import search_cache
+from src.fusion import encode_ids, fuse, hit_lists
+from src.searcher import search_many as bm25_search_many
 from src.synonym import expand_with_synonyms
+from src.tracing import span, trace
+
+# 手法ごとの待ち時間の上限（秒、並行実行の開始から）。超えた手法は結果に使わない
+DEFAULT_LEG_BUDGETS = {
+    "vector": 3.0,
+    "summary": 1.0,
+    "llm_expand": 8.0,
+    "cross_ref": 1.0,
+}
+
+# 統合の順序（スコアのボーナス計算は順序に依存するので完了順ではなくこの順で統合）
+_LEG_ORDER = ("vector", "summary", "llm_expand")
+
+# 各手法を並行実行するスレッドプール（打ち切った手法はバックグラウンドで終わるまで走る）。
+# 打ち切られた手法がワーカーを塞いでいる間に待たされた手法は、予算を過ぎていれば実行せずに終える
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid")
 
 
 def hybrid_search(
@@ -28,9 +56,16 @@ def hybrid_search(
     use_llm_expansion: bool = True,
     use_cross_reference: bool = True,
     cross_ref_depth: int = 1,
+    leg_budgets: dict[str, float] | None = None,
+    report: dict | None = None,
+    use_cache: bool = True,
 ) -> tuple[list[dict], list[str]]:
     """4手法を全て使ってハイブリッド検索を実行する
 
+    BM25（元のクエリ + 同義語展開）は呼び出しスレッドで、ベクトル・要約・
+    LLMクエリ拡張はスレッドプールで同時に実行する。予算内に終わらなかった・
+    失敗した手法は捨てて残りの結果だけで統合する。
+
     Args:
         query: ユーザーの検索クエリ
         top_k: 最終的に返す件数
@@ -40,100 +75,240 @@ def hybrid_search(
         use_llm_expansion: LLMクエリ拡張を使うか
         use_cross_reference: 相互参照グラフによる関連文書検索を使うか
         cross_ref_depth: 相互参照を何ホップまで辿るか
+        leg_budgets: 手法ごとの待ち時間上限（秒）。DEFAULT_LEG_BUDGETS を上書き
+        report: 渡すと手法ごとの状態と所要時間を書き込む
+                {"legs": {手法: {"status": "ok"|"empty"|"timeout"|"error", "ms": ...}},
+                 "total_ms": ..., "cache": "hit"|"miss"}
+        use_cache: 結果キャッシュ（src/search_cache.py）を使うか
+
+    report には区間ごとの所要時間・件数（src/tracing.py）も "trace" として書き込む
+    （guided_search など外側のトレースの中で呼ばれた場合は外側にまとめて記録）。
 
     Returns:
         (スコア統合・重複除去済みの検索結果リスト, 使用した検索手法リスト)
     """
-    all_results: dict[str, dict] = {}  # chunk_id → result dict (最高スコアを保持)
+    with trace("hybrid_search", query=query, top_k=top_k, doc_filter=doc_filter) as tr:
+        final, methods_used = _hybrid_search(
+            query, top_k, doc_filter, client, model, use_llm_expansion,
+            use_cross_reference, cross_ref_depth, leg_budgets, report, use_cache,
+        )
+    if report is not None and tr.closed:
+        report["trace"] = tr.to_dict()
+    return final, methods_used
+
+
+def _hybrid_search(
+    query, top_k, doc_filter, client, model, use_llm_expansion,
+    use_cross_reference, cross_ref_depth, leg_budgets, report, use_cache,
+) -> tuple[list[dict], list[str]]:
+    t_start = time.perf_counter()
+    budgets = {**DEFAULT_LEG_BUDGETS, **(leg_budgets or {})}
+    use_llm_expansion = bool(use_llm_expansion and client and model)
+
+    if use_cache:
+        generation = search_cache.current_generation()
+        key = search_cache.make_key(
+            "hybrid", query, top_k=top_k, doc_filter=doc_filter,
+            model=model if use_llm_expansion else None,
+            use_cross_reference=use_cross_reference, cross_ref_depth=cross_ref_depth,
+            leg_budgets=budgets,
+        )
+        with span("cache_lookup") as sp:
+            cached = search_cache.get_cache().get(key)
+            sp.set(hit=cached is not None)
+        if cached is not None:
+            if report is not None:
+                report.update({"legs": {}, "total_ms": _ms(t_start), "cache": "hit"})
+            return tuple(cached)
+
+    legs: dict[str, dict] = {}
+    merged: list[tuple] = []  # 統合する結果リスト [(weight, method, normalize, results), ...]
     methods_used = []
 
-    # --- 1. BM25キーワード検索（基本）---
-    bm25_results = bm25_search(query, top_k=top_k, doc_filter=doc_filter)
-    _merge_results(all_results, bm25_results, weight=1.0, method="bm25", normalize=True)
+    # --- 並行実行する手法を先に投入 ---
+    futures = {
+        "vector": _submit("vector", _deadline(t_start, budgets.get("vector")),
+                          _vector_leg, query, top_k, doc_filter),
+        "summary": _submit("summary", _deadline(t_start, budgets.get("summary")),
+                           _summary_leg, query, top_k, doc_filter),
+    }
+    if use_llm_expansion:
+        futures["llm_expand"] = _submit("llm_expand", _deadline(t_start, budgets.get("llm_expand")),
+                                        _llm_expand_leg, query, top_k, doc_filter, client, model)
+
+    # --- 1. BM25キーワード検索（基本）+ 2. 同義語展開 + BM25（呼び出しスレッドで一括検索）---
+    t0 = time.perf_counter()
+    with span("bm25") as sp:
+        syn_queries = expand_with_synonyms(query)
+        batch = bm25_search_many(syn_queries, top_k=top_k, doc_filters=[doc_filter] * len(syn_queries))
+        sp.set(queries=len(syn_queries), count=sum(len(r) for r in batch))
+    legs["bm25"] = {"status": "ok", "ms": _ms(t0)}
+
+    merged.append((1.0, "bm25", True, batch[0]))
     methods_used.append("bm25")
 
-    # --- 2. 同義語展開 + BM25 ---
-    syn_queries = expand_with_synonyms(query)
-    for sq in syn_queries[1:]:  # 元のクエリは既に検索済み
-        syn_results = bm25_search(sq, top_k=top_k, doc_filter=doc_filter)
-        _merge_results(all_results, syn_results, weight=0.8, method="synonym", normalize=True)
+    merged.extend((0.8, "synonym", True, syn_results) for syn_results in batch[1:])
     if len(syn_queries) > 1:
         methods_used.append("synonym")
 
-    # --- 3. ベクトル検索（利用可能な場合）---
-    # コサイン類似度（0-1）は既にスケール済みなので normalize=False
+    # --- 3. ベクトル検索 / 4. 要約インデックス検索 / 5. LLMクエリ拡張 + BM25 ---
+    for name in _LEG_ORDER:
+        if name not in futures:
+            continue
+        legs[name], leg_results = _collect(futures[name], budgets.get(name), t_start)
+        if not leg_results:
+            continue
+        merged.extend(leg_results)
+        methods_used.append(name)
+
+    # --- 6. 相互参照グラフによる関連文書補強（他の手法の結果に依存するので後段）---
+    if use_cross_reference:
+        t_xref = time.perf_counter()
+        found_docs = {r["doc_id"] for *_, results in _fused_lists(merged) for r in results}
+        future = _submit("cross_ref", _deadline(t_xref, budgets.get("cross_ref")),
+                         _cross_ref_leg, query, doc_filter, found_docs, cross_ref_depth)
+        legs["cross_ref"], leg_results = _collect(future, budgets.get("cross_ref"), t_xref)
+        if leg_results:
+            merged.extend(leg_results)
+            methods_used.append("cross_ref")
+
+    # --- スコア統合（src/fusion.py）して上位N件 ---
+    with span("fusion", lists=len(merged)):
+        final = _merge_results(merged, top_k)
+
+    if use_cache:
+        # 打ち切り・失敗した手法がある結果は縮退しているので保存しない
+        if any(leg["status"] in ("timeout", "error") for leg in legs.values()):
+            search_cache.get_cache().skip()
+        else:
+            search_cache.get_cache().put(key, [final, methods_used], generation)
+
+    if report is not None:
+        report["legs"] = legs
+        report["total_ms"] = _ms(t_start)
+        if use_cache:
+            report["cache"] = "miss"
+
+    return final, methods_used
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def _deadline(t_origin: float, budget: float | None) -> float | None:
+    """予算の期限（perf_counter の時刻。予算なしなら None）"""
+    return None if budget is None else t_origin + budget
+
+
+def _submit(name: str, deadline: float | None, fn, *args):
+    """手法をスレッドプールに投入（投入時刻も一緒に返す）。トレースは呼び出し元を引き継ぐ"""
+    ctx = contextvars.copy_context()
+    return time.perf_counter(), _executor.submit(ctx.run, _timed, name, deadline, fn, *args)
+
+
+def _timed(name: str, deadline: float | None, fn, *args):
+    """手法を実行し (結果, 所要ms) を返す。例外は所要時間を付けて送り直す
+
+    ワーカーの空き待ちで deadline を過ぎていたら、結果はもう使われないので実行しない。
+    """
+    t0 = time.perf_counter()
+    if deadline is not None and t0 >= deadline:
+        return [], 0.0
+    try:
+        with span(name) as sp:
+            leg_results = fn(*args)
+            sp.set(count=sum(len(results) for *_, results in leg_results))
+        return leg_results, _ms(t0)
+    except Exception as e:
+        e.leg_ms = _ms(t0)
+        raise
+
+
+def _collect(submitted, budget: float | None, t_origin: float) -> tuple[dict, list | None]:
+    """手法の結果を予算内で待つ → (レポート, 統合する結果リスト or None)
+
+    予算は t_origin（並行実行の開始）からの経過時間で数える。
+    手法の結果は [(weight, method, normalize, results), ...]。空リストは「使わなかった」。
+    """
+    t_submit, future = submitted
+    remaining = None if budget is None else max(0.0, budget - (time.perf_counter() - t_origin))
+    try:
+        leg_results, ms = future.result(timeout=remaining)
+    except FutureTimeout:
+        return {"status": "timeout", "ms": _ms(t_submit), "budget_ms": budget * 1000}, None
+    except Exception as e:
+        return {"status": "error", "ms": getattr(e, "leg_ms", _ms(t_submit)),
+                "error": f"{type(e).__name__}: {e}"}, None
+    return {"status": "ok" if leg_results else "empty", "ms": ms}, leg_results
+
+
+def _vector_leg(query: str, top_k: int, doc_filter: str | None) -> list:
+    """3. ベクトル検索（利用可能な場合）"""
     try:
         from src.vector_search import search as vec_search, is_available as vec_available
-        if vec_available():
-            vec_results = vec_search(query, top_k=top_k, doc_filter=doc_filter)
-            _merge_results(all_results, vec_results, weight=0.9, method="vector", normalize=False)
-            methods_used.append("vector")
-    except (ImportError, FileNotFoundError):
-        pass
-
-    # --- 4. 要約インデックス検索（利用可能な場合）---
+    except ImportError:
+        return []
+    if not vec_available():
+        return []
+    # コサイン類似度（0-1）は既にスケール済みなので normalize=False
+    return [(0.9, "vector", False, vec_search(query, top_k=top_k, doc_filter=doc_filter))]
+
+
+def _summary_leg(query: str, top_k: int, doc_filter: str | None) -> list:
+    """4. 要約インデックス検索（利用可能な場合）"""
     try:
         from src.chunk_summarizer import search as summary_search, is_available as sum_available
-        if sum_available():
-            sum_results = summary_search(query, top_k=top_k, doc_filter=doc_filter)
-            _merge_results(all_results, sum_results, weight=0.7, method="summary", normalize=True)
-            methods_used.append("summary")
-    except (ImportError, FileNotFoundError):
-        pass
-
-    # --- 5. LLMクエリ拡張 + BM25 ---
-    if use_llm_expansion and client and model:
-        try:
-            from src.query_expander import expand_query
-            expanded = expand_query(client, model, query)
-            for eq in expanded[1:]:  # 元のクエリはスキップ
-                exp_results = bm25_search(eq, top_k=top_k, doc_filter=doc_filter)
-                _merge_results(all_results, exp_results, weight=0.6, method="llm_expand", normalize=True)
-            if len(expanded) > 1:
-                methods_used.append("llm_expand")
-        except Exception:
-            pass
-
-    # --- 6. 相互参照グラフによる関連文書補強 ---
-    if use_cross_reference:
-        try:
-            related_docs = _get_cross_ref_docs(
-                query=query,
-                doc_filter=doc_filter,
-                current_results=all_results,
-                depth=cross_ref_depth,
-            )
-            if related_docs:
-                # 関連文書に絞ってBM25検索を追加実行
-                for rel_doc in related_docs[:5]:  # 最大5文書まで
-                    xref_results = bm25_search(query, top_k=3, doc_filter=rel_doc)
-                    _merge_results(all_results, xref_results, weight=0.5, method="cross_ref", normalize=True)
-                methods_used.append("cross_ref")
-        except Exception:
-            pass
-
-    # --- スコア順にソートして返す ---
-    sorted_results = sorted(
-        all_results.values(),
-        key=lambda x: x["combined_score"],
-        reverse=True,
-    )
+    except ImportError:
+        return []
+    if not sum_available():
+        return []
+    return [(0.7, "summary", True, summary_search(query, top_k=top_k, doc_filter=doc_filter))]
+
 
-    # 上位N件
-    final = sorted_results[:top_k]
+def _llm_expand_leg(query: str, top_k: int, doc_filter: str | None, client, model: str) -> list:
+    """5. LLMクエリ拡張 + BM25（拡張クエリは一括検索）"""
+    with span("llm_call"):
+        expanded = _llm_expansions(query, client, model)[1:]  # 元のクエリはスキップ
+    if not expanded:
+        return []
+    with span("bm25", queries=len(expanded)):
+        batch = bm25_search_many(expanded, top_k=top_k, doc_filters=[doc_filter] * len(expanded))
+    return [(0.6, "llm_expand", True, results) for results in batch]
+
+
+def _cross_ref_leg(query: str, doc_filter: str | None, found_docs: set[str], depth: int) -> list:
+    """6. 相互参照グラフの関連文書に絞った BM25（最大5文書、1回の一括検索で
+    postings は関連文書の行範囲だけを読む）"""
+    with span("cross_ref_graph") as sp:
+        related_docs = _get_cross_ref_docs(
+            query=query,
+            doc_filter=doc_filter,
+            found_docs=found_docs,
+            depth=depth,
+        )
+        sp.set(count=len(related_docs))
+    if not related_docs:
+        return []
+    rel_docs = related_docs[:5]
+    with span("bm25", queries=len(rel_docs)):
+        batch = bm25_search_many([query] * len(rel_docs), top_k=3, doc_filters=rel_docs)
+    return [(0.5, "cross_ref", True, results) for results in batch]
 
-    # メタ情報を追加
-    for r in final:
-        r["score"] = r.pop("combined_score")
-        r["methods"] = r.pop("matched_methods")
 
-    return final, methods_used
+def _llm_expansions(query: str, client, model: str) -> list[str]:
+    """LLMクエリ拡張（先頭は元のクエリ）。失敗時は空リスト"""
+    try:
+        from src.query_expander import expand_query
+        return expand_query(client, model, query)
+    except Exception:
+        return []
 
 
 def _get_cross_ref_docs(
     query: str,
     doc_filter: str | None,
-    current_results: dict,
+    found_docs: set[str],
     depth: int = 1,
 ) -> list[str]:
     """
@@ -143,17 +318,15 @@ def _get_cross_ref_docs(
     まだ結果に含まれていない関連文書を見つける。
     """
     from src.cross_reference import load_graph, get_related_docs
+    from src.doc_filter import matches
 
     graph = load_graph()
     nodes = graph.get("nodes", {})
 
-    # 現在の結果に含まれる文書を収集
-    found_docs = set(r["doc_id"] for r in current_results.values())
-
     # doc_filterが指定されている場合はその文書から参照を辿る
     if doc_filter:
-        # doc_filterに部分一致する文書ID
-        seed_docs = [d for d in nodes if doc_filter in d]
+        # doc_filterに部分一致する文書ID（"A|B" はどちらか）
+        seed_docs = [d for d in nodes if matches(doc_filter, d)]
     else:
         seed_docs = list(found_docs)
 
@@ -172,54 +345,53 @@ def _get_cross_ref_docs(
     return sorted(new_docs)
 
 
-def _merge_results(
-    all_results: dict,
-    new_results: list[dict],
-    weight: float,
-    method: str,
-    normalize: bool = True,
-):
-    """検索結果をマージ。同じチャンクは最高スコアを保持。
+def _fused_lists(merged: list[tuple]) -> list[tuple]:
+    """統合に使われる結果リスト（空のリスト・正規化できないリストを除く）"""
+    return [
+        entry for entry in merged
+        if entry[3] and not (entry[2] and max(r["score"] for r in entry[3]) <= 0)
+    ]
+
+
+def _merge_results(merged: list[tuple], top_k: int) -> list[dict]:
+    """各手法の結果リストをスコア統合して上位 top_k 件を返す
+
+    スコアは手法ごとに正規化（normalize=True ならリスト内の最大値で除算）して weight を掛ける。
+    同じ手法で再びヒットした（クエリ変種など）場合は最大値、別の手法でもヒットした場合は
+    0.5 倍を加算する（fusion.fuse の "weighted"）。
 
     Args:
-        all_results: マージ先の辞書
-        new_results: 追加する検索結果
-        weight: このメソッドのスコアに掛ける重み（0-1）
-        method: 手法名（重複判定に使用）
-        normalize: True の場合、バッチ内の最大スコアで正規化して 0-1 に揃える
-                   False の場合はスコアをそのまま使う（コサイン類似度など 0-1 が保証されているもの）
+        merged: [(weight, method, normalize, results), ...]（統合の順）
+        top_k: 返す件数
+
+    Returns:
+        [{"doc_id", "chunk_id", "filename", "text", "score", "methods"}, ...]
     """
-    if not new_results:
-        return
-
-    # スコア正規化: BM25 のような生スコアを 0-1 に変換
-    if normalize:
-        max_score = max(r["score"] for r in new_results)
-        if max_score <= 0:
-            return
-        scores = [r["score"] / max_score for r in new_results]
-    else:
-        scores = [r["score"] for r in new_results]
-
-    for r, norm_score in zip(new_results, scores):
-        chunk_id = r["chunk_id"]
-        weighted_score = norm_score * weight
-
-        if chunk_id in all_results:
-            existing = all_results[chunk_id]
-            if method not in existing["matched_methods"]:
-                existing["matched_methods"].append(method)
-                # 複数手法でヒットした場合は加算してボーナス
-                existing["combined_score"] = existing["combined_score"] + weighted_score * 0.5
-            else:
-                # 同じ手法で再度ヒット（クエリ拡張等）は最大値を採用
-                existing["combined_score"] = max(existing["combined_score"], weighted_score)
-        else:
-            all_results[chunk_id] = {
-                "doc_id": r["doc_id"],
-                "chunk_id": chunk_id,
-                "filename": r["filename"],
-                "text": r["text"],
-                "combined_score": weighted_score,
-                "matched_methods": [method],
-            }
+    merged = _fused_lists(merged)
+    _, ids = encode_ids([[r["chunk_id"] for r in results] for *_, results in merged])
+    top_ids, top_scores = fuse(
+        ids,
+        [np.fromiter((r["score"] for r in results), dtype=np.float64, count=len(results))
+         for *_, results in merged],
+        method="weighted",
+        weights=[weight for weight, *_ in merged],
+        normalize=[normalize for _, _, normalize, _ in merged],
+        groups=[method for _, method, _, _ in merged],
+        bonus=0.5,
+        top_k=top_k,
+    )
+
+    # 最初にヒットしたリストの結果を元にメタ情報を付ける
+    final = []
+    for chunk_id, score, hits in zip(top_ids, top_scores, hit_lists(ids, top_ids)):
+        first = hits[0]
+        r = merged[first][3][int(np.flatnonzero(ids[first] == chunk_id)[0])]
+        final.append({
+            "doc_id": r["doc_id"],
+            "chunk_id": r["chunk_id"],
+            "filename": r["filename"],
+            "text": r["text"],
+            "score": float(score),
+            "methods": list(dict.fromkeys(merged[i][1] for i in hits)),
+        })
+    return final
@@ -1,24 +1,47 @@
-"""JERG PDF → テキスト → チャンク → BM25インデックス構築"""
-
+"""JERG PDF → テキスト → チャンク → BM25インデックス構築
+
+使い方:
+  uv run python -m src.indexer               # 逐次処理（前回から変わったPDFだけ処理）
+  uv run python -m src.indexer --workers 8   # 8プロセスで PDF 抽出・トークン化
+  uv run python -m src.indexer --full        # マニフェストを無視して全件再構築
+
+増分更新:
+  data/index/manifest.json に PDF ごとの (size, mtime, sha256) とチャンク範囲を記録し、
+  追加・変更・削除されたPDFだけを処理する。抽出したページテキストは
+  data/index/page_cache/<sha256>.json にキャッシュするので、CHUNK_SIZE を変えても
+  PDFの再パースは不要。要約・埋め込みは内容が変わったチャンクだけ無効化・再計算する。
+"""
+
+import argparse
+import hashlib
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from pypdf import PdfReader
-from fugashi import Tagger
 
+from src import search_cache
+from src.bm25_index import BM25Index
+from src.chunk_store import reset_store, source_signature, write_store
 from src.config import WORKING_DIR
+from src.tokenizer import get_tagger, tokenize, tokenize_many
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 JERG_DIR = DATA_DIR / "jerg"
 INDEX_DIR = DATA_DIR / "index"
+BM25_DIR = INDEX_DIR / "bm25"
+MANIFEST_PATH = INDEX_DIR / "manifest.json"
+PAGE_CACHE_DIR = INDEX_DIR / "page_cache"
+
+MANIFEST_VERSION = 1
 
 # チャンク設定
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 100
 
 
-def extract_text_from_pdf(pdf_path: Path) -> str:
-    """PDFからテキストを抽出"""
+def extract_pages_from_pdf(pdf_path: Path) -> list[str] | None:
+    """PDFからページごとのテキストを抽出（読み取り失敗時は None）"""
     try:
         reader = PdfReader(str(pdf_path))
         pages = []
@@ -26,10 +49,46 @@ def extract_text_from_pdf(pdf_path: Path) -> str:
             text = page.extract_text()
             if text:
                 pages.append(text)
-        return "\n".join(pages)
+        return pages
     except Exception as e:
         print(f"  Warning: {pdf_path.name} の読み取りに失敗: {e}")
-        return ""
+        return None
+
+
+def extract_text_from_pdf(pdf_path: Path) -> str:
+    """PDFからテキストを抽出"""
+    pages = extract_pages_from_pdf(pdf_path)
+    return "\n".join(pages) if pages else ""
+
+
+def file_sha256(path: Path) -> str:
+    """ファイル内容の SHA-256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cached_pages(pdf_path: Path, sha256: str | None, cache_dir: Path | None) -> list[str] | None:
+    """ページテキストをキャッシュから読む。無ければ抽出してキャッシュに書く"""
+    if sha256 is None or cache_dir is None:
+        return extract_pages_from_pdf(pdf_path)
+
+    cache_path = cache_dir / f"{sha256}.json"
+    if cache_path.exists():
+        with open(cache_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    pages = extract_pages_from_pdf(pdf_path)
+    if pages is not None:
+        # 読み取り失敗はキャッシュしない（マニフェストにも載らないので次回再試行する）
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False)
+        tmp.replace(cache_path)
+    return pages
 
 
 def parse_doc_id(filename: str) -> str:
@@ -82,18 +141,107 @@ def split_into_chunks(text: str, doc_id: str, filename: str) -> list[dict]:
 
 
 def tokenize_japanese(text: str) -> list[str]:
-    """fugashi (MeCab) で日本語をトークン化"""
-    tagger = Tagger()
-    tokens = []
-    for word in tagger(text):
-        surface = word.surface
-        if len(surface) > 1 or not surface.isascii():
-            tokens.append(surface)
-    return tokens
-
-
-def build_index():
-    """全JERG PDFからインデックスを構築"""
+    """fugashi (MeCab) で日本語をトークン化（src.tokenizer.tokenize と同じ）"""
+    return tokenize(text)
+
+
+def _init_worker():
+    """PDF処理ワーカーの初期化（プロセスごとに Tagger を先に作っておく）"""
+    get_tagger()
+
+
+def _process_pdf(
+    pdf_path: Path,
+    sha256: str | None = None,
+    cache_dir: Path | None = None,
+) -> tuple[list[dict], list[list[str]]]:
+    """1つのPDFを テキスト抽出 → チャンク分割 → トークン化 する
+
+    sha256 と cache_dir が指定されればページテキストのキャッシュを使う。
+    """
+    doc_id = parse_doc_id(pdf_path.name)
+    pages = _cached_pages(pdf_path, sha256, cache_dir)
+    text = "\n".join(pages) if pages else ""
+    if not text:
+        return [], []
+
+    chunks = split_into_chunks(text, doc_id, pdf_path.name)
+    return chunks, tokenize_many(chunk["text"] for chunk in chunks)
+
+
+def _process_all(
+    pdf_files: list[Path],
+    workers: int,
+    shas: list[str | None] | None = None,
+    cache_dir: Path | None = None,
+) -> list[tuple[list[dict], list[list[str]]]]:
+    """全PDFを処理し、pdf_files と同じ順序で結果を返す
+
+    workers > 1 ならプロセスプールで並列処理する。完了順に進捗を表示し、
+    結果はファイル順に並べ直すので出力は逐次処理と同一になる。
+    """
+    total = len(pdf_files)
+    shas = shas or [None] * total
+    results: list = [None] * total
+
+    def report(done: int, idx: int):
+        pdf_path = pdf_files[idx]
+        n_chunks = len(results[idx][0])
+        print(f"  [{done}/{total}] {pdf_path.name} → {parse_doc_id(pdf_path.name)} ({n_chunks} チャンク)")
+
+    if workers <= 1:
+        _init_worker()
+        for i, pdf_path in enumerate(pdf_files):
+            results[i] = _process_pdf(pdf_path, shas[i], cache_dir)
+            report(i + 1, i)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(_process_pdf, p, shas[i], cache_dir): i
+            for i, p in enumerate(pdf_files)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            results[idx] = future.result()
+            report(done, idx)
+    return results
+
+
+def _load_manifest() -> dict | None:
+    """前回ビルドのマニフェストと成果物（チャンク・トークン）を読む
+
+    Returns:
+        {"manifest": ..., "chunks": [...], "tokens": [...]}。使えない場合は None
+    """
+    chunks_path = INDEX_DIR / "chunks.json"
+    tokens_path = INDEX_DIR / "tokens.json"
+    if not (MANIFEST_PATH.exists() and chunks_path.exists() and tokens_path.exists()):
+        return None
+
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    with open(chunks_path, encoding="utf-8") as f:
+        chunks = json.load(f)
+    with open(tokens_path, encoding="utf-8") as f:
+        tokens = json.load(f)
+    if not (len(chunks) == len(tokens) == manifest.get("n_chunks")):
+        print("  Warning: マニフェストと chunks.json が一致しないため全件再構築します")
+        return None
+
+    return {"manifest": manifest, "chunks": chunks, "tokens": tokens}
+
+
+def build_index(workers: int = 1, full: bool = False):
+    """全JERG PDFからインデックスを構築（前回から変わったPDFだけを処理）
+
+    Args:
+        workers: PDF抽出・トークン化に使うプロセス数（1 = 逐次処理）
+        full: True ならマニフェストを無視して全PDFを処理する
+    """
     if not JERG_DIR.exists():
         print(f"Error: {JERG_DIR} が見つかりません。PDFをダウンロードしてください。")
         return
@@ -103,49 +251,87 @@ def build_index():
         print(f"Error: {JERG_DIR} にPDFファイルがありません。")
         return
 
-    print(f"📚 {len(pdf_files)} 件のPDFをインデックス化中...")
+    previous = None if full else _load_manifest()
+    old_files = previous["manifest"]["files"] if previous else {}
+    # 派生データ（要約・埋め込み）の差分更新用に、前回のチャンクを保持
+    old_chunks = previous["chunks"] if previous else _read_chunks(INDEX_DIR / "chunks.json")
+    same_params = bool(previous) and (
+        previous["manifest"].get("chunk_size") == CHUNK_SIZE
+        and previous["manifest"].get("chunk_overlap") == CHUNK_OVERLAP
+    )
+    if previous and not same_params:
+        print("  チャンク設定が変わったため全PDFを再チャンク化します（ページテキストはキャッシュを使用）")
+
+    # PDFごとに 変更なし（前回のチャンクを再利用）/ 要処理 を判定
+    entries: dict[str, dict] = {}
+    reused: dict[str, tuple[list[dict], list[list[str]]]] = {}
+    todo: list[Path] = []
+    for pdf_path in pdf_files:
+        st = pdf_path.stat()
+        old = old_files.get(pdf_path.name)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            sha = old["sha256"]  # サイズ・mtime が同じならハッシュ計算を省略
+        else:
+            sha = file_sha256(pdf_path)
+        entries[pdf_path.name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+
+        if same_params and old and old["sha256"] == sha and old["chunk_end"] > old["chunk_start"]:
+            s, e = old["chunk_start"], old["chunk_end"]
+            reused[pdf_path.name] = (previous["chunks"][s:e], previous["tokens"][s:e])
+        else:
+            todo.append(pdf_path)
+
+    removed = sorted(set(old_files) - set(entries))
+    if previous:
+        print(f"📚 {len(pdf_files)} 件のPDF: 処理 {len(todo)} 件 / 再利用 {len(reused)} 件 / 削除 {len(removed)} 件")
+        if not todo and not removed:
+            # 内容は同じ（mtime だけ変わった可能性あり）→ マニフェストのみ更新
+            for name, entry in entries.items():
+                old_files[name].update(entry)
+            _write_json(MANIFEST_PATH, previous["manifest"], indent=2)
+            print("✅ 変更なし: インデックスは最新です")
+            return
+    else:
+        print(f"📚 {len(pdf_files)} 件のPDFをインデックス化中（workers={workers}）...")
+
+    processed = dict(zip(
+        (p.name for p in todo),
+        _process_all(todo, workers, [entries[p.name]["sha256"] for p in todo], PAGE_CACHE_DIR),
+    ))
+
+    # チャンクが取れなかったPDF（読み取り失敗など）はマニフェストに載せず、次回も処理し直す
+    page_shas = {e["sha256"] for e in entries.values()}
+    failed = sorted(name for name, (chunks, _) in processed.items() if not chunks)
+    for name in failed:
+        del entries[name]
+    if failed:
+        print(f"  Warning: {len(failed)} 件のPDFからチャンクを取得できませんでした（次回再試行）: "
+              + ", ".join(failed[:5]) + (" ..." if len(failed) > 5 else ""))
 
     all_chunks = []
     all_tokenized = []
-    tagger = Tagger()
-
-    for i, pdf_path in enumerate(pdf_files, 1):
-        doc_id = parse_doc_id(pdf_path.name)
-        print(f"  [{i}/{len(pdf_files)}] {pdf_path.name} → {doc_id}")
-
-        text = extract_text_from_pdf(pdf_path)
-        if not text:
+    for pdf_path in pdf_files:
+        if pdf_path.name not in entries:
             continue
-
-        chunks = split_into_chunks(text, doc_id, pdf_path.name)
-        for chunk in chunks:
-            # トークン化
-            tokens = []
-            for word in tagger(chunk["text"]):
-                surface = word.surface
-                if len(surface) > 1 or not surface.isascii():
-                    tokens.append(surface)
-            all_tokenized.append(tokens)
-            all_chunks.append(chunk)
+        chunks, tokenized = reused.get(pdf_path.name) or processed[pdf_path.name]
+        entries[pdf_path.name]["doc_id"] = parse_doc_id(pdf_path.name)
+        entries[pdf_path.name]["chunk_start"] = len(all_chunks)
+        all_chunks.extend(chunks)
+        all_tokenized.extend(tokenized)
+        entries[pdf_path.name]["chunk_end"] = len(all_chunks)
 
     print(f"\n📊 合計: {len(all_chunks)} チャンク")
 
-    # BM25 インデックスを構築
-    from rank_bm25 import BM25Okapi
-    bm25 = BM25Okapi(all_tokenized)
-
     # 保存
     INDEX_DIR.mkdir(parents=True, exist_ok=True)
 
     # チャンクデータ保存
     chunks_path = INDEX_DIR / "chunks.json"
-    with open(chunks_path, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=1)
+    _write_json(chunks_path, all_chunks, indent=1)
 
     # トークン化データ保存（BM25再構築用）
     tokens_path = INDEX_DIR / "tokens.json"
-    with open(tokens_path, "w", encoding="utf-8") as f:
-        json.dump(all_tokenized, f, ensure_ascii=False)
+    _write_json(tokens_path, all_tokenized)
 
     # 文書一覧保存
     doc_list = {}
@@ -156,13 +342,94 @@ def build_index():
         doc_list[did]["chunk_count"] += 1
 
     doc_list_path = INDEX_DIR / "documents.json"
-    with open(doc_list_path, "w", encoding="utf-8") as f:
-        json.dump(doc_list, f, ensure_ascii=False, indent=2)
+    _write_json(doc_list_path, doc_list, indent=2)
+
+    # 検索用バイナリインデックス（検索プロセスは mmap で開く）
+    write_store(all_chunks, source=chunks_path)
+    reset_store()
+    BM25Index.from_tokens(all_tokenized).save(
+        BM25_DIR, extra_meta={"source": source_signature(chunks_path)}
+    )
+
+    # マニフェスト（最後に書く: 途中で落ちたら次回は前回マニフェスト基準でやり直し）
+    _write_json(MANIFEST_PATH, {
+        "version": MANIFEST_VERSION,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "n_chunks": len(all_chunks),
+        "files": entries,
+    }, indent=2)
+    _prune_page_cache(page_shas)
+
+    search_cache.bump_generation()
 
     print(f"✅ インデックス保存完了: {INDEX_DIR}")
     print(f"   チャンク: {chunks_path}")
+    print(f"   BM25: {BM25_DIR}")
     print(f"   文書数: {len(doc_list)}")
 
+    if old_chunks is not None:
+        _patch_downstream(old_chunks, all_chunks)
+
+
+def _read_chunks(path: Path) -> list[dict] | None:
+    """既存の chunks.json を読む（無ければ None）"""
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: Path, data, indent: int | None = None) -> None:
+    """JSONを一時ファイル経由で書き込む"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    tmp.replace(path)
+
+
+def _prune_page_cache(keep: set[str]) -> None:
+    """マニフェストから参照されなくなったページキャッシュを削除"""
+    if not PAGE_CACHE_DIR.exists():
+        return
+    for path in PAGE_CACHE_DIR.glob("*.json"):
+        if path.stem not in keep:
+            path.unlink()
+
+
+def _patch_downstream(old_chunks: list[dict], new_chunks: list[dict]) -> None:
+    """内容が変わったチャンクについて、要約・埋め込み・相互参照グラフを更新する"""
+    old_text = {c["chunk_id"]: c["text"] for c in old_chunks}
+    new_ids = {c["chunk_id"] for c in new_chunks}
+    stale = {c["chunk_id"] for c in new_chunks if old_text.get(c["chunk_id"]) != c["text"]}
+    stale |= set(old_text) - new_ids
+    if not stale:
+        return
+
+    print(f"\n🔁 変更チャンク {len(stale)} 件の派生データを更新中...")
+
+    try:
+        from src.chunk_summarizer import patch_summaries
+        patch_summaries(new_chunks, stale)
+    except ImportError as e:
+        print(f"  Warning: 要約インデックスを更新できません: {e}")
+
+    try:
+        from src.vector_search import patch_embeddings
+        patch_embeddings(new_chunks, stale)
+    except ImportError as e:
+        print(f"  Warning: 埋め込みを更新できません: {e}")
+
+    from src.cross_reference import GRAPH_PATH, save_graph
+    if GRAPH_PATH.exists():
+        save_graph()
+
 
 if __name__ == "__main__":
-    build_index()
+    parser = argparse.ArgumentParser(description="JERG PDF からBM25インデックスを構築")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="PDF抽出・トークン化の並列プロセス数（既定: 1 = 逐次）")
+    parser.add_argument("--full", action="store_true",
+                        help="マニフェストを無視して全PDFを再処理する")
+    args = parser.parse_args()
+    build_index(workers=args.workers, full=args.full)
@@ -19,9 +19,12 @@ import json
 import hashlib
 from dataclasses import dataclass, field
 from enum import Enum
+from pathlib import Path
 from typing import Any
 import numpy as np
 
+from src.fusion import fuse
+
 
 class RepresentationType(str, Enum):
     ORIGINAL = "original"
@@ -52,6 +55,11 @@ class MultiRepresentationIndex:
     - 検索はすべての表現で行い、最高スコアを採用
     - 最終的な回答には常に original_text を使用
 
+    ベクトルは表現タイプごとに正規化済みの float32 行列1つにまとめ、検索はタイプごとに
+    行列とクエリの内積1回で全文書のコサイン類似度を求める。add_documents は表現タイプごとに
+    テキストをまとめて埋め込む（embed_batch_fn があれば batch_size 件ずつ1回で呼ぶ）。
+    追加したベクトルは次の検索時に行列へまとめる。
+
     使い方:
         idx = MultiRepresentationIndex(embed_fn=my_embedder)
         idx.add_documents(docs_with_representations)
@@ -61,15 +69,21 @@ class MultiRepresentationIndex:
     def __init__(
         self,
         embed_fn: Any = None,
-        weights: dict[str, float] | None = None
+        weights: dict[str, float] | None = None,
+        embed_batch_fn: Any = None,
+        batch_size: int = 64
     ) -> None:
         """
         Args:
             embed_fn: テキスト → np.array の埋め込み関数
             weights: 各表現タイプのスコア重み
                      例: {"original": 1.0, "summary": 0.8, "keywords": 0.7, "paraphrase": 0.9}
+            embed_batch_fn: テキストのリスト → (件数, 次元) 行列 の埋め込み関数（任意）
+            batch_size: 1回にまとめて埋め込む件数
         """
         self.embed_fn = embed_fn
+        self.embed_batch_fn = embed_batch_fn
+        self.batch_size = max(1, batch_size)
         self.weights = weights or {
             RepresentationType.ORIGINAL: 1.0,
             RepresentationType.SUMMARY: 0.8,
@@ -77,30 +91,70 @@ class MultiRepresentationIndex:
             RepresentationType.PARAPHRASE: 0.9
         }
         self._docs: dict[str, MultiRepDoc] = {}
+        self._doc_ids: list[str] = []          # 文書番号 → doc_id（self._docs と同じ順）
+        self._doc_pos: dict[str, int] = {}     # doc_id → 文書番号
         # 各表現タイプ別のベクトルDB
-        # type -> [(doc_id, vector)]
-        self._vector_stores: dict[str, list[tuple[str, np.ndarray]]] = {
-            t: [] for t in RepresentationType
-        }
+        # type -> 正規化済み行列 (N, dim) と行ごとの文書番号
+        self._matrices: dict[str, np.ndarray] = {}
+        self._row_docs: dict[str, np.ndarray] = {}
+        # type -> まだ行列にまとめていない追加分 [(行列, 文書番号)]
+        self._pending: dict[str, list[tuple[np.ndarray, np.ndarray]]] = {}
 
     def add_document(self, doc: MultiRepDoc) -> None:
         """文書を追加してすべての表現をベクトル化"""
-        self._docs[doc.doc_id] = doc
-
-        for rep_type, text in doc.representations.items():
-            if not text.strip():
+        self.add_documents([doc], verbose=False)
+
+    def add_documents(self, docs: list[MultiRepDoc], verbose: bool = True) -> None:
+        """複数文書を一括追加（表現タイプごとにまとめて埋め込む）"""
+        items: dict[str, list[tuple[MultiRepDoc, str]]] = {}
+        for doc in docs:
+            if doc.doc_id not in self._doc_pos:
+                self._doc_pos[doc.doc_id] = len(self._doc_ids)
+                self._doc_ids.append(doc.doc_id)
+            self._docs[doc.doc_id] = doc
+            for rep_type, text in doc.representations.items():
+                if text.strip():
+                    items.setdefault(_type_key(rep_type), []).append((doc, text))
+
+        total = sum(len(type_items) for type_items in items.values())
+        done = 0
+        for rep_type, type_items in items.items():
+            blocks, owners = [], []
+            for start in range(0, len(type_items), self.batch_size):
+                batch = type_items[start:start + self.batch_size]
+                block, ok = self._embed_many([text for _, text in batch])
+                if len(block):
+                    blocks.append(block)
+                    owners.extend(doc for (doc, _), hit in zip(batch, ok) if hit)
+                done += len(batch)
+                if verbose and done // 1000 != (done - len(batch)) // 1000:
+                    print(f"[MultiRepIndex] {done}/{total} 表現を埋め込み完了")
+            if not blocks:
                 continue
-            vector = self._embed(text)
-            if vector is not None:
+            matrix = _normalize_rows(np.concatenate(blocks))
+            for doc, vector in zip(owners, matrix):
                 doc.vectors[rep_type] = vector
-                self._vector_stores[rep_type].append((doc.doc_id, vector))
-
-    def add_documents(self, docs: list[MultiRepDoc]) -> None:
-        """複数文書を一括追加"""
-        for i, doc in enumerate(docs):
-            self.add_document(doc)
-            if (i + 1) % 100 == 0:
-                print(f"[MultiRepIndex] {i + 1}/{len(docs)} 追加完了")
+            doc_pos = self._doc_pos
+            positions = np.fromiter((doc_pos[doc.doc_id] for doc in owners), dtype=np.int64, count=len(owners))
+            self._pending.setdefault(rep_type, []).append((matrix, positions))
+
+    def _matrix(self, rep_type: str) -> tuple[np.ndarray | None, np.ndarray | None]:
+        """表現タイプの (行列, 行ごとの文書番号)。追加分があれば1つの行列にまとめる"""
+        pending = self._pending.pop(rep_type, None)
+        if pending:
+            blocks = ([(self._matrices[rep_type], self._row_docs[rep_type])]
+                      if rep_type in self._matrices else []) + pending
+            self._set_matrix(rep_type, np.vstack([m for m, _ in blocks]),
+                             np.concatenate([d for _, d in blocks]))
+        return self._matrices.get(rep_type), self._row_docs.get(rep_type)
+
+    def _set_matrix(self, rep_type: str, matrix: np.ndarray, row_docs: np.ndarray) -> None:
+        """行列を差し替え、各文書の vectors を新しい行列の行に向け直す"""
+        self._matrices[rep_type] = matrix
+        self._row_docs[rep_type] = row_docs
+        docs, doc_ids = self._docs, self._doc_ids
+        for row, pos in enumerate(row_docs.tolist()):
+            docs[doc_ids[pos]].vectors[rep_type] = matrix[row]
 
     def search(
         self,
@@ -125,53 +179,52 @@ class MultiRepresentationIndex:
         query_vector = self._embed(query)
         if query_vector is None:
             return []
+        query_vector = _normalize_rows(query_vector.reshape(1, -1))[0]
 
         target_types = rep_types or list(RepresentationType)
-        doc_scores: dict[str, dict[str, float]] = {}  # doc_id -> {rep_type: score}
 
+        # 表現タイプごとの候補リスト（文書番号, コサイン類似度）。行列とクエリの内積1回
+        types, ids, score_lists = [], [], []
         for rep_type in target_types:
-            store = self._vector_stores.get(rep_type, [])
-            if not store:
+            matrix, row_docs = self._matrix(_type_key(rep_type))
+            if matrix is None or not len(matrix):
                 continue
+            types.append(rep_type)
+            ids.append(row_docs)
+            score_lists.append((matrix @ query_vector).astype(np.float64))
+        if not types:
+            return []
 
-            weight = self.weights.get(rep_type, 1.0)
-
-            for doc_id, doc_vector in store:
-                score = self._cosine_similarity(query_vector, doc_vector)
-                weighted_score = score * weight
-
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {}
-
-                # 同じ文書の同じ表現は最高スコアを採用
-                if rep_type not in doc_scores[doc_id] or \
-                        doc_scores[doc_id][rep_type] < weighted_score:
-                    doc_scores[doc_id][rep_type] = weighted_score
-
-        # 各文書の最終スコア（各表現の最高スコアを統合）
-        final_scores: list[tuple[float, str, str]] = []  # (score, doc_id, best_rep_type)
-        for doc_id, rep_scores in doc_scores.items():
-            max_score = max(rep_scores.values())
-            best_rep = max(rep_scores, key=rep_scores.get)
-            # 複数の表現でヒットした場合はボーナス
-            multi_hit_bonus = 0.05 * (len(rep_scores) - 1)
-            final_scores.append((max_score + multi_hit_bonus, doc_id, best_rep))
+        # 各文書の最終スコア = 各表現の（重み付き）最高スコア + 複数の表現でヒットしたボーナス
+        weights = [self.weights.get(rep_type, 1.0) for rep_type in types]
+        top_ids, top_scores = fuse(
+            ids, score_lists, method="max", weights=weights, bonus=0.05, top_k=top_k,
+        )
 
-        final_scores.sort(key=lambda x: x[0], reverse=True)
+        # 上位文書の表現ごとのスコア（同じ文書の同じ表現は最高スコア）
+        rep_scores: list[dict[str, float]] = [{} for _ in top_ids]
+        position = {int(doc): i for i, doc in enumerate(top_ids)}
+        for rep_type, list_ids, list_scores, weight in zip(types, ids, score_lists, weights):
+            for j in np.flatnonzero(np.isin(list_ids, top_ids)):
+                scores = rep_scores[position[int(list_ids[j])]]
+                weighted_score = float(list_scores[j] * weight)
+                if rep_type not in scores or scores[rep_type] < weighted_score:
+                    scores[rep_type] = weighted_score
 
         results = []
-        for score, doc_id, best_rep in final_scores[:top_k]:
+        for doc, score, doc_rep_scores in zip(top_ids, top_scores, rep_scores):
+            doc_id = self._doc_ids[doc]
             if doc_id not in self._docs:
                 continue
             doc = self._docs[doc_id]
             results.append({
                 "doc_id": doc_id,
-                "score": round(score, 4),
+                "score": round(float(score), 4),
                 "original_text": doc.original_text,
-                "matched_via": best_rep,        # どの表現でヒットしたか
-                "hit_representations": list(doc_scores[doc_id].keys()),
+                "matched_via": max(doc_rep_scores, key=doc_rep_scores.get),  # どの表現でヒットしたか
+                "hit_representations": list(doc_rep_scores.keys()),
                 "representation_scores": {
-                    k: round(v, 4) for k, v in doc_scores[doc_id].items()
+                    k: round(v, 4) for k, v in doc_rep_scores.items()
                 },
                 "metadata": doc.metadata
             })
@@ -193,6 +246,21 @@ class MultiRepresentationIndex:
             print(f"[MultiRepIndex] 埋め込みエラー: {e}")
             return None
 
+    def _embed_many(self, texts: list[str]) -> tuple[np.ndarray, list[bool]]:
+        """複数テキストをベクトルに変換 → (埋め込めた分の行列, テキストごとに埋め込めたか)
+
+        embed_batch_fn があれば1回で埋め込み、無い・失敗したら1件ずつ埋め込む。
+        """
+        if self.embed_batch_fn is not None:
+            try:
+                return np.asarray(self.embed_batch_fn(texts), dtype=np.float32), [True] * len(texts)
+            except Exception as e:
+                print(f"[MultiRepIndex] 埋め込みエラー（まとめて埋め込み）: {e}")
+        vectors = [self._embed(text) for text in texts]
+        found = [v for v in vectors if v is not None]
+        return (np.vstack(found) if found else np.zeros((0, 0), dtype=np.float32),
+                [v is not None for v in vectors])
+
     @staticmethod
     def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
         """コサイン類似度"""
@@ -203,7 +271,11 @@ class MultiRepresentationIndex:
         return float(np.dot(a, b) / (norm_a * norm_b))
 
     def save(self, path: str) -> None:
-        """インデックスをJSONに保存（ベクトルは.npy形式で別途保存）"""
+        """インデックスをJSONに保存（ベクトルは表現タイプごとに .npy 形式で別途保存）
+
+        <path の拡張子を除いた名前>.<表現タイプ>.npy に行列、.<表現タイプ>.docs.npy に
+        行ごとの文書番号（JSON の文書の順）、.vectors.json に文書数と表現タイプごとの行数を書く。
+        """
         docs_data = {}
         for doc_id, doc in self._docs.items():
             docs_data[doc_id] = {
@@ -213,23 +285,96 @@ class MultiRepresentationIndex:
             }
         with open(path, "w", encoding="utf-8") as f:
             json.dump(docs_data, f, ensure_ascii=False, indent=2)
-        print(f"[MultiRepIndex] 保存完了: {path} ({len(docs_data)} 文書)")
+
+        types, rows = [], {}
+        for rep_type in list(self._matrices) + list(self._pending):
+            matrix, row_docs = self._matrix(rep_type)
+            if matrix is None or rep_type in types:
+                continue
+            matrix_path, docs_path = _vector_paths(path, rep_type)
+            np.save(matrix_path, np.ascontiguousarray(matrix, dtype=np.float32))
+            np.save(docs_path, row_docs)
+            types.append(rep_type)
+            rows[rep_type] = len(row_docs)
+        with open(Path(path).with_suffix(".vectors.json"), "w", encoding="utf-8") as f:
+            json.dump({"n_docs": len(self._doc_ids), "types": types, "rows": rows}, f, ensure_ascii=False)
+        print(f"[MultiRepIndex] 保存完了: {path} ({len(docs_data)} 文書, 表現 {len(types)} 種)")
 
     def load(self, path: str) -> None:
-        """保存したインデックスを読み込み"""
+        """保存したインデックスを読み込み（ベクトルがあれば mmap で開き、無ければ埋め込み直す）"""
         with open(path, encoding="utf-8") as f:
             docs_data = json.load(f)
-        for doc_id, data in docs_data.items():
-            doc = MultiRepDoc(
+        docs = [
+            MultiRepDoc(
                 doc_id=doc_id,
                 original_text=data["original_text"],
                 representations=data["representations"],
                 metadata=data.get("metadata", {})
             )
-            self.add_document(doc)
+            for doc_id, data in docs_data.items()
+        ]
+
+        vectors = _load_vectors(path, len(docs)) if not self._docs else None
+        if vectors is None:
+            self.add_documents(docs)
+        else:
+            for doc in docs:
+                self._doc_pos[doc.doc_id] = len(self._doc_ids)
+                self._doc_ids.append(doc.doc_id)
+                self._docs[doc.doc_id] = doc
+            for rep_type, (matrix, row_docs) in vectors.items():
+                self._set_matrix(rep_type, matrix, row_docs)
         print(f"[MultiRepIndex] 読み込み完了: {len(docs_data)} 文書")
 
 
+def _type_key(rep_type: str) -> str:
+    """表現タイプのキー（RepresentationType でも文字列でも同じキーになる）"""
+    return rep_type.value if isinstance(rep_type, Enum) else str(rep_type)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """行ごとに L2 正規化した float32 行列（ゼロ行はそのまま）"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))[:, None]
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _load_vectors(path: str, n_docs: int) -> dict[str, tuple[np.ndarray, np.ndarray]] | None:
+    """save() で書いた表現タイプごとの (行列, 行ごとの文書番号) を開く
+
+    .vectors.json が無い、文書数・行数が .vectors.json と合わない、行列と文書番号の長さが違う、
+    範囲外の文書番号がある場合は None（呼び出し側で埋め込み直す）。
+    """
+    meta_path = Path(path).with_suffix(".vectors.json")
+    if not meta_path.exists():
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("n_docs") != n_docs:
+        return None
+    vectors = {}
+    for rep_type in meta.get("types", []):
+        matrix_path, docs_path = _vector_paths(path, rep_type)
+        if not (matrix_path.exists() and docs_path.exists()):
+            return None
+        matrix = np.load(matrix_path, mmap_mode="r")
+        row_docs = np.load(docs_path)
+        expected = meta.get("rows", {}).get(rep_type, len(row_docs))
+        if matrix.ndim != 2 or not (len(matrix) == len(row_docs) == expected):
+            return None
+        if len(row_docs) and (row_docs.min() < 0 or row_docs.max() >= n_docs):
+            return None
+        vectors[rep_type] = (matrix, row_docs)
+    return vectors
+
+
+def _vector_paths(path: str, rep_type: str) -> tuple[Path, Path]:
+    """save() の JSON の横に置く表現タイプごとの行列と文書番号のパス"""
+    base = Path(path).with_suffix("")
+    return (base.with_name(f"{base.name}.{rep_type}.npy"),
+            base.with_name(f"{base.name}.{rep_type}.docs.npy"))
+
+
 class MultiRepBuilder:
     """
     MultiRepDoc を生成するためのビルダー
@@ -0,0 +1,135 @@
+"""リランキングスコアキャッシュ - (モデル, 正規化クエリ, chunk_id) → LLM 関連度スコアの LRU
+
+LLM リランキングは同じクエリ・同じ候補の組を何度も評価しがちなので（言い換えクエリの
+再検索、サブエージェントの重複検索など）、一度付けたスコアを使い回す。
+
+- キー: モデル名 + 正規化クエリ + chunk_id + LLM に渡した本文のハッシュ
+  （再インデックスで本文が変わったチャンクは別キーになる）
+- 上限件数を超えたら最も古く使われたものから捨てる
+- RERANK_CACHE_PATH を指定すると終了時に保存し、次回起動時に読み込む
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from src.config import RERANK_CACHE_PATH, RERANK_CACHE_SIZE
+from src.embedding_cache import normalize_query
+
+
+def make_key(model: str, query: str, chunk_id: str, text: str) -> str:
+    """キャッシュキー（本文は sha1 の先頭16桁だけ使う）"""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return json.dumps([model, normalize_query(query), chunk_id, digest], ensure_ascii=False)
+
+
+class RerankCache:
+    """スレッドセーフな LRU スコアキャッシュ（ヒット率付き）"""
+
+    def __init__(self, max_size: int = 20000, path: Path | None = None) -> None:
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, keys: list[str]) -> list[float | None]:
+        """キーごとのスコア（無ければ None）"""
+        found = []
+        with self._lock:
+            for key in keys:
+                score = self._entries.get(key)
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                found.append(score)
+        return found
+
+    def put_many(self, items: list[tuple[str, float]]) -> None:
+        if self.max_size <= 0 or not items:
+            return
+        with self._lock:
+            for key, score in items:
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self._dirty = True
+
+    def stats(self) -> dict:
+        """ヒット数・ミス数・ヒット率・件数"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def save(self) -> None:
+        """path に保存（変更がなければ何もしない）"""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            items = list(self._entries.items())
+            self._dirty = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 一時ファイルは書き込むプロセスごとに別名（同時に終了しても混ざらない）
+        fd, tmp = tempfile.mkstemp(prefix=self.path.name + ".", suffix=".tmp", dir=self.path.parent)
+        try:
+            os.chmod(tmp, 0o644)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"entries": items}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def load(self) -> None:
+        """path から読み込む（無い・壊れている場合は空のまま）"""
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            with self._lock:
+                for key, score in data["entries"][-self.max_size:]:
+                    self._entries[key] = float(score)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Warning: リランキングキャッシュを読み込めません: {e}")
+        self._dirty = False
+
+
+# プロセス共通のキャッシュ（RERANK_CACHE_PATH 指定時は終了時に保存）
+_cache = RerankCache(RERANK_CACHE_SIZE, RERANK_CACHE_PATH or None)
+_cache.load()
+atexit.register(_cache.save)
+
+
+def get_cache() -> RerankCache:
+    return _cache
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -6,9 +6,11 @@ reranker.py - Cross-encoder リランキング
 
 実装する手法:
   1. LLMベースリランク: クエリと各結果のペアをLLMで評価
-     - 最も精度が高いが遅い（本番は結果上位10件のみに適用）
+     - 最も精度が高いが遅い。候補を窓に分けて並行に評価し、待ち時間の上限で打ち切る
+     - (モデル, クエリ, チャンク) ごとのスコアはキャッシュして使い回す
   2. Cross-encoder風スコアリング: ルールベースの再評価
-     - BM25とベクトルスコアを組み合わせたRRF
+     - 文字 bigram の重なり。チャンク側の bigram はインデックス構築時に作っておき、
+       候補全件を配列演算でまとめて照合する
   3. Reciprocal Rank Fusion (RRF): 複数のランキングを統合
      - スコールスケール非依存、シンプルで強力
 
@@ -18,9 +20,22 @@ RRF式: score(d) = Σ 1/(k + rank(d))
 
 from __future__ import annotations
 
+import contextvars
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Any
 
+import numpy as np
+
+from src.chunk_store import bigram_signature, get_store
+from src.config import RERANK_BUDGET, RERANK_CONCURRENCY, RERANK_WINDOW
+from src.fusion import encode_ids, fuse
+from src.tracing import span
+
+# LLMリランキングの窓を並行に評価するスレッドプール（打ち切った窓はバックグラウンドで終わるまで走る）
+_executor = ThreadPoolExecutor(max_workers=RERANK_CONCURRENCY, thread_name_prefix="rerank")
+
 
 # =========================================================
 # Reciprocal Rank Fusion (RRF)
@@ -47,15 +62,9 @@ def reciprocal_rank_fusion(
         fused = reciprocal_rank_fusion([bm25_ranking, vector_ranking])
         # → [("doc_A", 0.032), ("doc_B", 0.031), ("doc_C", 0.016), ("doc_D", 0.016)]
     """
-    scores: dict[str, float] = {}
-
-    for ranking in rankings:
-        for rank, doc_id in enumerate(ranking, start=1):
-            rrf_score = 1.0 / (k + rank)
-            scores[doc_id] = scores.get(doc_id, 0.0) + rrf_score
-
-    sorted_results = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    return sorted_results
+    keys, ids = encode_ids(rankings)
+    fused_ids, fused_scores = fuse(ids, method="rrf", k=k)
+    return list(zip(keys[fused_ids].tolist(), fused_scores.tolist()))
 
 
 def rrf_from_search_results(
@@ -75,29 +84,23 @@ def rrf_from_search_results(
     Returns:
         RRFスコア付きの結果リスト（重複除去済み）
     """
-    # 各結果セットのランキングを抽出
-    rankings = [[r[id_key] for r in results] for results in result_sets]
+    # 各結果セットのランキングを整数 ID に変換してまとめて統合（src/fusion.py）
+    keys, ids = encode_ids([[r[id_key] for r in results] for results in result_sets])
+    fused_ids, fused_scores = fuse(ids, method="rrf", k=k)
 
-    # 全結果を辞書化（chunk_id → dict）
-    all_docs: dict[str, dict] = {}
+    # 最初に出現した結果を元にスコアを付与して返す
+    first: dict[str, dict] = {}
     for results in result_sets:
         for r in results:
-            doc_id = r[id_key]
-            if doc_id not in all_docs:
-                all_docs[doc_id] = dict(r)
-
-    # RRFスコアを計算
-    rrf_scores = dict(reciprocal_rank_fusion(rankings, k=k))
+            first.setdefault(r[id_key], r)
 
-    # スコアを付与して返す
     output = []
-    for doc_id, rrf_score in sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True):
-        if doc_id in all_docs:
-            doc = dict(all_docs[doc_id])
-            doc["rrf_score"] = rrf_score
-            doc["original_score"] = doc.get("score", 0.0)
-            doc["score"] = rrf_score  # メインスコアをRRFに更新
-            output.append(doc)
+    for doc_id, rrf_score in zip(keys[fused_ids].tolist(), fused_scores.tolist()):
+        doc = dict(first[doc_id])
+        doc["rrf_score"] = rrf_score
+        doc["original_score"] = doc.get("score", 0.0)
+        doc["score"] = rrf_score  # メインスコアをRRFに更新
+        output.append(doc)
 
     return output
 
@@ -124,7 +127,7 @@ RERANK_PROMPT = """\
 - 1: ほとんど関連していない
 
 各文書に1〜5のスコアを付けて、JSON形式で返してください（説明文なし）:
-{"scores": [5, 3, 1, ...]}  ← 入力と同じ順序で
+{{"scores": [5, 3, 1, ...]}}  ← 入力と同じ順序で
 """
 
 
@@ -136,12 +139,24 @@ def rerank_with_llm(
     top_k: int = 10,
     text_key: str = "text",
     max_text_chars: int = 300,
+    window: int | None = None,
+    stride: int | None = None,
+    budget: float | None = None,
+    id_key: str = "chunk_id",
+    use_cache: bool = True,
+    report: dict | None = None,
 ) -> list[dict]:
     """
     LLMを使って検索結果をリランキングする。
 
-    初回検索の上位結果に対してLLMでペアワイズ評価を行い、
-    より関連性の高い順に並び替える。
+    上位 top_k 件を window 件ずつの窓に分け、窓ごとのリクエストを並行に投げて
+    1〜5 の関連度スコアを付け、より関連性の高い順に並び替える。
+    stride < window にすると窓が重なり、複数の窓で評価された候補はスコアを平均する。
+    (モデル, クエリ, チャンク) のスコアはキャッシュし（src/rerank_cache.py）、評価済みの
+    候補はリクエストに含めない。
+
+    budget 秒までに返らなかった窓は使わない（バックグラウンドで完了したものはキャッシュに入る）。
+    評価できなかった候補は、評価できた候補の後ろに元の順序で並べる。
 
     Args:
         client: LLMクライアント
@@ -151,64 +166,132 @@ def rerank_with_llm(
         top_k: リランキングする上位件数（コスト制御）
         text_key: テキストのキー名
         max_text_chars: LLMに渡す1文書あたりの最大文字数
+        window: 1リクエストあたりの候補数（省略時は RERANK_WINDOW）
+        stride: 窓をずらす幅（省略時は window。重ならない）
+        budget: 待ち時間の上限（秒、省略時は RERANK_BUDGET）
+        id_key: キャッシュキーに使う ID のキー名
+        use_cache: スコアキャッシュを使うか
+        report: 渡すと窓数・キャッシュヒット数・打ち切り数などを書き込む
 
     Returns:
         リランキングされた結果リスト（LLMスコア付き）
     """
-    from src.llm_client import chat
+    from src.rerank_cache import get_cache, make_key
 
     # 上位top_k件のみリランキング（コスト・速度制御）
     candidates = results[:top_k]
     if not candidates:
         return results
+    window = max(1, window or RERANK_WINDOW)
+    stride = max(1, min(stride or window, window))
+    budget = RERANK_BUDGET if budget is None else budget
+    t0 = time.perf_counter()
 
-    # 文書テキストを整形
-    doc_texts = []
+    items = []
     for i, r in enumerate(candidates):
         text = r.get(text_key, "")[:max_text_chars]
         source = r.get("filename", r.get("doc_id", f"文書{i+1}"))
-        doc_texts.append(f"[{i+1}] 出典: {source}\n{text}")
+        key = make_key(model, query, str(r.get(id_key, r.get("doc_id", ""))), text)
+        items.append((key, source, text))
+
+    cache = get_cache()
+    llm_scores = cache.get_many([key for key, _, _ in items]) if use_cache else [None] * len(items)
+    pending = [i for i, score in enumerate(llm_scores) if score is None]
+
+    # 未評価の候補を窓に分けて並行に評価
+    windows = []
+    for start in range(0, len(pending), stride):
+        windows.append(pending[start:start + window])
+        if start + window >= len(pending):
+            break
+    ctx = contextvars.copy_context()
+    futures = {
+        _executor.submit(ctx.copy().run, _judge_window, client, model, query,
+                         [items[i] for i in rows], use_cache): rows
+        for rows in windows
+    }
+
+    timed_out = errors = 0
+    with span("llm_rerank", candidates=len(candidates), windows=len(windows)) as sp:
+        done, not_done = wait(futures, timeout=budget) if futures else (set(), set())
+        sums: dict[int, list[float]] = {}
+        for future in futures:
+            if future not in done:
+                future.cancel()
+                timed_out += 1
+                continue
+            try:
+                window_scores = future.result()
+            except Exception as e:
+                print(f"  LLMリランキング失敗: {e}")
+                errors += 1
+                continue
+            for i, score in zip(futures[future], window_scores):
+                sums.setdefault(i, []).append(score)
+        for i, scores in sums.items():
+            llm_scores[i] = sum(scores) / len(scores)
+        sp.set(timeout=timed_out, errors=errors)
+
+    # LLMスコアを付与（元のスコアとLLMスコアを組み合わせ）
+    judged, unjudged = [], []
+    for r, llm_score in zip(candidates, llm_scores):
+        if llm_score is None:
+            unjudged.append(r)
+            continue
+        r["llm_relevance_score"] = llm_score
+        original_score = r.get("score", 0.0)
+        r["score"] = original_score * 0.3 + llm_score / 5.0 * 0.7
+        judged.append(r)
+    judged.sort(key=lambda x: x["score"], reverse=True)
+
+    if report is not None:
+        report.update({
+            "candidates": len(candidates),
+            "cached": len(candidates) - len(pending),
+            "windows": len(windows),
+            "timeout": timed_out,
+            "errors": errors,
+            "unjudged": len(unjudged),
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+        })
 
-    documents_str = "\n\n".join(doc_texts)
-    prompt = RERANK_PROMPT.format(
-        query=query,
-        n=len(candidates),
-        documents=documents_str,
-    )
-    messages = [{"role": "user", "content": prompt}]
-
-    try:
-        response = chat(client, model, messages, tools=None)
-        content = response.content or ""
+    # リランキング対象外の残り結果を後ろに追加
+    remaining = results[top_k:]
+    return judged + unjudged + remaining
 
-        if "```" in content:
-            start = content.index("```") + 3
-            if content[start:start+4] == "json":
-                start += 4
-            end = content.index("```", start)
-            content = content[start:end].strip()
 
-        data = json.loads(content)
-        llm_scores = data.get("scores", [])
+def _judge_window(client: Any, model: str, query: str, items: list[tuple[str, str, str]],
+                  use_cache: bool) -> list[float]:
+    """1つの窓（[(キャッシュキー, 出典, 本文), ...]）を評価してスコアを返す"""
+    from src.llm_client import chat
+    from src.rerank_cache import get_cache
 
-        if len(llm_scores) == len(candidates):
-            # LLMスコアを付与
-            for i, r in enumerate(candidates):
-                r["llm_relevance_score"] = llm_scores[i]
-                # 元のスコアとLLMスコアを組み合わせ
-                original_score = r.get("score", 0.0)
-                r["score"] = original_score * 0.3 + llm_scores[i] / 5.0 * 0.7
+    doc_texts = [f"[{i+1}] 出典: {source}\n{text}" for i, (_, source, text) in enumerate(items)]
+    prompt = RERANK_PROMPT.format(
+        query=query,
+        n=len(items),
+        documents="\n\n".join(doc_texts),
+    )
+    response = chat(client, model, [{"role": "user", "content": prompt}], tools=None)
+    scores = _parse_scores(response.content or "", len(items))
+    if use_cache:
+        get_cache().put_many([(key, score) for (key, _, _), score in zip(items, scores)])
+    return scores
 
-            # LLMスコア順にソート
-            candidates.sort(key=lambda x: x["score"], reverse=True)
 
-    except Exception as e:
-        print(f"  LLMリランキング失敗: {e}")
-        # 失敗時は元の順序を維持
+def _parse_scores(content: str, n: int) -> list[float]:
+    """{"scores": [...]} を取り出す（件数が合わなければ ValueError）。1〜5 に丸める"""
+    if "```" in content:
+        start = content.index("```") + 3
+        if content[start:start+4] == "json":
+            start += 4
+        end = content.index("```", start)
+        content = content[start:end].strip()
 
-    # リランキング対象外の残り結果を後ろに追加
-    remaining = results[top_k:]
-    return candidates + remaining
+    llm_scores = json.loads(content).get("scores", [])
+    if len(llm_scores) != n:
+        raise ValueError(f"スコアの件数が合いません（{len(llm_scores)} / {n}）")
+    return [min(5.0, max(1.0, float(score))) for score in llm_scores]
 
 
 # =========================================================
@@ -222,33 +305,55 @@ def colbert_style_score(query: str, document: str, tokenizer=None) -> float:
 
     本物のColBERTはBERTエンコーダが必要だが、
     この実装は文字n-gramマッチングで近似する。
+    スコアはクエリの文字 bigram のうち文書にも含まれる割合（文書は全文を使う）。
 
     実際の本番環境では:
     - sentence-transformers の CrossEncoder を使う
     - または jina-reranker-v2-base-multilingual (日本語対応) を使う
     """
-    # クエリのbigramセット
-    def bigrams(text: str) -> set:
-        text = text.lower()
-        return {text[i:i+2] for i in range(len(text)-1) if text[i:i+2].strip()}
-
-    query_bigrams = bigrams(query)
-    doc_bigrams = bigrams(document[:500])  # 先頭500文字のみ
-
-    if not query_bigrams:
+    query_bigrams = bigram_signature(query)
+    if not len(query_bigrams):
         return 0.0
+    matched = np.intersect1d(query_bigrams, bigram_signature(document), assume_unique=True)
+    return len(matched) / len(query_bigrams)
+
 
-    # マッチング率（クエリbigramのうち文書にも含まれる割合）
-    matched = query_bigrams & doc_bigrams
-    score = len(matched) / len(query_bigrams)
+def colbert_style_scores(query: str, results: list[dict], text_key: str = "text") -> np.ndarray:
+    """
+    候補全件の Colbert風スコアをまとめて計算する。
 
-    return score
+    チャンクストアにある候補（chunk_id が一致し、text_key が本文）はインデックス構築時に
+    作った bigram シグネチャを配列演算で照合し、本文を読まない。
+    それ以外の候補はその場でテキストからシグネチャを作る。
+    """
+    scores = np.zeros(len(results))
+    query_bigrams = bigram_signature(query)
+    if not len(query_bigrams) or not results:
+        return scores
+
+    rows, positions = [], []
+    store = None
+    if text_key == "text":
+        try:
+            store = get_store()
+        except FileNotFoundError:
+            pass
+    for i, r in enumerate(results):
+        row = store.index_of(r["chunk_id"]) if store is not None and "chunk_id" in r else None
+        if row is None:
+            scores[i] = colbert_style_score(query, r.get(text_key, ""))
+        else:
+            rows.append(row)
+            positions.append(i)
+    if rows:
+        scores[positions] = store.bigram_overlap(np.asarray(rows), query_bigrams) / len(query_bigrams)
+    return scores
 
 
 def rerank_with_colbert_style(
     query: str,
     results: list[dict],
-    top_k: int = 20,
+    top_k: int | None = None,
     text_key: str = "text",
     alpha: float = 0.5,
 ) -> list[dict]:
@@ -258,25 +363,24 @@ def rerank_with_colbert_style(
     Args:
         query: クエリ
         results: 検索結果
-        top_k: リランキング対象数
+        top_k: リランキング対象数（省略時は全件）
         text_key: テキストキー
         alpha: ColBERTスコアの重み（1-alpha が元スコアの重み）
 
     Returns:
         リランキングされた結果
     """
-    candidates = results[:top_k]
+    candidates = results[:top_k] if top_k is not None else list(results)
 
-    for r in candidates:
-        text = r.get(text_key, "")
-        colbert_s = colbert_style_score(query, text)
+    colbert_scores = colbert_style_scores(query, candidates, text_key=text_key).tolist()
+    for r, colbert_s in zip(candidates, colbert_scores):
         original_s = r.get("score", 0.0)
         # 正規化済みスコアを想定（0-1範囲）
         r["colbert_score"] = colbert_s
         r["score"] = original_s * (1 - alpha) + colbert_s * alpha
 
     candidates.sort(key=lambda x: x["score"], reverse=True)
-    return candidates + results[top_k:]
+    return candidates + (results[top_k:] if top_k is not None else [])
 
 
 # =========================================================
@@ -292,10 +396,12 @@ def full_rerank_pipeline(
     use_llm_rerank: bool = True,
     use_colbert: bool = True,
     rrf_k: int = 60,
-    llm_top_k: int = 10,
+    llm_top_k: int = 50,
     final_top_k: int = 5,
     id_key: str = "chunk_id",
     text_key: str = "text",
+    llm_budget: float | None = None,
+    report: dict | None = None,
 ) -> list[dict]:
     """
     複数の検索結果をRRF → Colbert → LLMリランキングで統合する。
@@ -303,7 +409,7 @@ def full_rerank_pipeline(
     パイプライン:
     1. 複数の検索結果セットをRRFで統合
     2. Colbert風スコアで再評価
-    3. LLMで上位10件を最終評価（use_llm_rerank=Trueの場合）
+    3. LLMで上位 llm_top_k 件を窓ごとに並行評価（use_llm_rerank=Trueの場合）
 
     Args:
         query: ユーザーのクエリ
@@ -318,6 +424,8 @@ def full_rerank_pipeline(
         final_top_k: 最終的に返す件数
         id_key: ドキュメントIDキー
         text_key: テキストキー
+        llm_budget: LLMリランキングの待ち時間の上限（秒、省略時は RERANK_BUDGET）
+        report: 渡すと LLMリランキングの窓数・キャッシュヒット数などを書き込む
 
     Returns:
         最終ランキング結果
@@ -343,6 +451,9 @@ def full_rerank_pipeline(
             results=results,
             top_k=llm_top_k,
             text_key=text_key,
+            budget=llm_budget,
+            id_key=id_key,
+            report=report,
         )
 
     return results[:final_top_k]
@@ -0,0 +1,218 @@
+"""検索結果キャッシュ - hybrid_search / guided_search の結果を使い回す
+
+エージェントはターンやサブエージェントをまたいでほぼ同じ search_docs を何度も投げるので、
+(正規化クエリ, top_k, doc_filter, フラグ) → 結果 を上限付きの LRU に保存する。
+
+- 世代（generation）: インデックス・同義語辞書が変わると bump_generation() で進め、
+  古い世代の結果は捨てる。searcher.reload_index / synonym.reload / 各インデックスの
+  構築・差分更新から呼ばれる
+- ディスク: SEARCH_CACHE_PATH を指定すると終了時に保存し、次回起動時に読み込む。
+  プロセスをまたぐと世代番号は使えないので、インデックスファイルの (サイズ, mtime) から
+  作った署名が一致するときだけ読み込む。署名は起動時（世代を進めた後は最初の保存時）に
+  取っておき、終了時ではなくその値で書く（実行中に別プロセスがインデックスを作り直しても、
+  古い結果が新しい署名で保存されない）
+- 手法が打ち切られた・失敗した結果（縮退した結果）は保存しない
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from src.config import SEARCH_CACHE_PATH, SEARCH_CACHE_SIZE
+from src.embedding_cache import normalize_query
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+KNOWLEDGE_DIR = Path(__file__).parent.parent / "knowledge"
+
+# 署名に使うファイル（検索結果を左右するもの）
+_SIGNATURE_FILES = (
+    DATA_DIR / "index" / "chunks.json",
+    DATA_DIR / "index" / "bm25" / "meta.json",
+    DATA_DIR / "index" / "summaries.json",
+    DATA_DIR / "index" / "summary_bm25" / "meta.json",
+    DATA_DIR / "embeddings" / "meta.json",
+    DATA_DIR / "embeddings" / "vectors.npy",
+    DATA_DIR / "embeddings" / "ivf" / "meta.json",
+    DATA_DIR / "cross_references.json",
+    KNOWLEDGE_DIR / "synonyms.yaml",
+    KNOWLEDGE_DIR / "domain_map.yaml",
+)
+
+
+def index_signature() -> str:
+    """インデックスファイルの (パス, サイズ, mtime) から作る署名"""
+    h = hashlib.sha1()
+    for path in _SIGNATURE_FILES:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        h.update(f"{path}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def make_key(namespace: str, query: str, **params) -> str:
+    """キャッシュキー（名前空間 + 正規化クエリ + パラメータ）"""
+    return json.dumps(
+        [namespace, normalize_query(query), sorted(params.items())],
+        ensure_ascii=False, default=str,
+    )
+
+
+class SearchCache:
+    """世代付きのスレッドセーフな LRU 検索結果キャッシュ"""
+
+    def __init__(self, max_size: int = 256, path: Path | None = None) -> None:
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature: str | None = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        """キャッシュされた結果（のコピー）。無ければ None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value, generation: int) -> None:
+        """結果を保存する。generation は検索開始時の世代（途中で進んでいたら保存しない）"""
+        if self.max_size <= 0:
+            return
+        value = copy.deepcopy(value)
+        signature = index_signature() if self.path is not None and self._signature is None else None
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._signature is None:
+                self._signature = signature
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.stores += 1
+            self._dirty = True
+
+    def skip(self) -> None:
+        """縮退した結果を保存しなかったことを記録"""
+        with self._lock:
+            self.skipped += 1
+
+    def bump_generation(self) -> int:
+        """世代を進めて全エントリを捨てる"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self._signature = None
+            self._dirty = True
+            return self.generation
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.stores = self.skipped = 0
+            self._dirty = True
+
+    def stats(self) -> dict:
+        """ヒット数・ミス数・ヒット率・件数・世代"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "stores": self.stores,
+            "skipped": self.skipped,
+            "invalidations": self.invalidations,
+            "generation": self.generation,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def save(self) -> None:
+        """path に保存（変更がなければ何もしない）。署名は結果を作ったときのもの"""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            items = list(self._entries.items())
+            signature = self._signature
+            self._dirty = False
+        if signature is None:
+            return
+        data = {"signature": signature, "entries": items}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 一時ファイルは書き込むプロセスごとに別名（同時に終了しても混ざらない）
+        fd, tmp = tempfile.mkstemp(prefix=self.path.name + ".", suffix=".tmp", dir=self.path.parent)
+        try:
+            os.chmod(tmp, 0o644)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def load(self) -> None:
+        """path から読み込む（署名が違う・無い・壊れている場合は空のまま）"""
+        if self.path is None:
+            return
+        self._signature = index_signature()
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("signature") != self._signature:
+                return
+            with self._lock:
+                for key, value in data["entries"][-self.max_size:]:
+                    self._entries[key] = value
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Warning: 検索結果キャッシュを読み込めません: {e}")
+        self._dirty = False
+
+
+# プロセス共通のキャッシュ（SEARCH_CACHE_PATH 指定時は終了時に保存）
+_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_PATH or None)
+_cache.load()
+atexit.register(_cache.save)
+
+
+def get_cache() -> SearchCache:
+    return _cache
+
+
+def current_generation() -> int:
+    return _cache.generation
+
+
+def bump_generation() -> int:
+    """インデックス・辞書の更新を通知する（キャッシュを無効化）"""
+    return _cache.bump_generation()
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -2,20 +2,32 @@
 
 import json
 from pathlib import Path
-from rank_bm25 import BM25Okapi
-from fugashi import Tagger
+
+import numpy as np
+
+from src import search_cache
+from src.bm25_index import BM25Index
+from src.chunk_store import get_store, reset_store, source_signature
+from src.doc_filter import DocRanges
+from src.tokenizer import tokenize_query
 
 INDEX_DIR = Path(__file__).parent.parent / "data" / "index"
+BM25_DIR = INDEX_DIR / "bm25"
 
 # シングルトンキャッシュ
 _bm25 = None
 _chunks = None
-_tagger = None
+_doc_ranges: DocRanges | None = None
 
 
 def _load_index():
-    """インデックスをメモリにロード（初回のみ）"""
-    global _bm25, _chunks, _tagger
+    """インデックスをメモリにロード（初回のみ）
+
+    チャンクは共有チャンクストア（src/chunk_store.get_store）から引く。
+    indexer.py が書き出した BM25 インデックス（data/index/bm25/）があれば mmap で開く。
+    無い・chunks.json より古い場合は tokens.json から再構築する。
+    """
+    global _bm25, _chunks, _doc_ranges
 
     if _bm25 is not None:
         return
@@ -23,19 +35,36 @@ def _load_index():
     chunks_path = INDEX_DIR / "chunks.json"
     tokens_path = INDEX_DIR / "tokens.json"
 
-    if not chunks_path.exists() or not tokens_path.exists():
+    try:
+        store = get_store()
+    except FileNotFoundError:
         raise FileNotFoundError(
             f"インデックスが見つかりません。先に indexer.py を実行してください: {INDEX_DIR}"
-        )
+        ) from None
+
+    bm25 = _open_mapped_bm25(chunks_path, len(store))
+    if bm25 is None:
+        if not tokens_path.exists():
+            raise FileNotFoundError(
+                f"インデックスが見つかりません。先に indexer.py を実行してください: {INDEX_DIR}"
+            )
+        with open(tokens_path, encoding="utf-8") as f:
+            bm25 = BM25Index.from_tokens(json.load(f))
 
-    with open(chunks_path, encoding="utf-8") as f:
-        _chunks = json.load(f)
+    _bm25, _chunks = bm25, store
+    _doc_ranges = DocRanges(store.doc_ids)
 
-    with open(tokens_path, encoding="utf-8") as f:
-        tokenized = json.load(f)
 
-    _bm25 = BM25Okapi(tokenized)
-    _tagger = Tagger()
+def _open_mapped_bm25(chunks_path: Path, n_chunks: int) -> BM25Index | None:
+    """バイナリ BM25 インデックスを開く（存在しない・古い・件数不一致の場合は None）"""
+    if not (BM25_DIR / "meta.json").exists():
+        return None
+    bm25 = BM25Index.load(BM25_DIR)
+    if chunks_path.exists() and bm25.meta.get("source") != source_signature(chunks_path):
+        return None
+    if bm25.corpus_size != n_chunks:
+        return None
+    return bm25
 
 
 def search(query: str, top_k: int = 5, doc_filter: str | None = None) -> list[dict]:
@@ -44,47 +73,66 @@ def search(query: str, top_k: int = 5, doc_filter: str | None = None) -> list[di
     Args:
         query: 検索クエリ（日本語）
         top_k: 返す件数
-        doc_filter: 文書番号フィルタ（部分一致、例: "JERG-2-200"）
+        doc_filter: 文書番号フィルタ（部分一致、例: "JERG-2-200" / "JERG-2-"、"A|B" は A または B）
 
     Returns:
         [{"doc_id", "chunk_id", "text", "score", "filename"}, ...]
     """
     _load_index()
 
-    # クエリをトークン化
-    tokens = []
-    for word in _tagger(query):
-        surface = word.surface
-        if len(surface) > 1 or not surface.isascii():
-            tokens.append(surface)
-
+    tokens = tokenize_query(query)
     if not tokens:
         return []
 
-    # BM25 スコア計算
-    scores = _bm25.get_scores(tokens)
+    # BM25 上位N件（postings のみ走査、MaxScore で枝刈り、フィルタ時は対象範囲だけ）
+    indices, scores = _bm25.top_k(tokens, top_k, ranges=_filter_ranges(doc_filter))
+    return _to_results(indices, scores)
+
+
+def search_many(
+    queries: list[str],
+    top_k: int | list[int] = 5,
+    doc_filters: list[str | None] | None = None,
+) -> list[list[dict]]:
+    """複数クエリをまとめて検索する（各クエリに search() を呼んだのと同じ結果）
+
+    同義語展開・LLM拡張などの変種を1回で引く用途。同じクエリ文字列の
+    トークン化と同じフィルタの範囲解決は1回だけ行い、スコアは
+    BM25Index.search_many で異なる語ごとに1回だけ計算する。
+
+    Args:
+        queries: 検索クエリのリスト
+        top_k: 返す件数（クエリごとに変える場合はリスト）
+        doc_filters: クエリごとの文書番号フィルタ（None なら全てフィルタなし）
+
+    Returns:
+        queries と同じ順の検索結果リスト
+    """
+    _load_index()
+
+    doc_filters = doc_filters or [None] * len(queries)
+    tokens = [tokenize_query(query) for query in queries]
+    ranges = [_filter_ranges(doc_filter) for doc_filter in doc_filters]
+
+    hits = _bm25.search_many(tokens, top_k, ranges=ranges)
+    return [_to_results(indices, scores) for indices, scores in hits]
 
-    # スコア付きインデックスを作成
-    scored = list(enumerate(scores))
 
-    # フィルタ適用
-    if doc_filter:
-        scored = [(i, s) for i, s in scored if doc_filter in _chunks[i]["doc_id"]]
+def _filter_ranges(doc_filter: str | None) -> np.ndarray | None:
+    """フィルタ対象チャンクの行範囲（フィルタなしは None）"""
+    if not doc_filter:
+        return None
+    return _doc_ranges.ranges(doc_filter)
 
-    # スコア降順ソート
-    scored.sort(key=lambda x: x[1], reverse=True)
 
-    # 上位N件を返す
+def _to_results(indices: np.ndarray, scores: np.ndarray) -> list[dict]:
+    """チャンク番号とスコアを検索結果の辞書リストに変換"""
     results = []
-    for idx, score in scored[:top_k]:
+    for idx, score in zip(indices, scores):
         if score <= 0:
             break
-        chunk = _chunks[idx]
         results.append({
-            "doc_id": chunk["doc_id"],
-            "chunk_id": chunk["chunk_id"],
-            "filename": chunk["filename"],
-            "text": chunk["text"],
+            **_chunks[int(idx)],
             "score": round(float(score), 4),
         })
 
@@ -102,8 +150,10 @@ def get_document_list() -> dict:
 
 def reload_index():
     """インデックスを再読み込み（更新後に使用）"""
-    global _bm25, _chunks, _tagger
+    global _bm25, _chunks, _doc_ranges
     _bm25 = None
     _chunks = None
-    _tagger = None
+    _doc_ranges = None
+    reset_store()
     _load_index()
+    search_cache.bump_generation()
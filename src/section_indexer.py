@@ -16,12 +16,13 @@ section_indexer.py - 階層構造インデックス
 from __future__ import annotations
 
 import json
-import re
 from collections import defaultdict
 from dataclasses import dataclass, field, asdict
 from pathlib import Path
 from typing import Any
 
+from src.tokenizer import tokenize_many, tokenize_query
+
 
 # =========================================================
 # データモデル
@@ -92,7 +93,7 @@ class SectionIndex:
         self.entries: dict[str, SectionEntry] = {}
         # doc_id → {section_id → SectionEntry}
         self._doc_sections: dict[str, dict[str, SectionEntry]] = defaultdict(dict)
-        # BM25用インデックス（簡易版）
+        # BM25用トークンキャッシュ: full_id → トークン列
         self._bm25_index: dict[str, list[str]] | None = None
 
     # ---------- 構築 ----------
@@ -233,10 +234,10 @@ class SectionIndex:
         if not candidates:
             return []
 
-        # コーパス構築（検索用テキスト）
-        corpus = [self._tokenize(e.searchable_text()) for e in candidates]
+        # コーパス構築（検索用テキスト、トークンはエントリごとにキャッシュ）
+        corpus = self._entry_tokens(candidates)
         bm25 = BM25Okapi(corpus)
-        query_tokens = self._tokenize(query)
+        query_tokens = tokenize_query(query)
         scores = bm25.get_scores(query_tokens)
 
         # スコア順にソート
@@ -272,18 +273,14 @@ class SectionIndex:
         results.sort(key=lambda x: x["score"], reverse=True)
         return results[:top_k]
 
-    def _tokenize(self, text: str) -> list[str]:
-        """テキストをトークン分割（日本語は文字n-gram）"""
-        # 英数字はスペース分割
-        tokens = re.findall(r'[a-zA-Z0-9]+|[\u3040-\u9fff]+', text)
-        # 日本語部分はbigramに分割
-        jp_bigrams = []
-        for token in tokens:
-            if re.search(r'[\u3040-\u9fff]', token) and len(token) >= 2:
-                jp_bigrams.extend(token[i:i+2] for i in range(len(token)-1))
-            else:
-                jp_bigrams.append(token.lower())
-        return jp_bigrams
+    def _entry_tokens(self, entries: list[SectionEntry]) -> list[list[str]]:
+        """エントリの検索用トークン（未計算の分だけまとめてトークン化）"""
+        if self._bm25_index is None:
+            self._bm25_index = {}
+        todo = [e for e in entries if e.full_id not in self._bm25_index]
+        for entry, tokens in zip(todo, tokenize_many(e.searchable_text() for e in todo)):
+            self._bm25_index[entry.full_id] = tokens
+        return [self._bm25_index[e.full_id] for e in entries]
 
     # ---------- ナビゲーション API ----------
 
@@ -3,6 +3,8 @@
 import yaml
 from pathlib import Path
 
+from src import search_cache
+
 SYNONYMS_PATH = Path(__file__).parent.parent / "knowledge" / "synonyms.yaml"
 
 _synonyms = None
@@ -49,6 +51,7 @@ def add_synonym(term: str, synonyms: list[str]):
             existing.append(s)
     _synonyms[term] = existing
     _save()
+    search_cache.bump_generation()
 
 
 def _save():
@@ -64,3 +67,4 @@ def reload():
     global _synonyms
     _synonyms = None
     _load()
+    search_cache.bump_generation()
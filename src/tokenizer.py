@@ -0,0 +1,65 @@
+"""日本語トークナイザ - 全インデックス共通の fugashi (MeCab) トークン化
+
+インデックス構築（indexer / chunk_summarizer / section_indexer / space_rag）と
+検索（searcher など）で同じ規則を使わないと、BM25 の語が一致しない。
+
+- 規則: MeCab の表層形。1文字の ASCII（記号・数字1桁など）は除外
+- Tagger はスレッドごとに1つ作って使い回す（生成は数十 ms かかる）
+- tokenize_many: 複数テキストをまとめてトークン化（インデックス構築用）
+- tokenize_query: 検索クエリ用。同じクエリは LRU キャッシュから返す
+"""
+
+from __future__ import annotations
+
+import threading
+from functools import lru_cache
+
+from fugashi import Tagger
+
+# クエリトークンの LRU キャッシュ件数
+QUERY_CACHE_SIZE = 4096
+
+_local = threading.local()
+
+
+def get_tagger() -> Tagger:
+    """このスレッドの Tagger（初回のみ生成）"""
+    tagger = getattr(_local, "tagger", None)
+    if tagger is None:
+        tagger = _local.tagger = Tagger()
+    return tagger
+
+
+def _surfaces(tagger: Tagger, text: str) -> list[str]:
+    tokens = []
+    for word in tagger(text):
+        surface = word.surface
+        if len(surface) > 1 or not surface.isascii():
+            tokens.append(surface)
+    return tokens
+
+
+def tokenize(text: str) -> list[str]:
+    """テキストをトークン化"""
+    return _surfaces(get_tagger(), text)
+
+
+def tokenize_many(texts) -> list[list[str]]:
+    """複数テキストをトークン化（Tagger の取得は1回）"""
+    tagger = get_tagger()
+    return [_surfaces(tagger, text) for text in texts]
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _tokenize_query(text: str) -> tuple[str, ...]:
+    return tuple(tokenize(text))
+
+
+def tokenize_query(text: str) -> list[str]:
+    """検索クエリをトークン化（LRU キャッシュ付き）"""
+    return list(_tokenize_query(text))
+
+
+def query_cache_info():
+    """クエリキャッシュのヒット数・ミス数（functools の CacheInfo）"""
+    return _tokenize_query.cache_info()
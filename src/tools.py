@@ -6,6 +6,7 @@ import fnmatch
 import re
 from pathlib import Path
 from src.config import MAX_OUTPUT_CHARS, WORKING_DIR
+from src.tracing import trace
 
 
 # --- ツール定義（LLMに渡す JSON Schema）---
@@ -308,7 +309,15 @@ def tool_grep(pattern: str, path: str | None = None, file_pattern: str | None =
 
 
 def tool_search_docs(query: str, top_k: int = 5, doc_filter: str | None = None) -> str:
-    """JERG文書をガイド付き2段階検索する（ドメイン検出→ハイブリッド検索）"""
+    """JERG文書をガイド付き2段階検索する（ドメイン検出→ハイブリッド検索）
+
+    区間ごとの所要時間は1つのトレースにまとめ、TRACE_LOG_PATH 指定時は JSONL に記録する。
+    """
+    with trace("search_docs", query=query, top_k=top_k, doc_filter=doc_filter):
+        return _search_docs(query, top_k, doc_filter)
+
+
+def _search_docs(query: str, top_k: int, doc_filter: str | None) -> str:
     try:
         from src.guided_retrieval import guided_search
         from src.llm_client import create_client
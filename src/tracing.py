@@ -0,0 +1,158 @@
+"""検索パイプラインの区間計測（スパン）
+
+tool_search_docs → guided_search → hybrid_search のどこで時間を使っているかを見るための
+軽量なスパン API。トレースが開始されていなければ span() は何もしない。
+
+    with tracing.trace("guided_search", query=query) as tr:
+        with tracing.span("bm25") as sp:
+            results = ...
+            sp.set(count=len(results))
+    tr.to_dict()  # {"name": ..., "total_ms": ..., "spans": [{"name", "parent", "start_ms", "ms", ...}]}
+
+- 現在のトレース・親スパンは contextvars で持つ。スレッドプールに投入する処理は
+  contextvars.copy_context().run で包むと同じトレースに記録される
+- トレースの中で trace() を呼ぶと新しいトレースではなくスパンになる（入れ子の呼び出し用）
+- TRACE_LOG_PATH を指定すると、最上位のトレースが終わるたびに JSONL で1行追記する
+- トレース終了後に終わったスパン（打ち切った手法など）は記録しない
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from src.config import TRACE_LOG_PATH
+
+_current_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_current_span: ContextVar[str | None] = ContextVar("span", default=None)
+
+_log_lock = threading.Lock()
+
+
+class Span:
+    """1区間の計測結果。set() で件数などの属性を付ける"""
+
+    __slots__ = ("name", "parent", "start_ms", "ms", "attrs")
+
+    def __init__(self, name: str, parent: str | None, start_ms: float, attrs: dict) -> None:
+        self.name = name
+        self.parent = parent
+        self.start_ms = start_ms
+        self.ms = 0.0
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "parent": self.parent, "start_ms": self.start_ms,
+                "ms": self.ms, **self.attrs}
+
+
+class _NullSpan:
+    """トレース外の span()（何も記録しない）"""
+
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """1回の検索のスパン一覧"""
+
+    def __init__(self, name: str, attrs: dict) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.spans: list[Span] = []
+        self.total_ms = 0.0
+        self.closed = False
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def _add(self, span: Span) -> None:
+        with self._lock:
+            if not self.closed:
+                self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ms)
+        return {
+            "name": self.name,
+            **self.attrs,
+            "total_ms": self.total_ms if self.closed else self.elapsed_ms(),
+            "spans": [s.to_dict() for s in spans],
+        }
+
+
+def current_trace() -> Trace | None:
+    """実行中のトレース（無ければ None）"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """区間を計測する。トレース外では何もしない"""
+    tr = _current_trace.get()
+    if tr is None:
+        yield _NULL_SPAN
+        return
+    sp = Span(name, _current_span.get(), tr.elapsed_ms(), attrs)
+    token = _current_span.set(name)
+    t0 = time.perf_counter()
+    try:
+        yield sp
+    except BaseException as e:
+        sp.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        sp.ms = round((time.perf_counter() - t0) * 1000, 2)
+        _current_span.reset(token)
+        tr._add(sp)
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """トレースを開始する（既にトレース中ならスパンとして記録し、外側のトレースを返す）"""
+    outer = _current_trace.get()
+    if outer is not None:
+        with span(name, **attrs):
+            yield outer
+        return
+
+    tr = Trace(name, attrs)
+    token = _current_trace.set(tr)
+    span_token = _current_span.set(None)
+    try:
+        yield tr
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(token)
+        tr.total_ms = tr.elapsed_ms()
+        tr.closed = True
+        if TRACE_LOG_PATH:
+            _write_log(tr)
+
+
+def _write_log(tr: Trace) -> None:
+    """トレースを JSONL に1行追記（失敗しても検索は止めない）"""
+    record = {"ts": time.time(), **tr.to_dict()}
+    try:
+        path = Path(TRACE_LOG_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Warning: トレースログを書き込めません: {e}")
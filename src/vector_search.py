@@ -1,17 +1,78 @@
-"""ベクトル検索 - 意味ベースの文書検索（fastembed + numpy）"""
+"""ベクトル検索 - 意味ベースの文書検索（fastembed + numpy）
 
+埋め込みは build 時に L2 正規化して保存する（data/embeddings/）:
+- vectors.npy:     正規化済み行列（float32 または float16）。検索時は mmap で開く
+- chunk_ids.json:  各行の chunk_id
+- text_hashes.json: 各行の本文ハッシュ（再構築時、本文が変わっていない行は再計算しない）
+- meta.json:       {"normalized": true, "dtype": ..., "model": ..., "dim": ..., "count": ..., "ids": ...}
+                   （ids は chunk_ids.json のハッシュ。ロード時に行列・chunk_id 列との対応を確かめる）
+
+構築（build）はバッチごとに build/ の memmap へ書き込み、中断しても続きから再開する。
+
+検索はクエリベクトルとの内積1回（float16 はブロック単位で float32 に展開）で、
+類似度バッファはスレッドごとに使い回すためクエリごとのコーパス規模の確保は無い。
+
+クエリ埋め込みは (モデル, 正規化クエリ) の LRU にキャッシュし（src/embedding_cache.py）、
+複数クエリは embed_queries() で1回のモデル呼び出しにまとめる。
+
+大規模コーパス向けに近似最近傍（IVF, src/ann_index.py）も選べる:
+  python -m src.vector_search build-ann          # data/embeddings/ivf/ を構築
+  VECTOR_INDEX=ivf VECTOR_NPROBE=16 ...          # または search(index="ivf", nprobe=16)
+"""
+
+import atexit
+import hashlib
 import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from pathlib import Path
 
+from src import search_cache
+from src.chunk_store import ChunkStore, get_store
+from src.config import EMBED_WORKERS, VECTOR_INDEX, VECTOR_NPROBE, VECTOR_QUERY_CACHE_PATH, VECTOR_QUERY_CACHE_SIZE
+from src.doc_filter import DocRanges, range_indices
+from src.embedding_cache import EmbeddingCache, normalize_query
+from src.tracing import span
+
 INDEX_DIR = Path(__file__).parent.parent / "data" / "index"
 EMBEDDINGS_DIR = Path(__file__).parent.parent / "data" / "embeddings"
 
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# float16 行列を float32 に展開して内積を取るときのブロック行数
+_BLOCK_ROWS = 8192
+# フィルタの行範囲がこれより多い（細切れ）ときは範囲ごとではなく行を集めて計算
+_MAX_RANGES = 64
+
 _model = None
 _embeddings = None
-_chunks = None
-# chunk_id → index のマッピング（高速ルックアップ用）
-_chunk_id_to_idx: dict | None = None
+# 共有チャンクストアと、埋め込みの行 → ストアの行（None = 同じ並び）
+_store: ChunkStore | None = None
+_rows: np.ndarray | None = None
+# doc_id → 行範囲（doc_filter 用、初回のフィルタ検索で作成）
+_doc_ranges: DocRanges | None = None
+# 近似最近傍インデックス（False = 利用不可と判定済み）
+_ann = None
+# クエリ埋め込みキャッシュ（VECTOR_QUERY_CACHE_PATH 指定時は終了時に保存）
+_query_cache = EmbeddingCache(VECTOR_QUERY_CACHE_SIZE, VECTOR_QUERY_CACHE_PATH or None)
+_query_cache.load()
+atexit.register(_query_cache.save)
+# スレッドごとの作業バッファ（類似度・閾値マスク・float16 展開用）
+_buffers = threading.local()
+# 並列構築時のスレッドごとの埋め込みモデル
+_thread_models = threading.local()
+
+
+def _new_model(threads: int | None = None):
+    """埋め込みモデルのセッションを作る（threads: ONNX のスレッド数。None なら既定）"""
+    from fastembed import TextEmbedding
+    # 軽量な多言語モデル（CPU対応）
+    return TextEmbedding(MODEL_NAME, threads=threads)
 
 
 def _load_model():
@@ -19,15 +80,39 @@ def _load_model():
     global _model
     if _model is not None:
         return
+    _model = _new_model()
 
-    from fastembed import TextEmbedding
-    # 軽量な多言語モデル（CPU対応）
-    _model = TextEmbedding("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+def _read_meta(directory: Path) -> dict | None:
+    """埋め込みの meta.json（無ければ None）"""
+    meta_path = directory / "meta.json"
+    if not meta_path.exists():
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _ids_digest(chunk_ids: list[str]) -> str:
+    """chunk_id 列のハッシュ（meta.json に記録し、ロード時に行列・chunk_ids.json との対応を確かめる）"""
+    return hashlib.sha1("\n".join(chunk_ids).encode("utf-8")).hexdigest()
+
+
+def _open_vectors(path: Path, meta: dict | None = None) -> np.ndarray:
+    """埋め込み行列を開く。正規化済み（meta.json あり）なら mmap、旧形式はロード時に1回だけ正規化"""
+    if meta is None:
+        meta = _read_meta(path.parent)
+    if meta and meta.get("normalized"):
+        return np.load(str(path), mmap_mode="r")
+
+    vectors = np.load(str(path)).astype(np.float32, copy=False)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10
+    return vectors
 
 
 def _load_embeddings():
     """
-    事前計算した埋め込みをロード。
+    事前計算した埋め込みをロード。チャンク本文・メタデータは共有チャンクストア
+    （src/chunk_store.get_store）から引く。
 
     優先順位:
     1. data/embeddings/vectors.npy + data/embeddings/chunk_ids.json  (事前計算済み)
@@ -37,55 +122,52 @@ def _load_embeddings():
     chunks.json のインデックス順と対応付ける。
     事前計算時に vectors.npy と chunks.json が同順である前提で動作する。
     """
-    global _embeddings, _chunks, _chunk_id_to_idx
+    global _embeddings, _store, _rows
 
     if _embeddings is not None:
         return
 
-    # chunks.json の候補パス（index優先、なければルートの data/）
-    chunks_candidates = [
-        INDEX_DIR / "chunks.json",
-        Path(__file__).parent.parent / "data" / "chunks.json",
-    ]
-    chunks_path = next((p for p in chunks_candidates if p.exists()), None)
-    if chunks_path is None:
-        raise FileNotFoundError("chunks.json が見つかりません")
+    store = get_store()
 
     # --- 優先: data/embeddings/ ディレクトリの事前計算済みembeddings ---
     vectors_path = EMBEDDINGS_DIR / "vectors.npy"
     chunk_ids_path = EMBEDDINGS_DIR / "chunk_ids.json"
 
     if vectors_path.exists() and chunk_ids_path.exists():
-        _embeddings = np.load(str(vectors_path))
-
-        with open(chunk_ids_path, encoding="utf-8") as f:
-            stored_ids = json.load(f)
-
-        with open(chunks_path, encoding="utf-8") as f:
-            chunks_list = json.load(f)
-
-        chunk_by_id = {c["chunk_id"]: c for c in chunks_list}
-
-        if stored_ids and stored_ids[0] not in chunk_by_id:
-            # "chunk_0", "chunk_1", ... 形式: vectors.npy[i] = chunks_list[i]
-            # 長さが一致しない場合は安全にトリミング
-            n = min(len(_embeddings), len(chunks_list))
-            if n < len(_embeddings):
-                _embeddings = _embeddings[:n]
-            _chunks = chunks_list[:n]
-            _chunk_id_to_idx = {c["chunk_id"]: i for i, c in enumerate(_chunks)}
+        # 書き込み側は chunk_ids.json → vectors.npy → meta.json の順に差し替えるので、
+        # meta → 行列 → chunk_id の順に読み、meta と食い違えば差し替えの途中とみなして読み直す
+        for _ in range(5):
+            meta = _read_meta(EMBEDDINGS_DIR)
+            embeddings = _open_vectors(vectors_path, meta)
+            with open(chunk_ids_path, encoding="utf-8") as f:
+                stored_ids = json.load(f)
+            if not meta or "ids" not in meta or (
+                meta["ids"] == _ids_digest(stored_ids) and meta.get("count") == len(embeddings)
+            ):
+                break
+            time.sleep(0.2)
         else:
-            # stored_ids が実際の chunk_id と一致する場合
-            aligned = [(i, chunk_by_id[cid]) for i, cid in enumerate(stored_ids) if cid in chunk_by_id]
-            if len(aligned) < len(stored_ids):
-                # 一部の chunk_id が chunks.json に存在しない場合は埋め込みも絞り込む
-                indices = [i for i, _ in aligned]
-                _embeddings = _embeddings[indices]
-                _chunks = [c for _, c in aligned]
-            else:
-                _chunks = [c for _, c in aligned]
-            _chunk_id_to_idx = {c["chunk_id"]: i for i, c in enumerate(_chunks)}
+            print("Warning: vectors.npy と chunk_ids.json が meta.json と一致しません")
 
+        if stored_ids and store.index_of(stored_ids[0]) is None:
+            # "chunk_0", "chunk_1", ... 形式: vectors.npy[i] = chunks[i]
+            # 長さが一致しない場合は安全にトリミング
+            n = min(len(embeddings), len(store))
+            _store, _rows, _embeddings = store, None, embeddings[:n]
+            return
+
+        # stored_ids が実際の chunk_id と一致する場合（通常はストアと同順）
+        rows = np.fromiter(
+            (-1 if (r := store.index_of(cid)) is None else r for cid in stored_ids),
+            dtype=np.int64, count=len(stored_ids),
+        )
+        present = rows >= 0
+        if not present.all():
+            # 一部の chunk_id が chunks.json に存在しない場合は埋め込みも絞り込む
+            embeddings = embeddings[np.flatnonzero(present)]
+            rows = rows[present]
+        identity = len(rows) == len(store) and bool((rows == np.arange(len(rows))).all())
+        _store, _rows, _embeddings = store, None if identity else rows, embeddings
         return
 
     # --- フォールバック: data/index/embeddings.npy ---
@@ -96,49 +178,320 @@ def _load_embeddings():
             "'uv run python -m src.vector_search build' を実行してください。"
         )
 
-    _embeddings = np.load(str(emb_path))
+    embeddings = _open_vectors(emb_path)
+    _store, _rows, _embeddings = store, None, embeddings[:len(store)]
+
+
+def _store_row(idx: int) -> int:
+    """埋め込みの行番号 → チャンクストアの行番号"""
+    return int(idx) if _rows is None else int(_rows[idx])
+
+
+def text_hash(text: str) -> str:
+    """チャンク本文のハッシュ（再構築時に埋め込みを再利用できるかの判定用）"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
 
-    with open(chunks_path, encoding="utf-8") as f:
-        _chunks = json.load(f)
 
-    _chunk_id_to_idx = {c["chunk_id"]: i for i, c in enumerate(_chunks)}
+def _reusable_rows(chunk_ids: list[str], hashes: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """既存の埋め込みから再利用できる行 → (新しい行, 既存の行, 既存の行列)
+
+    同じモデルで作られ、chunk_id と本文ハッシュが一致する行だけを再利用する。
+    本文ハッシュの無い旧形式は再利用しない。
+    """
+    none = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), None)
+    paths = [EMBEDDINGS_DIR / name for name in ("vectors.npy", "chunk_ids.json", "text_hashes.json", "meta.json")]
+    if not all(p.exists() for p in paths):
+        return none
+    with open(EMBEDDINGS_DIR / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("model") != MODEL_NAME or not meta.get("normalized"):
+        return none
+    with open(EMBEDDINGS_DIR / "chunk_ids.json", encoding="utf-8") as f:
+        old_ids = json.load(f)
+    with open(EMBEDDINGS_DIR / "text_hashes.json", encoding="utf-8") as f:
+        old_hashes = json.load(f)
+    old_vectors = np.load(str(EMBEDDINGS_DIR / "vectors.npy"), mmap_mode="r")
+    if not (len(old_ids) == len(old_hashes) == len(old_vectors) == meta.get("count")):
+        return none
+    old_row = {(cid, h): i for i, (cid, h) in enumerate(zip(old_ids, old_hashes))}
+    pairs = [(i, old_row[key]) for i, key in enumerate(zip(chunk_ids, hashes)) if key in old_row]
+    if not pairs:
+        return none
+    new_rows, old_rows = (np.asarray(col, dtype=np.int64) for col in zip(*pairs))
+    return new_rows, old_rows, old_vectors
+
+
+def _open_build(signature: dict, n: int, dim: int, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """構築中の行列と完了フラグ（memmap）を開く。同じ対象の途中までの構築があれば続きから"""
+    build_dir = EMBEDDINGS_DIR / "build"
+    meta_path = build_dir / "meta.json"
+    if meta_path.exists():
+        with open(meta_path, encoding="utf-8") as f:
+            if json.load(f) == signature:
+                return (np.lib.format.open_memmap(build_dir / "vectors.npy", mode="r+"),
+                        np.lib.format.open_memmap(build_dir / "done.npy", mode="r+"))
+        shutil.rmtree(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    vectors = np.lib.format.open_memmap(build_dir / "vectors.npy", mode="w+", dtype=dtype, shape=(n, dim))
+    done = np.lib.format.open_memmap(build_dir / "done.npy", mode="w+", dtype=bool, shape=(n,))
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(signature, f, ensure_ascii=False)
+    return vectors, done
+
+
+def _embed_rows(store: ChunkStore, rows: np.ndarray, threads: int | None) -> np.ndarray:
+    """ストアの行の本文を埋め込み、L2 正規化して返す（ワーカースレッドで実行）"""
+    if threads is None:
+        model = _model
+    else:
+        # 並列構築: スレッドごとに ONNX セッションを持つ
+        model = getattr(_thread_models, "model", None)
+        if model is None:
+            model = _thread_models.model = _new_model(threads=threads)
+    texts = [store.text(int(i)) for i in rows]
+    vectors = np.asarray(list(model.embed(texts, batch_size=len(texts))), dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10)
 
 
-def build_embeddings(batch_size: int = 64):
-    """全チャンクの埋め込みを計算して data/embeddings/ に保存"""
-    _load_model()
+def build_embeddings(batch_size: int = 64, dtype: str = "float32", workers: int | None = None):
+    """全チャンクの埋め込みを計算して data/embeddings/ に保存
 
-    chunks_path = INDEX_DIR / "chunks.json"
-    if not chunks_path.exists():
+    - バッチごとに data/embeddings/build/ の memmap（事前確保した行列）へ書き込み、
+      完了した行を done.npy に記録する。中断しても同じ対象なら続きから再開する
+    - 既存の埋め込みのうち chunk_id と本文ハッシュが一致する行は再計算しない
+    - workers > 1 なら ONNX セッションをスレッドごとに作り、並列に計算する
+
+    Args:
+        batch_size: 埋め込み計算のバッチサイズ
+        dtype: 保存形式（"float32" または "float16"。float16 はサイズ半分）
+        workers: 並列に動かすセッション数（None なら config.EMBED_WORKERS）
+    """
+    try:
+        store = get_store()
+    except FileNotFoundError:
         print("Error: chunks.json が見つかりません。先に indexer.py を実行してください。")
         return
 
-    with open(chunks_path, encoding="utf-8") as f:
-        chunks = json.load(f)
+    n = len(store)
+    chunk_ids = store.chunk_ids()
+    hashes = [text_hash(store.text(i)) for i in range(n)]
+    new_rows, old_rows, old_vectors = _reusable_rows(chunk_ids, hashes)
 
-    texts = [c["text"] for c in chunks]
-    chunk_ids = [c["chunk_id"] for c in chunks]
-    print(f"{len(texts)} チャンクの埋め込みを計算中...")
-
-    # バッチで埋め込み計算
-    all_embeddings = list(_model.embed(texts, batch_size=batch_size))
-    embedding_matrix = np.array(all_embeddings, dtype=np.float32)
+    if old_vectors is not None:
+        dim = old_vectors.shape[1]
+    else:
+        _load_model()
+        dim = len(next(iter(_model.embed(["次元確認"]))))
+    signature = {
+        "model": MODEL_NAME,
+        "dtype": dtype,
+        "dim": int(dim),
+        "count": n,
+        "chunks": hashlib.sha1("\n".join(f"{c}\t{h}" for c, h in zip(chunk_ids, hashes)).encode()).hexdigest(),
+    }
+    vectors, done = _open_build(signature, n, dim, dtype)
+    resumed = int(done.sum())
+
+    # 本文が変わっていない行は既存の埋め込みをコピー
+    if len(new_rows):
+        copy = ~done[new_rows]
+        for start in range(0, int(copy.sum()), _BLOCK_ROWS):
+            dst = new_rows[copy][start:start + _BLOCK_ROWS]
+            src = old_rows[copy][start:start + _BLOCK_ROWS]
+            vectors[dst] = np.asarray(old_vectors[src]).astype(dtype, copy=False)
+            done[dst] = True
+        vectors.flush()
+        done.flush()
+    reused = len(new_rows)
+
+    pending = np.flatnonzero(~np.asarray(done))
+    workers = max(1, workers or EMBED_WORKERS)
+    threads = None if workers == 1 else max(1, (os.cpu_count() or 1) // workers)
+    if threads is None and len(pending):
+        _load_model()  # 並列時はスレッドごとにセッションを作るので共有モデルは不要
+    print(f"{n} チャンクの埋め込みを計算中（計算 {len(pending)} 件, 再利用 {reused} 件, "
+          f"前回の続き {max(0, resumed - reused)} 件, 並列 {workers}）...")
+
+    t0 = time.perf_counter()
+    last_report = t0
+    computed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            # 投入は workers * 2 バッチまで。投入順に受け取って memmap に書き込む
+            inflight = deque()
+            for start in range(0, len(pending) + batch_size, batch_size):
+                rows = pending[start:start + batch_size]
+                if len(rows):
+                    inflight.append((rows, pool.submit(_embed_rows, store, rows, threads)))
+                limit = workers * 2 if len(rows) else 0
+                while len(inflight) > limit or (inflight and inflight[0][1].done()):
+                    done_rows, future = inflight.popleft()
+                    vectors[done_rows] = future.result().astype(dtype, copy=False)
+                    done[done_rows] = True
+                    computed += len(done_rows)
+
+                now = time.perf_counter()
+                if now - last_report >= 10.0:
+                    vectors.flush()
+                    done.flush()
+                    last_report = now
+                    rate = computed / (now - t0)
+                    eta = (len(pending) - computed) / rate / 60 if rate > 0 else 0.0
+                    print(f"  [{computed}/{len(pending)}] {rate:.1f} チャンク/秒, 残り約 {eta:.1f} 分")
+    finally:
+        vectors.flush()
+        done.flush()
+
+    elapsed = time.perf_counter() - t0
+    if computed:
+        print(f"  {computed} チャンクを {elapsed:.1f} 秒で計算（{computed / elapsed:.1f} チャンク/秒）")
+
+    del vectors, old_vectors
+    build_dir = EMBEDDINGS_DIR / "build"
+    _publish_embeddings(build_dir / "vectors.npy", chunk_ids, hashes, dtype, int(dim))
+    shutil.rmtree(build_dir)
+    _reset_loaded()
+
+    print(f"Embeddings saved: {EMBEDDINGS_DIR / 'vectors.npy'}")
+    print(f"  Shape: ({n}, {dim})")
+
+
+def _save_embeddings(embedding_matrix: np.ndarray, chunk_ids: list[str], dtype: str = "float32",
+                     hashes: list[str] | None = None):
+    """埋め込み行列を L2 正規化して chunk_id 列と共に保存し、ロード済みキャッシュを破棄する"""
+    embedding_matrix = embedding_matrix / (np.linalg.norm(embedding_matrix, axis=1, keepdims=True) + 1e-10)
+    embedding_matrix = embedding_matrix.astype(dtype)
 
     # data/embeddings/ に保存
     EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
     vectors_path = EMBEDDINGS_DIR / "vectors.npy"
+    tmp = EMBEDDINGS_DIR / "vectors.tmp.npy"
+    np.save(str(tmp), embedding_matrix)
+    dim = int(embedding_matrix.shape[1]) if embedding_matrix.ndim == 2 else 0
+    _publish_embeddings(tmp, chunk_ids, hashes, dtype, dim)
+    _reset_loaded()
+
+    print(f"Embeddings saved: {vectors_path}")
+    print(f"  Shape: {embedding_matrix.shape}")
+
+
+def _write_json(path: Path, data, indent: int | None = None) -> Path:
+    """JSON を一時ファイルに書いてそのパスを返す（差し替えは呼び出し側）"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    return tmp
+
+
+def _publish_embeddings(vectors_tmp: Path, chunk_ids: list[str], hashes: list[str] | None,
+                        dtype: str, dim: int):
+    """書き上がった行列と chunk_ids.json・text_hashes.json・meta.json を差し替える
+
+    全て一時ファイルに書いてから chunk_id 列 → 行列 → meta.json の順に置き換える。
+    ロード側は meta.json の件数・chunk_id ハッシュと突き合わせ、差し替え途中の組み合わせを読まない。
+    本文ハッシュが無ければ text_hashes.json は消す。
+    """
+    ids_tmp = _write_json(EMBEDDINGS_DIR / "chunk_ids.json", chunk_ids)
+    hashes_path = EMBEDDINGS_DIR / "text_hashes.json"
+    hashes_tmp = _write_json(hashes_path, hashes) if hashes is not None else None
+    meta_tmp = _write_json(EMBEDDINGS_DIR / "meta.json", {
+        "normalized": True,
+        "dtype": dtype,
+        "model": MODEL_NAME,
+        "dim": dim,
+        "count": len(chunk_ids),
+        "ids": _ids_digest(chunk_ids),
+    }, indent=2)
+
+    ids_tmp.replace(EMBEDDINGS_DIR / "chunk_ids.json")
+    if hashes_tmp is not None:
+        hashes_tmp.replace(hashes_path)
+    else:
+        hashes_path.unlink(missing_ok=True)
+    vectors_tmp.replace(EMBEDDINGS_DIR / "vectors.npy")
+    meta_tmp.replace(EMBEDDINGS_DIR / "meta.json")
+
+
+def _reset_loaded():
+    """ロード済みの埋め込み・IVF を破棄し、検索結果キャッシュを無効化する"""
+    global _embeddings, _store, _rows, _doc_ranges
+    _embeddings = None
+    _store = None
+    _rows = None
+    _doc_ranges = None
+    _reset_ann()
+    search_cache.bump_generation()
+
+
+def patch_embeddings(chunks: list[dict], stale_ids: set[str], batch_size: int = 64):
+    """内容が変わったチャンクだけ埋め込みを再計算し、他は既存ベクトルを再利用する
+
+    indexer の増分更新から呼ばれる。chunk_id 付きの事前計算済み埋め込みが
+    無い場合（未構築・旧形式）は何もしない。
+    """
+    vectors_path = EMBEDDINGS_DIR / "vectors.npy"
     chunk_ids_path = EMBEDDINGS_DIR / "chunk_ids.json"
+    if not (vectors_path.exists() and chunk_ids_path.exists()):
+        return
 
-    np.save(str(vectors_path), embedding_matrix)
-    with open(chunk_ids_path, "w", encoding="utf-8") as f:
-        json.dump(chunk_ids, f, ensure_ascii=False)
+    old_vectors = np.load(str(vectors_path))
+    with open(chunk_ids_path, encoding="utf-8") as f:
+        old_ids = json.load(f)
+    old_row = {cid: i for i, cid in enumerate(old_ids)}
+    if not any(c["chunk_id"] in old_row for c in chunks):
+        # "chunk_0" 形式（連番）は旧チャンク順との対応が取れないので再利用しない
+        print("  埋め込み: chunk_id 対応が無い形式のため更新をスキップ（build で再構築してください）")
+        return
 
-    # 後方互換: data/index/embeddings.npy にも保存
-    emb_path = INDEX_DIR / "embeddings.npy"
-    np.save(str(emb_path), embedding_matrix)
+    todo = [i for i, c in enumerate(chunks) if c["chunk_id"] in stale_ids or c["chunk_id"] not in old_row]
+    matrix = np.zeros((len(chunks), old_vectors.shape[1]), dtype=np.float32)
+    for i, c in enumerate(chunks):
+        row = old_row.get(c["chunk_id"])
+        if row is not None:
+            matrix[i] = old_vectors[row]
 
-    print(f"Embeddings saved: {vectors_path}")
-    print(f"  Shape: {embedding_matrix.shape}")
+    if todo:
+        _load_model()
+        print(f"  埋め込み: {len(todo)} チャンクを再計算（再利用 {len(chunks) - len(todo)} 件）...")
+        new_vectors = _model.embed([chunks[i]["text"] for i in todo], batch_size=batch_size)
+        for i, vec in zip(todo, new_vectors):
+            matrix[i] = vec
+
+    _save_embeddings(matrix, [c["chunk_id"] for c in chunks], dtype=str(old_vectors.dtype),
+                     hashes=[text_hash(c["text"]) for c in chunks])
+
+
+def _reset_ann():
+    global _ann
+    _ann = None
+
+
+def _load_ann():
+    """IVFインデックスをロード（無い・埋め込みと不整合なら None）"""
+    global _ann
+    if _ann is None:
+        from src.ann_index import IVFIndex
+        ann_dir = EMBEDDINGS_DIR / "ivf"
+        _ann = False
+        if (ann_dir / "meta.json").exists():
+            try:
+                _ann = IVFIndex.load(ann_dir, _embeddings)
+            except ValueError as e:
+                print(f"Warning: {e} 全探索を使います。")
+    return _ann or None
+
+
+def build_ann_index(n_lists: int | None = None):
+    """現在の埋め込みから IVF インデックスを構築して data/embeddings/ivf/ に保存"""
+    from src.ann_index import IVFIndex
+
+    _load_embeddings()
+    print(f"IVFインデックスを構築中: {len(_embeddings)} ベクトル...")
+    index = IVFIndex.build(_embeddings, n_lists=n_lists)
+    index.save(EMBEDDINGS_DIR / "ivf")
+    _reset_ann()
+    search_cache.bump_generation()
+    print(f"IVF saved: {EMBEDDINGS_DIR / 'ivf'} (n_lists={index.n_lists})")
 
 
 def search(
@@ -146,6 +499,8 @@ def search(
     top_k: int = 5,
     doc_filter: str | None = None,
     score_threshold: float = 0.3,
+    index: str | None = None,
+    nprobe: int | None = None,
 ) -> list[dict]:
     """ベクトル検索 - 意味的に近いチャンクを返す
 
@@ -157,40 +512,158 @@ def search(
         top_k: 返す件数
         doc_filter: 文書IDフィルタ（部分一致）
         score_threshold: この値未満のコサイン類似度は結果に含めない（デフォルト0.3）
+        index: "flat"（全探索）/ "ivf"（近似）。None なら config.VECTOR_INDEX
+        nprobe: IVF で走査するリスト数。None なら config.VECTOR_NPROBE
     """
-    _load_model()
     _load_embeddings()
 
-    # クエリの埋め込みを計算
-    query_emb = np.array(list(_model.embed([query]))[0], dtype=np.float32)
+    query_emb = embed_queries([query])[0]
+    return _search_vector(
+        query_emb, top_k=top_k, doc_filter=doc_filter, score_threshold=score_threshold,
+        index=index, nprobe=nprobe,
+    )
+
+
+def search_many(
+    queries: list[str],
+    top_k: int = 5,
+    doc_filters: list[str | None] | None = None,
+    score_threshold: float = 0.3,
+) -> list[list[dict]]:
+    """複数クエリのベクトル検索（埋め込みは1回のモデル呼び出しにまとめる）"""
+    _load_embeddings()
+
+    query_embs = embed_queries(queries)
+    doc_filters = doc_filters or [None] * len(queries)
+    return [
+        _search_vector(emb, top_k=top_k, doc_filter=doc_filter, score_threshold=score_threshold)
+        for emb, doc_filter in zip(query_embs, doc_filters)
+    ]
+
+
+def embed_queries(queries: list[str]) -> np.ndarray:
+    """クエリの埋め込み行列 (len(queries), dim) を返す
+
+    キャッシュに無いクエリだけを、正規化・重複除去して1回の embed 呼び出しで計算する。
+    """
+    vectors: list[np.ndarray | None] = [_query_cache.get(MODEL_NAME, q) for q in queries]
+    missing = list(dict.fromkeys(normalize_query(q) for q, v in zip(queries, vectors) if v is None))
+    if missing:
+        with span("embed", count=len(missing)):
+            _load_model()
+            computed = {}
+            for text, vec in zip(missing, _model.embed(missing)):
+                computed[text] = np.asarray(vec, dtype=np.float32)
+                _query_cache.put(MODEL_NAME, text, computed[text])
+        vectors = [v if v is not None else computed[normalize_query(q)] for q, v in zip(queries, vectors)]
+    return np.stack(vectors).astype(np.float32, copy=False)
+
+
+def query_cache_stats() -> dict:
+    """クエリ埋め込みキャッシュのヒット数・ミス数・ヒット率・件数"""
+    return _query_cache.stats()
+
+
+def _similarities(query_vec: np.ndarray, ranges: np.ndarray | None = None) -> np.ndarray:
+    """正規化済み行列とのコサイン類似度（スレッドごとのバッファに書き込んで返す）
+
+    ranges（(R, 2) の [start, end)）を渡すとその行だけを計算し、範囲順に詰めて返す。
+    """
+    n = len(_embeddings)
+    buf = getattr(_buffers, "scores", None)
+    if buf is None or len(buf) != n:
+        buf = _buffers.scores = np.empty(n, dtype=np.float32)
+        _buffers.mask = np.empty(n, dtype=bool)
+    if ranges is None:
+        ranges = np.array([[0, n]])
+    elif len(ranges) > _MAX_RANGES:
+        # 細切れの範囲はまとめて行を集めてから内積（範囲ごとのループを避ける）
+        rows = range_indices(ranges)
+        for start in range(0, len(rows), _BLOCK_ROWS):
+            block_rows = rows[start:start + _BLOCK_ROWS]
+            np.matmul(np.asarray(_embeddings[block_rows], dtype=np.float32), query_vec,
+                      out=buf[start:start + len(block_rows)])
+        return buf[:len(rows)]
+
+    if _embeddings.dtype == np.float32:
+        pos = 0
+        for start, end in ranges:
+            np.matmul(_embeddings[start:end], query_vec, out=buf[pos:pos + end - start])
+            pos += end - start
+        return buf[:pos]
+
+    # float16: ブロックごとに float32 へ展開してから内積（確保はブロック分だけ）
+    block = getattr(_buffers, "block", None)
+    if block is None or block.shape != (_BLOCK_ROWS, _embeddings.shape[1]):
+        block = _buffers.block = np.empty((_BLOCK_ROWS, _embeddings.shape[1]), dtype=np.float32)
+    pos = 0
+    for range_start, range_end in ranges:
+        for start in range(range_start, range_end, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, range_end)
+            rows = block[:end - start]
+            np.copyto(rows, _embeddings[start:end], casting="unsafe")
+            np.matmul(rows, query_vec, out=buf[pos:pos + end - start])
+            pos += end - start
+    return buf[:pos]
+
+
+def _filter_ranges(doc_filter: str) -> np.ndarray:
+    """doc_filter に一致する行範囲（doc_id → 行範囲マップは初回に作成）"""
+    global _doc_ranges
+    if _doc_ranges is None:
+        doc_ids = _store.doc_ids
+        _doc_ranges = DocRanges(doc_ids if _rows is None else [doc_ids[r] for r in _rows.tolist()])
+    return _doc_ranges.ranges(doc_filter)
+
+
+def _search_vector(
+    query_vec: np.ndarray,
+    top_k: int = 5,
+    doc_filter: str | None = None,
+    score_threshold: float = 0.3,
+    index: str | None = None,
+    nprobe: int | None = None,
+) -> list[dict]:
+    """クエリベクトルで検索（_load_embeddings 済み前提）
+
+    doc_filter 指定時は一致する文書の行だけを計算する（コストは対象行数に比例）。
+    """
+    query_norm = (query_vec / (np.linalg.norm(query_vec) + 1e-10)).astype(np.float32)
+
+    ranges = _filter_ranges(doc_filter) if doc_filter else None
+
+    ann = _load_ann() if (index or VECTOR_INDEX) == "ivf" else None
+    if ann is not None:
+        rows = range_indices(ranges) if ranges is not None else None
+        indices, scores = ann.search(query_norm, top_k, nprobe=nprobe or VECTOR_NPROBE, rows=rows)
+        return _to_results(indices, scores, score_threshold)
+
+    similarities = _similarities(query_norm, ranges)
 
-    # コサイン類似度計算（L2正規化後の内積）
-    query_norm = query_emb / (np.linalg.norm(query_emb) + 1e-10)
-    emb_norms = _embeddings / (np.linalg.norm(_embeddings, axis=1, keepdims=True) + 1e-10)
-    similarities = (emb_norms @ query_norm).astype(np.float32)
+    # 閾値以上の行だけを候補にしてから上位N件を取得（全行の argpartition はしない）
+    above = np.greater_equal(similarities, score_threshold, out=_buffers.mask[:len(similarities)])
+    candidate_indices = np.flatnonzero(above)
+    if len(candidate_indices) > top_k:
+        part = np.argpartition(similarities[candidate_indices], -top_k)[-top_k:]
+        candidate_indices = candidate_indices[part]
+    candidate_indices = candidate_indices[np.argsort(-similarities[candidate_indices], kind="stable")][:top_k]
+    scores = similarities[candidate_indices]
+    if ranges is not None:
+        # 詰めた位置 → 元の行番号
+        candidate_indices = range_indices(ranges)[candidate_indices]
 
-    # フィルタ適用（マスクを一括処理）
-    if doc_filter:
-        mask = np.array([doc_filter not in chunk["doc_id"] for chunk in _chunks])
-        similarities[mask] = -1.0
+    return _to_results(candidate_indices, scores, score_threshold)
 
-    # 閾値以下を除外した上で上位N件取得
-    # np.argpartition で上位候補を高速取得してからソート
-    n_candidates = min(top_k * 3, len(similarities))
-    candidate_indices = np.argpartition(similarities, -n_candidates)[-n_candidates:]
-    candidate_indices = candidate_indices[np.argsort(similarities[candidate_indices])[::-1]]
 
+def _to_results(indices: np.ndarray, scores: np.ndarray, score_threshold: float) -> list[dict]:
+    """行番号とスコアを検索結果の辞書リストに変換（閾値未満で打ち切り）"""
     results = []
-    for idx in candidate_indices[:top_k]:
-        score = float(similarities[idx])
+    for idx, score in zip(indices, scores):
+        score = float(score)
         if score < score_threshold:
             break
-        chunk = _chunks[idx]
         results.append({
-            "doc_id": chunk["doc_id"],
-            "chunk_id": chunk["chunk_id"],
-            "filename": chunk["filename"],
-            "text": chunk["text"],
+            **_store[_store_row(idx)],
             "score": round(score, 4),
             "method": "vector",
         })
@@ -209,6 +682,9 @@ def is_available() -> bool:
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == "build":
-        build_embeddings()
+        workers = next((int(a.split("=", 1)[1]) for a in sys.argv if a.startswith("--workers=")), None)
+        build_embeddings(dtype="float16" if "--float16" in sys.argv else "float32", workers=workers)
+    elif len(sys.argv) > 1 and sys.argv[1] == "build-ann":
+        build_ann_index(n_lists=int(sys.argv[2]) if len(sys.argv) > 2 else None)
     else:
-        print("Usage: python -m src.vector_search build")
+        print("Usage: python -m src.vector_search build [--float16] [--workers=N] | build-ann [n_lists]")